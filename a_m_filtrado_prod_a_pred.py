@@ -1,6 +1,13 @@
-import numpy as np 
-import pandas as pd 
+import pandas as pd
 import os
+import argparse
+import hashlib
+
+from io_maestro import (archivos_particion, cargar_maestro, eliminar_particion, es_dataset_particionado,
+                        escribir_parte_particion, filtro_productos, guardar_dataframe_a_parquet,
+                        guardar_manifiesto, leer_manifiesto, resolver_ruta_existente, ruta_con_formato,
+                        vaciar_particion)
+from instrumentacion import medir_etapa
 
 def guardar_dataframe_a_csv(dataframe, nombre_archivo_csv, incluir_indice=False, codificacion='utf-8'):
     """
@@ -34,95 +41,276 @@ carpeta_datos_maestro = 'archivos_maestros/' # Carpeta para archivo_maestro.csv
 carpeta_datos_productos_txt = 'data/'       # Carpeta para productos_a_predecir.txt
 pathdata_salida = 'archivos_maestros/' # Asumiendo que quieres guardar la salida aquí
 
-nombre_archivo_maestro = 'archivo_maestro.csv'
-nombre_archivo_productos_a_predecir = 'productos_a_predecir.txt' 
-nombre_archivo_filtrado_salida = 'a_m_filtrado_prod_a_pred.csv'
+nombre_archivo_maestro = 'archivo_maestro' # Sin extensión: se usa la salida más reciente (.parquet, carpeta o .csv)
+nombre_archivo_productos_a_predecir = 'productos_a_predecir.txt'
+nombre_archivo_filtrado_salida = 'a_m_filtrado_prod_a_pred' # La extensión depende de formato_salida
+
+# Formato del archivo filtrado: 'parquet' (columnar, tipos compactos) o 'csv' (latin1, con índice)
+formato_salida = 'parquet'
+
+# Modo de filtrado:
+#   'completo'    -> carga todo el archivo maestro y escribe un archivo filtrado.
+#   'incremental' -> requiere el dataset particionado de `archivo_maestro.py --modo incremental` y
+#                    escribe un dataset particionado (carpeta sin extensión). Solo vuelve a filtrar
+#                    los periodos que cambiaron en el maestro o todos si cambia la lista de productos.
+modo_filtrado = 'completo'
 
 # Construir rutas completas
-ruta_archivo_maestro = os.path.join(carpeta_datos_maestro, nombre_archivo_maestro)
+ruta_archivo_maestro = resolver_ruta_existente(os.path.join(carpeta_datos_maestro, nombre_archivo_maestro))
 ruta_productos_a_predecir = os.path.join(carpeta_datos_productos_txt, nombre_archivo_productos_a_predecir)
-ruta_archivo_salida_completa = os.path.join(pathdata_salida, nombre_archivo_filtrado_salida)
-
-# --- Carga de Datos ---
-try:
-    print(f"Cargando archivo maestro desde: {ruta_archivo_maestro}")
-   
-    df_maestro = pd.read_csv(ruta_archivo_maestro, sep=',') 
-    print("Archivo maestro cargado exitosamente.")
+
+
+def cargar_maestro_para_filtrar(ruta_archivo_maestro, product_ids=None, periodos=None):
+    """
+    Carga el archivo maestro y asegura que 'product_id' sea entero (o string si no se puede).
+
+    Si se indican `product_ids` (enteros), solo se cargan las filas de esos productos:
+    el filtro se aplica mientras se lee (ver `io_maestro.cargar_maestro`). Lo mismo con
+    `periodos` = (desde, hasta): en un maestro particionado solo se leen esas particiones.
+    """
+    df_maestro = cargar_maestro(ruta_archivo_maestro, product_ids=product_ids, periodos=periodos)
     # Asegurar que la columna product_id sea del tipo correcto (int si es posible)
     if 'product_id' in df_maestro.columns:
         # Intentar convertir a int, si falla, mantener como está (podría ser object/string)
         try:
-            df_maestro['product_id'] = df_maestro['product_id'].astype(int)
+            if not pd.api.types.is_integer_dtype(df_maestro['product_id']):
+                df_maestro['product_id'] = df_maestro['product_id'].astype(int)
         except ValueError:
             print("Advertencia: No se pudo convertir 'product_id' en archivo_maestro a entero. Se usará como string.")
             df_maestro['product_id'] = df_maestro['product_id'].astype(str)
     else:
-        raise ValueError("La columna 'product_id' no se encuentra en archivo_maestro.csv")
-
-except FileNotFoundError:
-    print(f"Error: No se encontró el archivo maestro en '{ruta_archivo_maestro}'. Verifica la ruta y el nombre del archivo.")
-    exit() # Salir del script si el archivo principal no se encuentra
-except Exception as e:
-    print(f"Ocurrió un error al cargar '{ruta_archivo_maestro}': {e}")
-    exit()
-
-try:
-    print(f"Cargando lista de productos a predecir desde: {ruta_productos_a_predecir}")
-    # El archivo productos_a_predecir.txt tiene un encabezado 'product_id' y una lista de IDs.
-    
-    df_productos_a_predecir = pd.read_csv(ruta_productos_a_predecir) 
-    print("Lista de productos a predecir cargada exitosamente.")
-    
+        raise ValueError(f"La columna 'product_id' no se encuentra en '{ruta_archivo_maestro}'")
+    return df_maestro
+
+
+def cargar_productos_a_predecir(ruta_productos_a_predecir):
+    """
+    Carga la lista de productos a predecir (un encabezado 'product_id' y una lista de IDs).
+
+    Returns:
+        pd.DataFrame: Una columna 'product_id', entera si es posible o string si no.
+    """
+    df_productos_a_predecir = pd.read_csv(ruta_productos_a_predecir)
+
     # Asegurar que la columna product_id sea del tipo correcto y renombrar si es necesario
     if df_productos_a_predecir.columns[0] != 'product_id' and len(df_productos_a_predecir.columns) == 1:
-        print(f"Advertencia: La primera columna en '{nombre_archivo_productos_a_predecir}' no se llama 'product_id'. Se asumirá que es la columna de product_id.")
+        print(f"Advertencia: La primera columna en '{ruta_productos_a_predecir}' no se llama 'product_id'. Se asumirá que es la columna de product_id.")
         df_productos_a_predecir.columns = ['product_id']
-        
-    if 'product_id' in df_productos_a_predecir.columns:
-         # Intentar convertir a int, si falla, mantener como está
+
+    if 'product_id' not in df_productos_a_predecir.columns:
+        raise ValueError(f"La columna 'product_id' no se encuentra en '{ruta_productos_a_predecir}' o el archivo no tiene el formato esperado.")
+
+    # Intentar convertir a int, si falla, mantener como está
+    try:
+        df_productos_a_predecir['product_id'] = df_productos_a_predecir['product_id'].astype(int)
+    except ValueError:
+        print("Advertencia: No se pudo convertir 'product_id' en productos_a_predecir a entero. Se usará como string.")
+        df_productos_a_predecir['product_id'] = df_productos_a_predecir['product_id'].astype(str)
+    return df_productos_a_predecir
+
+
+def checksum_ids(ids):
+    """
+    Checksum de un conjunto de product_id (no depende del orden ni de duplicados).
+    """
+    contenido = '\n'.join(sorted(str(product_id) for product_id in ids))
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def nombre_salida_para_lista(ruta_lista):
+    """
+    Nombre (sin extensión) del archivo filtrado para una lista de productos.
+
+    La lista por defecto conserva el nombre histórico 'a_m_filtrado_prod_a_pred';
+    cualquier otra lista 'data/cohorte_b.txt' genera 'a_m_filtrado_cohorte_b'.
+    """
+    if os.path.basename(ruta_lista) == nombre_archivo_productos_a_predecir:
+        return nombre_archivo_filtrado_salida
+    return 'a_m_filtrado_' + os.path.splitext(os.path.basename(ruta_lista))[0]
+
+
+def filtrar_incremental(ruta_dataset_maestro, listas):
+    """
+    Filtra el dataset particionado del maestro y mantiene un dataset filtrado
+    particionado por cada lista de productos.
+
+    El manifiesto de cada salida guarda, por periodo, la revisión del maestro con la
+    que se filtró. Solo se vuelven a filtrar los periodos cuya revisión cambió (o
+    todos, si cambió esa lista de productos), y se borran los que ya no están en el
+    maestro. Cada partición del maestro se lee una sola vez para todas las listas,
+    con el filtro de productos aplicado al leer.
+
+    Args:
+        ruta_dataset_maestro (str): Carpeta del dataset particionado del maestro.
+        listas (dict): Carpeta del dataset de salida -> conjunto de product_id.
+
+    Returns:
+        dict: Carpeta de salida -> resumen con los periodos filtrados y eliminados.
+    """
+    import pyarrow.dataset as ds
+
+    manifiesto_maestro = leer_manifiesto(ruta_dataset_maestro)
+    manifiestos = {}
+    for ruta_salida, ids in listas.items():
+        manifiesto = leer_manifiesto(ruta_salida)
+        if manifiesto.get('checksum_productos') != checksum_ids(ids):
+            manifiesto['periodos'] = {}
+        manifiestos[ruta_salida] = manifiesto
+
+    resumen = {ruta_salida: {'filtrados': [], 'eliminados': []} for ruta_salida in listas}
+    periodos = {ruta_salida: {} for ruta_salida in listas}
+    for periodo, entrada_maestro in sorted(manifiesto_maestro['periodos'].items()):
+        pendientes = []
+        for ruta_salida in listas:
+            entrada = manifiestos[ruta_salida]['periodos'].get(periodo)
+            if entrada is not None and entrada.get('revision_maestro') == entrada_maestro.get('revision'):
+                periodos[ruta_salida][periodo] = entrada
+            else:
+                pendientes.append(ruta_salida)
+        if not pendientes:
+            continue
+
+        # El filtro se aplica al leer: las filas de otros productos no llegan a pandas.
+        ids_pendientes = set().union(*(listas[ruta_salida] for ruta_salida in pendientes))
+        dataset = ds.dataset(archivos_particion(ruta_dataset_maestro, periodo), format='parquet')
+        parte = dataset.to_table(filter=filtro_productos(ids_pendientes)).to_pandas()
+        for ruta_salida in pendientes:
+            filtrado = parte
+            if len(pendientes) > 1:
+                filtrado = parte[parte['product_id'].isin(listas[ruta_salida])]
+            vaciar_particion(ruta_salida, periodo)
+            escribir_parte_particion(filtrado, ruta_salida, periodo, 'part-00000')
+            periodos[ruta_salida][periodo] = {'filas': len(filtrado), 'revision_maestro': entrada_maestro.get('revision')}
+            resumen[ruta_salida]['filtrados'].append(int(periodo))
+
+    for ruta_salida, ids in listas.items():
+        manifiesto = manifiestos[ruta_salida]
+        eliminados = [int(periodo) for periodo in manifiesto['periodos'] if periodo not in periodos[ruta_salida]]
+        for periodo in eliminados:
+            eliminar_particion(ruta_salida, periodo)
+        filtrados = resumen[ruta_salida]['filtrados']
+        resumen[ruta_salida]['eliminados'] = eliminados
+
+        revision = manifiesto['revision'] + (1 if filtrados or eliminados else 0)
+        for periodo in filtrados:
+            periodos[ruta_salida][str(periodo)]['revision'] = revision
+        guardar_manifiesto(ruta_salida, {
+            'revision': revision,
+            'marca_agua': manifiesto_maestro['marca_agua'],
+            'checksum_productos': checksum_ids(ids),
+            'periodos': periodos[ruta_salida],
+        })
+        print(f"Dataset filtrado actualizado en '{ruta_salida}': "
+              f"{len(filtrados)} periodos filtrados, {len(eliminados)} eliminados.")
+    return resumen
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Filtra el archivo maestro por una o más listas de productos.')
+    parser.add_argument('--modo', choices=['completo', 'incremental'], default=modo_filtrado)
+    parser.add_argument('--formato', choices=['parquet', 'csv'], default=formato_salida)
+    parser.add_argument('--listas', nargs='+', default=[ruta_productos_a_predecir],
+                        help="Archivos con listas de product_id. Todas se filtran con una sola lectura del maestro.")
+    parser.add_argument('--desde', type=int, default=None, help='Primer periodo (YYYYMM) a incluir, en modo completo.')
+    parser.add_argument('--hasta', type=int, default=None, help='Último periodo (YYYYMM) a incluir, en modo completo.')
+    parser.add_argument('--maestro', default=ruta_archivo_maestro,
+                        help='Archivo maestro a filtrar, en modo completo. Por defecto, la salida más reciente de archivo_maestro.py.')
+    args = parser.parse_args()
+    ruta_archivo_maestro = args.maestro
+
+    # --- Carga de las listas de productos ---
+    listas = {}  # Ruta de salida (sin extensión) -> DataFrame con la columna 'product_id'
+    rutas_listas = {}  # Ruta de salida (sin extensión) -> archivo de la lista
+    for ruta_lista in args.listas:
         try:
-            df_productos_a_predecir['product_id'] = df_productos_a_predecir['product_id'].astype(int)
-        except ValueError:
-            print("Advertencia: No se pudo convertir 'product_id' en productos_a_predecir a entero. Se usará como string.")
-            df_productos_a_predecir['product_id'] = df_productos_a_predecir['product_id'].astype(str)
-            # Si df_maestro['product_id'] se quedó como int, necesitamos consistencia
-            if df_maestro['product_id'].dtype == np.int64:
-                 df_maestro['product_id'] = df_maestro['product_id'].astype(str)
-                 print("Se convirtió 'product_id' de archivo_maestro a string para consistencia.")
+            print(f"Cargando lista de productos desde: {ruta_lista}")
+            df_lista = cargar_productos_a_predecir(ruta_lista)
+            print("Lista de productos cargada exitosamente.")
+        except FileNotFoundError:
+            print(f"Error: No se encontró el archivo de productos a predecir en '{ruta_lista}'. Verifica la ruta y el nombre del archivo.")
+            exit()
+        except Exception as e:
+            print(f"Ocurrió un error al cargar '{ruta_lista}': {e}")
+            exit()
+        ruta_salida = os.path.join(pathdata_salida, nombre_salida_para_lista(ruta_lista))
+        if ruta_salida in listas:
+            # Dos listas con el mismo nombre de archivo (en carpetas distintas) escribirían la misma salida.
+            print(f"Error: '{ruta_lista}' y '{rutas_listas[ruta_salida]}' generan la misma salida '{ruta_salida}'. "
+                  f"Renombra una de las listas.")
+            exit()
+        listas[ruta_salida] = df_lista
+        rutas_listas[ruta_salida] = ruta_lista
 
+    # Convertir las listas de IDs de productos a sets para una búsqueda más eficiente
+    ids_por_salida = {ruta_salida: set(df_lista['product_id']) for ruta_salida, df_lista in listas.items()}
+    ids_enteros = all(pd.api.types.is_integer_dtype(df_lista['product_id']) for df_lista in listas.values())
+
+    if args.modo == 'incremental':
+        ruta_dataset_maestro = os.path.join(carpeta_datos_maestro, nombre_archivo_maestro)
+        if not es_dataset_particionado(ruta_dataset_maestro):
+            print(f"Error: No se encontró el dataset particionado en '{ruta_dataset_maestro}'. Ejecuta 'archivo_maestro.py --modo incremental'.")
+            exit()
+        if not ids_enteros:
+            print("Error: El modo incremental requiere product_id enteros en todas las listas.")
+            exit()
+        with medir_etapa('filtrado_incremental', listas=len(ids_por_salida)):
+            filtrar_incremental(ruta_dataset_maestro, ids_por_salida)
+        exit()
+
+    # --- Carga del archivo maestro ---
+    # Con IDs enteros, el filtro por la unión de todas las listas se aplica al leer (una sola lectura).
+    try:
+        print(f"Cargando archivo maestro desde: {ruta_archivo_maestro}")
+        ids_union = set().union(*ids_por_salida.values()) if ids_enteros else None
+        periodos = None if args.desde is None and args.hasta is None else (args.desde, args.hasta)
+        with medir_etapa('carga_maestro', filtro_al_leer=ids_enteros) as etapa:
+            etapa.leido(ruta_archivo_maestro)
+            df_maestro = cargar_maestro_para_filtrar(ruta_archivo_maestro, product_ids=ids_union, periodos=periodos)
+            etapa.salida(df_maestro)
+        print("Archivo maestro cargado exitosamente.")
+    except FileNotFoundError:
+        print(f"Error: No se encontró el archivo maestro en '{ruta_archivo_maestro}'. Verifica la ruta y el nombre del archivo.")
+        exit() # Salir del script si el archivo principal no se encuentra
+    except Exception as e:
+        print(f"Ocurrió un error al cargar '{ruta_archivo_maestro}': {e}")
+        exit()
+
+    # Si algún ID a predecir quedó como string, necesitamos consistencia con el maestro
+    if not ids_enteros and pd.api.types.is_integer_dtype(df_maestro['product_id']):
+        df_maestro['product_id'] = df_maestro['product_id'].astype(str)
+        ids_por_salida = {ruta_salida: {str(p) for p in ids} for ruta_salida, ids in ids_por_salida.items()}
+        print("Se convirtió 'product_id' de archivo_maestro a string para consistencia.")
+
+    if ids_enteros:
+        print(f"\nNúmero de filas leídas del archivo maestro (productos de todas las listas): {len(df_maestro)}")
     else:
-        raise ValueError(f"La columna 'product_id' no se encuentra en '{nombre_archivo_productos_a_predecir}' o el archivo no tiene el formato esperado.")
-
-except FileNotFoundError:
-    print(f"Error: No se encontró el archivo de productos a predecir en '{ruta_productos_a_predecir}'. Verifica la ruta y el nombre del archivo.")
-    exit()
-except Exception as e:
-    print(f"Ocurrió un error al cargar '{nombre_archivo_productos_a_predecir}': {e}")
-    exit()
-
-# --- Filtrado de Productos ---
-# Asegurar que ambos DataFrames tienen la columna 'product_id' y son del mismo tipo antes de filtrar
-if 'product_id' in df_maestro.columns and 'product_id' in df_productos_a_predecir.columns:
-    # Convertir la lista de IDs de productos a predecir a un set para una búsqueda más eficiente
-    ids_a_predecir = set(df_productos_a_predecir['product_id'])
-    
-    # Filtrar el DataFrame maestro
-    productos_filtrados = df_maestro[df_maestro['product_id'].isin(ids_a_predecir)]
-    
-    print(f"\nNúmero de filas en archivo maestro original: {len(df_maestro)}")
-    print(f"Número de IDs de producto únicos a predecir: {len(ids_a_predecir)}")
-    print(f"Número de filas después de filtrar por productos a predecir: {len(productos_filtrados)}")
-
-    # --- Guardar el DataFrame Filtrado ---
-    # Usando los parámetros que especificaste: incluir_indice=True, codificacion='latin1'
-    guardar_dataframe_a_csv(productos_filtrados, ruta_archivo_salida_completa, incluir_indice=True, codificacion='latin1')
-
-    # --- Mostrar Información del DataFrame Filtrado ---
-    print("\nInformación del DataFrame de productos filtrados:")
-    productos_filtrados.info()
-    print("\nPrimeras 5 filas de productos_filtrados:")
-    print(productos_filtrados.head())
-else:
-    print("Error: La columna 'product_id' no está presente en uno o ambos DataFrames después de la carga.")
+        print(f"\nNúmero de filas en archivo maestro original: {len(df_maestro)}")
+
+    for ruta_salida, ids_a_predecir in ids_por_salida.items():
+        # --- Filtrado de Productos ---
+        with medir_etapa('filtro', salida=ruta_salida) as etapa:
+            etapa.entrada(df_maestro)
+            productos_filtrados = df_maestro
+            if len(ids_por_salida) > 1 or not ids_enteros:
+                productos_filtrados = df_maestro[df_maestro['product_id'].isin(ids_a_predecir)]
+            etapa.salida(productos_filtrados)
+
+        print(f"\nNúmero de IDs de producto únicos a predecir: {len(ids_a_predecir)}")
+        print(f"Número de filas después de filtrar por productos a predecir: {len(productos_filtrados)}")
+
+        # --- Guardar el DataFrame Filtrado ---
+        # En CSV, usando los parámetros que especificaste: incluir_indice=True, codificacion='latin1'
+        ruta_archivo_salida_completa = ruta_con_formato(ruta_salida, args.formato)
+        with medir_etapa('guardado', formato=args.formato) as etapa:
+            etapa.entrada(productos_filtrados)
+            if args.formato == 'parquet':
+                guardar_dataframe_a_parquet(productos_filtrados, ruta_archivo_salida_completa)
+            else:
+                guardar_dataframe_a_csv(productos_filtrados, ruta_archivo_salida_completa, incluir_indice=True, codificacion='latin1')
+            etapa.escrito(ruta_archivo_salida_completa)
 
+        # --- Mostrar Información del DataFrame Filtrado ---
+        print("\nInformación del DataFrame de productos filtrados:")
+        productos_filtrados.info()
+        print("\nPrimeras 5 filas de productos_filtrados:")
+        print(productos_filtrados.head())
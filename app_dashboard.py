@@ -3,25 +3,43 @@ import pandas as pd
 import altair as alt
 import numpy as np 
 
+import os
+import threading
+
+from io_maestro import (cargar_maestro, es_dataset_particionado, esta_al_dia, marca_modificacion, periodos_dataset,
+                        resolver_ruta_existente)
+from cubo_agregado import NOMBRE_INDICE_CUBO, agregar_base, cargar_cubo, elegir_nivel, existe_cubo
+from datos_dashboard import (COLUMNAS_CATEGORICAS, CacheResultados, IndiceFiltros, clave_selecciones, codificar_columnas,
+                             completar_con_ceros, grafico_filtrado, normalizar_rango, resumen_filtrado)
+from panel_disperso import PanelDisperso, NOMBRE_INDICE_PANEL, existe_panel
+from tensor_tn import IndiceTensor, NOMBRE_INDICE_TENSOR, existe_tensor
+import instrumentacion
+from instrumentacion import iniciar_coleccion, medir_etapa
+
 # --- CONFIGURACIÓN DE PÁGINA (DEBE SER EL PRIMER COMANDO DE STREAMLIT) ---
 st.set_page_config(layout="wide")
 
 # --- PASO 0: CARGAR DATOS REALES ---
-@st.cache_data # Cachea la carga de datos
-def cargar_datos_reales(ruta_archivo):
+# No se cachea: solo la llama preparar_datos_agregados (cacheada), así los datos sin
+# agregar no quedan en memoria después de la primera carga.
+def cargar_datos_reales(ruta_archivo, periodos=None):
     try:
-        df = pd.read_csv(ruta_archivo, index_col=0, encoding='latin1')
+        # Parquet (tipos compactos) o CSV latin1 con índice, según la extensión.
+        # Con `periodos` = (desde, hasta), un dataset particionado solo lee esas particiones.
+        with medir_etapa('cargar_datos_reales', periodos=periodos) as etapa:
+            etapa.leido(ruta_archivo)
+            df = cargar_maestro(ruta_archivo, periodos=periodos)
+            etapa.salida(df)
         # Asegurar tipos de datos consistentes para columnas de ID y atributos
         # que se usarán en filtros categóricos.
-        cols_to_object = ['customer_id', 'product_id', 'cat1', 'cat2', 'cat3', 'brand', 'sku_size']
-        for col in cols_to_object:
+        for col in COLUMNAS_CATEGORICAS:
             if col in df.columns:
-                df[col] = df[col].astype(str) # Convertir a string para manejo categórico uniforme
+                df[col] = df[col].astype('category') # Códigos enteros + diccionario de valores
             else:
-                # Si una columna de atributo principal no existe, la creamos vacía (como string)
+                # Si una columna de atributo principal no existe, la creamos vacía (como categórica)
                 # para evitar errores posteriores, aunque esto es menos ideal que tenerla en el CSV.
                 st.warning(f"Advertencia al cargar CSV: Columna '{col}' no encontrada. Se creará como vacía.")
-                df[col] = pd.Series(dtype='object')
+                df[col] = pd.Series(dtype='category', index=df.index)
 
 
         # Verificar la columna 'periodo'
@@ -45,67 +63,147 @@ def cargar_datos_reales(ruta_archivo):
         st.error(f"Ocurrió un error al cargar '{ruta_archivo}': {e}")
         st.stop()
 
+# Cubo precalculado por cubo_agregado.py. Si no existe, se agregan los datos filtrados al iniciar.
+CARPETA_CUBO = 'archivos_maestros/cubo'
+# Panel disperso de panel_disperso.py (opcional): vistas densas, con ceros, de un producto o cliente.
+CARPETA_PANEL = 'archivos_maestros/panel'
+# Tensor de tn en disco de tensor_tn.py (opcional). Si existe, se usa en lugar del cubo: se abre
+# con np.memmap y todos los procesos de Streamlit lo comparten por la caché de páginas del sistema.
+CARPETA_TENSOR = 'archivos_maestros/tensor_tn'
+
 # Cambia 'data/df_sin.csv' por la ruta real a tu archivo si es diferente.
 # Si tu archivo se llama 'archivo_maestro.csv' y está en 'archivos_maestros/':
-df_sin = cargar_datos_reales('archivos_maestros/a_m_filtrado_prod_a_pred.csv') # <--- ¡USA TU RUTA AQUÍ!
-
-st.title('Dashboard Interactivo de Ventas (TN)')
+# Se usa la salida más reciente del filtrado ('.parquet', dataset particionado o '.csv').
+RUTA_DATOS_FILTRADOS = 'archivos_maestros/a_m_filtrado_prod_a_pred' # <--- ¡USA TU RUTA AQUÍ!
 
-# --- PASO 1: PREPARAR DATOS AGREGADOS INICIALES (cacheado para eficiencia) ---
-@st.cache_data
-def preparar_datos_agregados(df_input):
-    df_working = df_input.copy()
-
-    # Las columnas de atributos ya deberían ser string por la función de carga.
-    product_attribute_cols = ['product_id', 'cat1', 'cat2', 'cat3', 'brand', 'sku_size']
-    df_product_attributes = pd.DataFrame()
-    
-    actual_product_attribute_cols = ['product_id']
-    for col in product_attribute_cols[1:]:
-        if col in df_working.columns:
-            actual_product_attribute_cols.append(col)
-            
-    if len(actual_product_attribute_cols) > 1:
-         # Asegurarse que no haya NaNs en product_id antes de drop_duplicates
-        df_working_for_attrs = df_working[actual_product_attribute_cols].dropna(subset=['product_id'])
-        df_product_attributes = df_working_for_attrs.drop_duplicates(subset=['product_id'])
+# Memoria máxima del caché de resultados filtrados (opciones de los filtros y datos del gráfico)
+# que comparten todas las sesiones. Al pasarla se descartan los resultados usados hace más tiempo.
+MAXIMO_MB_CACHE_RESULTADOS = 256
+MAX_SERIES_GRAFICO = 20 # Las series fuera de las 20 con más TN se agrupan en 'Otros'
 
+st.title('Dashboard Interactivo de Ventas (TN)')
 
-    grouping_cols = ['periodo', 'product_id', 'customer_id']
-    # Ya verificamos que estas columnas existen en cargar_datos_reales
+# Registros de instrumentación de esta ejecución del script (para el panel de depuración).
+# Las sesiones comparten el proceso: no se reinicia su memoria máxima al medir cada etapa.
+instrumentacion.reiniciar_memoria_pico = False
+registros_ejecucion = iniciar_coleccion()
 
-    df_sum_intermediate = df_working.groupby(grouping_cols, as_index=False)['tn'].sum()
+# --- PASO 1: PREPARAR DATOS AGREGADOS INICIALES (cacheado para eficiencia) ---
+# st.cache_resource guarda una sola copia compartida por todas las sesiones (st.cache_data
+# devolvería una copia por llamada). Los DataFrames cacheados no se modifican después.
+# `version` (fecha de modificación del archivo) invalida el caché cuando se regenera.
+# Se guardan pocos rangos de periodos a la vez: cada uno es una copia agregada de los datos.
+@st.cache_resource(max_entries=4)
+def preparar_datos_agregados(ruta_archivo, version, periodos=None):
+    # Solo se mide cuando se calcula (las llamadas que usan el caché no pasan por acá).
+    with medir_etapa('preparar_datos_agregados', periodos=periodos) as etapa:
+        df_input = cargar_datos_reales(ruta_archivo, periodos)
+        etapa.entrada(df_input)
+        try:
+            df_processed = agregar_base(df_input)
+        except Exception as e:
+            st.error(f"Error al convertir la columna 'periodo' a fecha: {e}")
+            st.info("Asegúrate de que la columna 'periodo' en tu CSV esté en formato YYYYMM (ej. 201701).")
+            st.stop()
+        codificar_columnas([df_processed])
+        etapa.salida(df_processed)
+    return df_processed
 
-    if not df_product_attributes.empty:
-        df_processed = pd.merge(df_sum_intermediate, df_product_attributes, on='product_id', how='left')
-    else: # Si solo tenemos product_id como atributo
-        df_processed = df_sum_intermediate
-        # Rellenar otras columnas de atributos esperadas si no se pudieron unir
-        for col in product_attribute_cols[1:]:
-            if col not in df_processed.columns:
-                df_processed[col] = "Desconocido" # O algún valor por defecto
+# Una sola versión a la vez: al regenerar el cubo, la versión anterior se descarta.
+@st.cache_resource(max_entries=1)
+def cargar_cubo_dashboard(carpeta, version):
+    try:
+        cubo = cargar_cubo(carpeta)
+    except Exception as e:
+        st.error(f"Ocurrió un error al cargar el cubo desde '{carpeta}': {e}")
+        st.stop()
+    # Un diccionario por columna compartido por todos los niveles: el mismo código
+    # significa el mismo valor en cualquier nivel.
+    codificar_columnas(list(cubo.values()))
+    return cubo
 
+@st.cache_resource(max_entries=1)
+def abrir_tensor_dashboard(carpeta, version):
     try:
-        df_processed['periodo'] = pd.to_datetime(df_processed['periodo'].astype(str), format='%Y%m')
+        return IndiceTensor(carpeta)
     except Exception as e:
-        st.error(f"Error al convertir la columna 'periodo' a fecha: {e}")
-        st.info("Asegúrate de que la columna 'periodo' en tu CSV esté en formato YYYYMM (ej. 201701).")
+        st.error(f"Ocurrió un error al abrir el tensor desde '{carpeta}': {e}")
         st.stop()
-        
-    df_processed.dropna(subset=['periodo', 'tn'], inplace=True)
-    return df_processed
 
-df_agg_inicial = preparar_datos_agregados(df_sin)
+@st.cache_resource(max_entries=1)
+def cargar_panel_dashboard(carpeta, version):
+    return PanelDisperso.cargar(carpeta)
+
+@st.cache_resource(max_entries=2)
+def cache_resultados_dashboard(origen, version):
+    # Un caché por versión de los datos: al regenerarlos, los resultados viejos dejan de usarse.
+    return CacheResultados(MAXIMO_MB_CACHE_RESULTADOS * 1024 ** 2)
+
+@st.cache_resource(max_entries=2)
+def iniciar_precalculo(origen, version, periodos, _precalcular):
+    # Se ejecuta una vez por versión de los datos (y rango cargado): el primer usuario no espera
+    # a que termine, y los demás encuentran en el caché los estados más comunes.
+    hilo = threading.Thread(target=_precalcular, name='precalculo_dashboard', daemon=True)
+    hilo.start()
+    return hilo
+
+@st.cache_resource(max_entries=4)
+def construir_indices(_cubo, origen, version, periodos=None):
+    # Un índice invertido por nivel, construido una vez y compartido entre sesiones.
+    # `origen`, `version` (fecha de modificación) y `periodos` (rango cargado, sin cubo)
+    # son la clave del caché; el cubo no se hashea.
+    return {nombre: IndiceFiltros(df_nivel) for nombre, df_nivel in _cubo.items()}
+
+# Sin cubo y con un dataset particionado por periodo, el rango de fechas sale del
+# manifiesto y solo se cargan las particiones del rango elegido (ver PASO 2).
+# El cubo solo se usa si es posterior a los datos filtrados: si se volvió a filtrar sin
+# regenerarlo, mostraría los datos anteriores.
+ruta_datos_filtrados = resolver_ruta_existente(RUTA_DATOS_FILTRADOS)
+cubo_al_dia = existe_cubo(CARPETA_CUBO) and esta_al_dia(os.path.join(CARPETA_CUBO, NOMBRE_INDICE_CUBO),
+                                                        ruta_datos_filtrados)
+if existe_cubo(CARPETA_CUBO) and not cubo_al_dia:
+    st.sidebar.warning("El cubo es anterior a los datos filtrados y no se usa. Regeneralo con 'cubo_agregado.py'.")
+
+tensor_al_dia = existe_tensor(CARPETA_TENSOR) and esta_al_dia(os.path.join(CARPETA_TENSOR, NOMBRE_INDICE_TENSOR),
+                                                              ruta_datos_filtrados)
+if existe_tensor(CARPETA_TENSOR) and not tensor_al_dia:
+    st.sidebar.warning("El tensor es anterior a los datos filtrados y no se usa. Regeneralo con 'tensor_tn.py'.")
+
+cargar_por_periodos = False
+indice_tensor = None
+if tensor_al_dia:
+    origen_datos = os.path.join(CARPETA_TENSOR, NOMBRE_INDICE_TENSOR)
+    version_datos = marca_modificacion(origen_datos)
+    indice_tensor = abrir_tensor_dashboard(CARPETA_TENSOR, version_datos)
+elif cubo_al_dia:
+    origen_datos = os.path.join(CARPETA_CUBO, NOMBRE_INDICE_CUBO)
+    version_datos = marca_modificacion(origen_datos)
+    cubo = cargar_cubo_dashboard(CARPETA_CUBO, version_datos)
+else:
+    origen_datos = ruta_datos_filtrados
+    version_datos = marca_modificacion(origen_datos)
+    cargar_por_periodos = es_dataset_particionado(origen_datos) and bool(periodos_dataset(origen_datos))
+    if not cargar_por_periodos:
+        cubo = {'base': preparar_datos_agregados(origen_datos, version_datos)}
+
+if indice_tensor is not None:
+    fechas_disponibles = pd.Series(indice_tensor.periodos)
+elif cargar_por_periodos:
+    fechas_disponibles = pd.to_datetime(pd.Series(periodos_dataset(origen_datos)).astype(str), format='%Y%m')
+else:
+    # El nivel más chico alcanza para conocer el rango de fechas.
+    df_agg_inicial = cubo[elegir_nivel(cubo, ['periodo'])]
+    fechas_disponibles = df_agg_inicial['periodo'].dropna() if 'periodo' in df_agg_inicial.columns else pd.Series(dtype='datetime64[ns]')
 
 # --- PASO 2: FILTROS EN LA BARRA LATERAL (SIDEBAR) ---
 st.sidebar.header('Filtros')
 
 # Filtro de Rango de Fechas
-df_filtrado_streamlit = df_agg_inicial.copy()
+rango_fechas = (None, None)
 
-if not df_agg_inicial.empty and 'periodo' in df_agg_inicial.columns and not df_agg_inicial['periodo'].dropna().empty:
-    min_fecha_datos = df_agg_inicial['periodo'].min().date()
-    max_fecha_datos = df_agg_inicial['periodo'].max().date()
+if not fechas_disponibles.empty:
+    min_fecha_datos = fechas_disponibles.min().date()
+    max_fecha_datos = fechas_disponibles.max().date()
     
     valor_inicial_fecha_inicio = min_fecha_datos
     valor_inicial_fecha_fin = max_fecha_datos
@@ -129,16 +227,64 @@ if not df_agg_inicial.empty and 'periodo' in df_agg_inicial.columns and not df_a
         if fecha_inicio > fecha_fin:
             st.sidebar.error('Error: La fecha de inicio no puede ser posterior a la fecha de fin.')
         else:
-            df_filtrado_streamlit = df_agg_inicial[
-                (df_agg_inicial['periodo'] >= pd.to_datetime(fecha_inicio)) &
-                (df_agg_inicial['periodo'] <= pd.to_datetime(fecha_fin))
-            ]
+            rango_fechas = (fecha_inicio, fecha_fin)
 else:
     st.sidebar.warning("No hay datos de 'periodo' para filtrar por fecha.")
 
+periodos_cargados = None
+if cargar_por_periodos:
+    desde, hasta = rango_fechas
+    periodos_cargados = (None if desde is None else int(desde.strftime('%Y%m')),
+                         None if hasta is None else int(hasta.strftime('%Y%m')))
+    cubo = {'base': preparar_datos_agregados(origen_datos, version_datos, periodos_cargados)}
+
+if indice_tensor is not None:
+    # Con el tensor hay un único índice, que responde cualquier combinación de columnas.
+    columnas_disponibles = set(indice_tensor.columnas)
+    def indice_para(columnas):
+        return indice_tensor
+else:
+    indices = construir_indices(cubo, origen_datos, version_datos, periodos_cargados)
+    columnas_disponibles = set().union(*(df_nivel.columns for df_nivel in cubo.values()))
+    def indice_para(columnas):
+        return indices[elegir_nivel(cubo, columnas)]
+
+# Los resultados de cada estado de los filtros (rango de fechas normalizado + selecciones) se
+# guardan en un caché compartido por todas las sesiones: si otro usuario ya pidió la misma
+# combinación, las opciones y el gráfico salen de ahí sin volver a filtrar.
+cache_resultados = cache_resultados_dashboard(origen_datos, version_datos)
+fechas_ordenadas = np.unique(fechas_disponibles.to_numpy())
+rango_normalizado = normalizar_rango(fechas_ordenadas, *rango_fechas)
+
+def opciones_filtro(col_name, rango, selecciones):
+    # Códigos con datos de `col_name` dado el rango y las selecciones anteriores de la cascada.
+    def calcular():
+        indice = indice_para(['periodo', col_name, *selecciones])
+        posiciones = indice.posiciones(*rango, selecciones)
+        return indice.opciones(col_name, posiciones) if len(posiciones) else []
+    return cache_resultados.obtener(('opciones', periodos_cargados, rango, col_name, clave_selecciones(selecciones)),
+                                    calcular)
+
+def resumen_para(rango, selecciones):
+    # Cantidad de filas y muestra para la tabla, siempre del nivel base (una fila por periodo,
+    # producto y cliente): no cambian con el nivel que alcanza para el gráfico.
+    def calcular():
+        indice_base = indice_para(['periodo', 'product_id', 'customer_id', *selecciones])
+        return resumen_filtrado(indice_base, *rango, selecciones)
+    return cache_resultados.obtener(('resumen', periodos_cargados, rango, clave_selecciones(selecciones)), calcular)
+
+def grafico_para(rango, selecciones, col_serie):
+    # Datos del gráfico, del nivel más chico que tiene las selecciones y la columna de las series.
+    def calcular():
+        indice = indice_para(['periodo', col_serie, *selecciones])
+        return grafico_filtrado(indice, *rango, selecciones, col_serie, MAX_SERIES_GRAFICO)
+    return cache_resultados.obtener(('grafico', periodos_cargados, rango, col_serie, clave_selecciones(selecciones)),
+                                    calcular)
+
 
 # Filtros Desplegables en Cascada
 ALL_OPTION_LABEL = "--- Todos ---"
+CODIGO_TODOS = -1 # Las opciones son códigos de categoría; -1 representa "todos"
 
 ordered_filter_cols = {
     'customer_id': 'Cliente:',
@@ -150,77 +296,164 @@ ordered_filter_cols = {
     'product_id': 'Producto ID:'
 }
 
-df_para_opciones = df_filtrado_streamlit.copy()
-
-for col_name, display_label in ordered_filter_cols.items():
-    if col_name in df_para_opciones.columns and not df_para_opciones.empty:
-        # Las columnas ya deberían ser string desde la carga o preparación.
-        # Nos aseguramos que no haya NaN antes de unique() para las opciones.
-        opciones_disponibles = sorted(df_para_opciones[col_name].dropna().unique().tolist())
-        opciones = [ALL_OPTION_LABEL] + opciones_disponibles
+def precalcular_estados_comunes():
+    # En segundo plano: todos los filtros en "Todos" y cada cat1, con el rango completo y el
+    # gráfico por producto (lo que ve cada usuario al abrir el dashboard o elegir una categoría).
+    with medir_etapa('precalculo_dashboard') as etapa:
+        rango = (None, None)
+        estados = [{}]
+        if 'cat1' in columnas_disponibles:
+            estados += [{'cat1': codigo} for codigo in opciones_filtro('cat1', rango, {})]
+        col_serie_inicial = 'product_id' if 'product_id' in columnas_disponibles else opciones_serie[0]
+        for estado in estados:
+            selecciones_estado = {}
+            for col_name in ordered_filter_cols:
+                if col_name in columnas_disponibles:
+                    opciones_filtro(col_name, rango, selecciones_estado)
+                    if col_name in estado:
+                        selecciones_estado[col_name] = estado[col_name]
+            resumen_para(rango, selecciones_estado)
+            grafico_para(rango, selecciones_estado, col_serie_inicial)
+        etapa.salida(len(estados))
+
+opciones_serie = [col for col in ordered_filter_cols if col in columnas_disponibles]
+# Cargando por periodos, los estados comunes solo sirven si se cargó el rango completo.
+if not cargar_por_periodos or rango_normalizado == (None, None):
+    iniciar_precalculo(origen_datos, version_datos, periodos_cargados, precalcular_estados_comunes)
+
+# Los selectbox guardan códigos, que cambian con los datos (otra lista, otro cubo u otro rango
+# cargado): si cambiaron, se descartan y la selección se recupera por su valor (ver abajo).
+version_codigos = (origen_datos, version_datos, periodos_cargados)
+if st.session_state.get('version_codigos_filtros') != version_codigos:
+    for col_name in ordered_filter_cols:
+        st.session_state.pop(f'select_{col_name}', None)
+    st.session_state['version_codigos_filtros'] = version_codigos
+
+# Cada filtro toma sus opciones del nivel más chico del cubo que tiene la columna
+# y las columnas ya seleccionadas (por ejemplo, 'cat1' sin cliente elegido usa el nivel 'cat1').
+# Las opciones y el subconjunto filtrado salen del índice invertido del nivel, sin recorrer filas.
+selecciones = {}
+with medir_etapa('filtros') as etapa_filtros:
+    for col_name, display_label in ordered_filter_cols.items():
+        if col_name not in columnas_disponibles:
+            st.sidebar.warning(f"Columna '{col_name}' no disponible para filtrar en los datos actuales.")
+            continue
+        indice_opciones = indice_para(['periodo', col_name, *selecciones])
+        # Códigos distintos en el orden de los valores y sin NaN, como sorted(...dropna().unique()).
+        opciones_disponibles = opciones_filtro(col_name, rango_normalizado, selecciones)
+        if opciones_disponibles:
+            opciones = [CODIGO_TODOS] + opciones_disponibles
         
-        if len(opciones) > 1:
-            # Usar st.session_state para mantener la selección si las opciones cambian pero la selección sigue válida
-            default_index = 0
-            session_key = f'select_{col_name}_value'
-            if session_key in st.session_state and st.session_state[session_key] in opciones:
-                default_index = opciones.index(st.session_state[session_key])
-
-            seleccion = st.sidebar.selectbox(display_label, 
-                                             options=opciones, 
-                                             index=default_index, # Para intentar mantener la selección
-                                             key=f'select_{col_name}')
-            st.session_state[session_key] = seleccion # Guardar la selección actual
-
-            if seleccion != ALL_OPTION_LABEL:
-                df_filtrado_streamlit = df_filtrado_streamlit[df_filtrado_streamlit[col_name] == seleccion]
-                df_para_opciones = df_para_opciones[df_para_opciones[col_name] == seleccion]
-    elif col_name not in df_para_opciones.columns:
-         st.sidebar.warning(f"Columna '{col_name}' no disponible para filtrar en los datos actuales.")
+            if len(opciones) > 1:
+                # Usar st.session_state para mantener la selección si las opciones cambian pero la selección sigue válida.
+                # Se guarda el valor (no el código), así sigue valiendo aunque cambien los datos.
+                default_index = 0
+                session_key = f'select_{col_name}_value'
+                if st.session_state.get(session_key) is not None:
+                    codigo_recordado = indice_opciones.codigo(col_name, st.session_state[session_key])
+                    if codigo_recordado in opciones:
+                        default_index = opciones.index(codigo_recordado)
+
+                # Los códigos se decodifican solo para mostrarlos.
+                seleccion = st.sidebar.selectbox(display_label, 
+                                                 options=opciones, 
+                                                 index=default_index, # Para intentar mantener la selección
+                                                 format_func=lambda codigo, col=col_name, indice=indice_opciones:
+                                                     ALL_OPTION_LABEL if codigo == CODIGO_TODOS else str(indice.etiqueta(col, codigo)),
+                                                 key=f'select_{col_name}')
+                # Guardar la selección actual (None: "Todos")
+                st.session_state[session_key] = None if seleccion == CODIGO_TODOS else indice_opciones.etiqueta(col_name, seleccion)
+
+                if seleccion != CODIGO_TODOS:
+                    selecciones[col_name] = seleccion
+
+    # Columna que define las series (colores) del gráfico.
+    col_serie = st.sidebar.selectbox('Colorear gráfico por:', options=opciones_serie,
+                                     index=opciones_serie.index('product_id') if 'product_id' in opciones_serie else 0,
+                                     format_func=lambda col: ordered_filter_cols[col].rstrip(':'),
+                                     key='col_serie')
+    # Los meses sin ventas no tienen filas: con esta opción se grafican como 0 (en líneas).
+    mostrar_ceros = st.sidebar.checkbox('Mostrar meses sin ventas (0)', value=False, key='mostrar_ceros')
+
+    # El nivel final tiene las columnas seleccionadas y la de las series del gráfico.
+    # La tabla (del nivel base) y los datos del gráfico vienen del caché compartido.
+    indice_filtrado = indice_para(['periodo', col_serie, *selecciones])
+    resumen = resumen_para(rango_normalizado, selecciones)
+    etapa_filtros.contexto['selecciones'] = sorted(selecciones)
+    etapa_filtros.salida(resumen['filas'])
 
 
 # --- PASO 3: MOSTRAR DATOS FILTRADOS Y GRÁFICO ---
-st.subheader(f'Mostrando {len(df_filtrado_streamlit)} filas de datos filtrados (máx. 20 en tabla)')
-if not df_filtrado_streamlit.empty:
-    st.dataframe(df_filtrado_streamlit.head(20))
+st.subheader(f"Mostrando {resumen['filas']} filas de datos filtrados (máx. 20 en tabla)")
+if resumen['filas']:
+    st.dataframe(resumen['muestra'])
 else:
     st.warning("No hay datos para mostrar con los filtros seleccionados.")
 
 st.subheader('Gráfico de Ventas (TN)')
 
-# ESTRATEGIA PARA DATOS GRANDES: MUESTREO ANTES DE GRAFICAR
-MAX_ROWS_FOR_CHART = 4000 # Límite de filas para pasar a Altair directamente
-df_para_grafico = df_filtrado_streamlit
-
-if len(df_filtrado_streamlit) > MAX_ROWS_FOR_CHART:
-    st.warning(f"Los datos filtrados ({len(df_filtrado_streamlit)} filas) son muchos para graficar interactivamente de forma óptima. Se mostrará una muestra aleatoria de {MAX_ROWS_FOR_CHART} filas en el gráfico.")
-    df_para_grafico = df_filtrado_streamlit.sample(n=MAX_ROWS_FOR_CHART, random_state=42)
-
-
-if not df_para_grafico.empty:
-    # Quitar alt.data_transformers.disable_max_rows() globalmente
-    # Permitir que Altair use sus transformadores por defecto si es necesario (aunque aquí ya muestreamos)
-    # alt.data_transformers.enable('default') # Opcional, ya que hemos muestreado
-
-    chart = alt.Chart(df_para_grafico).mark_bar().encode(
-        x=alt.X('periodo:T', title='Periodo', axis=alt.Axis(format='%Y-%m')),
-        y=alt.Y('sum(tn):Q', title='TN (Toneladas)'),
-        color=alt.Color('product_id:N', title='Producto ID'),
-        tooltip=[ # Tooltip simplificado para reducir tamaño
-            alt.Tooltip('periodo:T', format='%Y-%m', title='Periodo'),
-            alt.Tooltip('product_id:N', title='Producto'),
-            # alt.Tooltip('customer_id:N', title='Customer ID'), # Comentado para reducir tamaño
-            alt.Tooltip('sum(tn):Q', title='TN Total Seleccionado'),
-            # alt.Tooltip('cat1:N', title='Cat1'), # Comentado
-            # alt.Tooltip('brand:N', title='Marca') # Comentado
-        ]
-    ).properties(
-        height=450
-    ).interactive() # Añadir interactividad básica al gráfico como zoom y pan
-
-    st.altair_chart(chart, use_container_width=True)
-elif not df_filtrado_streamlit.empty and df_para_grafico.empty:
-    st.info("La muestra de datos para el gráfico resultó vacía (esto es poco común si MAX_ROWS_FOR_CHART > 0).")
-else:
-    st.info("El gráfico está vacío porque no hay datos que coincidan con los filtros seleccionados.")
-
+# ESTRATEGIA PARA DATOS GRANDES: AGREGAR EN EL SERVIDOR ANTES DE GRAFICAR
+# Se envía a Altair una fila por periodo y serie (sumas exactas), no las filas filtradas.
+# (ver `agregar_para_grafico`; el resultado está en el caché compartido y no se modifica).
+with medir_etapa('grafico', col_serie=col_serie) as etapa_grafico:
+    etapa_grafico.entrada(resumen['filas'])
+    df_para_grafico = grafico_para(rango_normalizado, selecciones, col_serie)
+    titulo_serie = ordered_filter_cols[col_serie].rstrip(':')
+    if mostrar_ceros and not df_para_grafico.empty:
+        fecha_inicio_grafico, fecha_fin_grafico = rango_fechas
+        if fecha_inicio_grafico is None:
+            fecha_inicio_grafico, fecha_fin_grafico = df_para_grafico['periodo'].min(), df_para_grafico['periodo'].max()
+        df_para_grafico = completar_con_ceros(df_para_grafico, col_serie, fecha_inicio_grafico, fecha_fin_grafico)
+
+    if not df_para_grafico.empty:
+        marca = alt.Chart(df_para_grafico).mark_line(point=True) if mostrar_ceros else alt.Chart(df_para_grafico).mark_bar()
+        chart = marca.encode(
+            x=alt.X('periodo:T', title='Periodo', axis=alt.Axis(format='%Y-%m')),
+            y=alt.Y('sum(tn):Q', title='TN (Toneladas)'),
+            color=alt.Color(f'{col_serie}:N', title=titulo_serie),
+            tooltip=[ # Tooltip simplificado para reducir tamaño
+                alt.Tooltip('periodo:T', format='%Y-%m', title='Periodo'),
+                alt.Tooltip(f'{col_serie}:N', title=titulo_serie),
+                alt.Tooltip('sum(tn):Q', title='TN Total Seleccionado'),
+            ]
+        ).properties(
+            height=450
+        ).interactive() # Añadir interactividad básica al gráfico como zoom y pan
+
+        st.altair_chart(chart, use_container_width=True)
+    else:
+        st.info("El gráfico está vacío porque no hay datos que coincidan con los filtros seleccionados.")
+    etapa_grafico.salida(df_para_grafico)
+
+# Vista densa del producto o cliente elegido, desde el panel disperso (meses sin ventas en 0).
+recorte_panel = {col: int(indice_filtrado.etiqueta(col, selecciones[col]))
+                 for col in ('product_id', 'customer_id') if col in selecciones}
+# El panel también se arma desde los datos filtrados: si es anterior, no se muestra.
+if (mostrar_ceros and recorte_panel and existe_panel(CARPETA_PANEL)
+        and esta_al_dia(os.path.join(CARPETA_PANEL, NOMBRE_INDICE_PANEL), ruta_datos_filtrados)):
+    panel = cargar_panel_dashboard(CARPETA_PANEL, marca_modificacion(os.path.join(CARPETA_PANEL, NOMBRE_INDICE_PANEL)))
+    desde, hasta = (None, None) if rango_fechas[0] is None else (int(fecha.strftime('%Y%m')) for fecha in rango_fechas)
+    vista_densa = panel.vista(**recorte_panel, desde=desde, hasta=hasta)
+    st.subheader('TN por mes del recorte elegido, desde el panel disperso (meses sin ventas en 0)')
+    if not vista_densa.empty:
+        # Una línea por cliente (o producto) del recorte, con las de más TN primero.
+        col_vista = vista_densa.index.name
+        principales = vista_densa.loc[vista_densa.sum(axis=1).sort_values(ascending=False).index[:MAX_SERIES_GRAFICO]]
+        df_vista = principales.rename(columns=lambda periodo: pd.Timestamp(f'{periodo}01')).stack().rename('tn').reset_index()
+        df_vista[col_vista] = df_vista[col_vista].astype(str)
+        st.altair_chart(alt.Chart(df_vista).mark_line(point=True).encode(
+            x=alt.X('periodo:T', title='Periodo', axis=alt.Axis(format='%Y-%m')),
+            y=alt.Y('tn:Q', title='TN (Toneladas)'),
+            color=alt.Color(f'{col_vista}:N', title=ordered_filter_cols[col_vista].rstrip(':')),
+        ).properties(height=300), use_container_width=True)
+    st.dataframe(vista_densa.head(50))
+
+# --- PANEL DE DEPURACIÓN ---
+# Tiempo, memoria y filas de cada etapa de esta ejecución (ver instrumentacion.py).
+if st.sidebar.checkbox('Mostrar instrumentación', value=False, key='mostrar_instrumentacion'):
+    with st.expander('Instrumentación de esta ejecución', expanded=True):
+        if registros_ejecucion:
+            st.dataframe(pd.DataFrame(registros_ejecucion).drop(columns=['momento', 'pid']))
+        else:
+            st.write("No se registraron etapas.")
+        st.write('Caché de resultados compartido:', cache_resultados.estadisticas())
@@ -1,27 +1,459 @@
 #Import de librerias basicas tablas y matrices
-import numpy as np 
-import pandas as pd 
+import numpy as np
+import pandas as pd
 import os
+import io
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from io_maestro import (EscritorPorLotes, archivos_particion, checksums_por_periodo, compactar_tipos,
+                        eliminar_particion, escribir_parte_particion, guardar_dataframe_a_parquet,
+                        guardar_manifiesto, leer_manifiesto, ruta_con_formato, tipos_lectura_csv,
+                        vaciar_particion)
+from instrumentacion import medir_etapa
 
 pathdata='data/'
 filename1 = 'sell-in.txt'
 filename2 = 'tb_productos.txt'
 
+# Formato del archivo maestro: 'parquet' (columnar, tipos compactos) o 'csv' (latin1, con índice)
+formato_salida = 'parquet'
+
+# Modo de construcción:
+#   'completo'  -> lee todo sell-in en memoria y hace un pd.merge con los productos.
+#   'por_lotes' -> lee sell-in de a `tamano_lote` filas y agrega cada lote al archivo de salida.
+#                  La memoria máxima depende del tamaño del lote, no del largo de la historia.
+#   'incremental' -> mantiene un dataset particionado por periodo (archivos_maestros/archivo_maestro/)
+#                  con un manifiesto, y solo escribe los periodos nuevos o modificados. Si cambia
+#                  tb_productos.txt, reescribe enteros (hechos incluidos) solo los archivos de partición
+#                  que tienen algún producto afectado.
+#   'particionado' -> reconstruye todo el dataset particionado por periodo en paralelo, con un pool
+#                  de `procesos` procesos (por defecto, uno por núcleo).
+modo_construccion = 'completo'
+tamano_lote = 1_000_000
+procesos = None
+
+ruta_salida_sin_extension = 'archivos_maestros/archivo_maestro'
+
+# Copia de los productos con los que se escribió el dataset incremental (para detectar cambios).
+nombre_productos_incremental = '_productos.parquet'
+
+
+def cargar_productos_unicos(ruta_productos):
+    """
+    Carga tb_productos.txt y deja una sola fila por product_id.
+
+    Args:
+        ruta_productos (str): Ruta al archivo de productos (separado por tabs).
+
+    Returns:
+        pd.DataFrame: Productos sin duplicados, con tipos compactos.
+    """
+    with medir_etapa('carga_productos') as etapa:
+        etapa.leido(ruta_productos)
+        productos = pd.read_csv(ruta_productos, sep="\t")
+        etapa.salida(productos)
+
+    #Eliminamos productos duplicados ???
+    with medir_etapa('dedup_productos') as etapa:
+        etapa.entrada(productos)
+        duplicados = productos[productos.duplicated('product_id', keep=False)]
+        print(duplicados.sort_values('product_id'))
+
+        productos_unicos = compactar_tipos(productos.drop_duplicates('product_id').reset_index(drop=True))
+        etapa.salida(productos_unicos)
+    return productos_unicos
+
+
+def construir_maestro_completo(ruta_sell, productos_unicos):
+    """
+    Construye el archivo maestro en memoria: todo sell-in unido a los atributos de producto.
+
+    Returns:
+        pd.DataFrame: El archivo maestro.
+    """
+    with medir_etapa('carga_sell_in') as etapa:
+        etapa.leido(ruta_sell)
+        sell = pd.read_csv(ruta_sell, sep="\t", dtype=tipos_lectura_csv())
+        etapa.salida(sell)
+    with medir_etapa('merge') as etapa:
+        etapa.entrada(sell)
+        maestro = pd.merge(sell, productos_unicos, on='product_id', how='left')
+        etapa.salida(maestro)
+    return maestro
+
+
+def enriquecer_lote(lote, indice_productos, atributos):
+    """
+    Agrega los atributos de producto a un lote de sell-in sin hacer un merge.
+
+    Cada product_id se busca en `indice_productos` para obtener su posición y los
+    atributos se toman por posición. Los productos que no están en la tabla quedan
+    con valores faltantes, igual que en el merge 'left'.
+
+    Args:
+        lote (pd.DataFrame): Lote de sell-in (se modifica en el lugar).
+        indice_productos (pd.Index): product_id de la tabla de productos únicos.
+        atributos (dict): Columna de atributo -> pd.Series alineada con `indice_productos`.
+
+    Returns:
+        pd.DataFrame: El lote con las columnas de atributos agregadas.
+    """
+    posiciones = indice_productos.get_indexer(lote['product_id'])
+    faltantes = posiciones == -1
+    for col, serie in atributos.items():
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            codigos = serie.cat.codes.to_numpy()[posiciones]
+            codigos[faltantes] = -1
+            lote[col] = pd.Categorical.from_codes(codigos, dtype=serie.dtype)
+        else:
+            valores = serie.to_numpy()[posiciones]
+            if faltantes.any():
+                valores = valores.astype('float32')
+                valores[faltantes] = np.nan
+            lote[col] = valores
+    return lote
+
+
+def construir_maestro_por_lotes(ruta_sell, productos_unicos, ruta_salida, formato, tamano_lote):
+    """
+    Construye el archivo maestro leyendo sell-in por lotes y escribiendo cada lote enriquecido.
+
+    Args:
+        ruta_sell (str): Ruta a sell-in.txt.
+        productos_unicos (pd.DataFrame): Productos sin duplicados (ver `cargar_productos_unicos`).
+        ruta_salida (str): Ruta del archivo maestro a crear.
+        formato (str): 'parquet' o 'csv'.
+        tamano_lote (int): Cantidad de filas de sell-in por lote.
+
+    Returns:
+        int: Cantidad de filas escritas.
+    """
+    indice_productos = pd.Index(productos_unicos['product_id'])
+    atributos = {col: productos_unicos[col] for col in productos_unicos.columns if col != 'product_id'}
+
+    with medir_etapa('construccion_por_lotes', formato=formato, tamano_lote=tamano_lote) as etapa:
+        etapa.leido(ruta_sell)
+        lector = pd.read_csv(ruta_sell, sep="\t", dtype=tipos_lectura_csv(), chunksize=tamano_lote)
+        with EscritorPorLotes(ruta_salida, formato) as escritor:
+            for numero_lote, lote in enumerate(lector, start=1):
+                etapa.entrada(lote)
+                escritor.escribir(enriquecer_lote(lote, indice_productos, atributos))
+                print(f"Lote {numero_lote}: {escritor.filas_escritas} filas escritas en '{ruta_salida}'")
+        etapa.salida(escritor.filas_escritas)
+        etapa.escrito(ruta_salida)
+    print(f"Archivo maestro construido por lotes: {escritor.filas_escritas} filas.")
+    return escritor.filas_escritas
+
+
+def atributos_cambiados(productos_anteriores, productos_unicos):
+    """
+    Compara dos versiones de los productos únicos, columna por columna.
+
+    Args:
+        productos_anteriores (pd.DataFrame): Productos con los que se escribió el dataset.
+        productos_unicos (pd.DataFrame): Productos actuales.
+
+    Returns:
+        tuple: (cambios, eliminadas), donde `cambios` es un dict columna -> np.ndarray
+               con los product_id cuyo valor cambió (incluye columnas nuevas) y
+               `eliminadas` es la lista de columnas que ya no existen.
+    """
+    anteriores = productos_anteriores.set_index('product_id')
+    actuales = productos_unicos.set_index('product_id')
+    ids = anteriores.index.union(actuales.index)
+    anteriores = anteriores.reindex(ids)
+    actuales = actuales.reindex(ids)
+
+    cambios = {}
+    for col in actuales.columns:
+        if col not in anteriores.columns:
+            cambios[col] = ids.to_numpy()
+            continue
+        valor_anterior = anteriores[col].astype(object)
+        valor_actual = actuales[col].astype(object)
+        iguales = (valor_anterior == valor_actual) | (valor_anterior.isna() & valor_actual.isna())
+        if not iguales.all():
+            cambios[col] = ids[~iguales.to_numpy()].to_numpy()
+    eliminadas = [col for col in anteriores.columns if col not in actuales.columns]
+    return cambios, eliminadas
+
+
+def actualizar_atributos_particion(ruta_dataset, periodo, cambios, eliminadas, indice_productos, atributos):
+    """
+    Actualiza las columnas de atributos cambiadas en los archivos de una partición.
+
+    Los atributos están guardados junto a los hechos, así que cada archivo con alguno
+    de los productos afectados se lee y se reescribe entero (todas sus columnas). Los
+    demás no se tocan: para decidirlo se lee únicamente la columna product_id. Un
+    cambio en un producto que vende en casi todos los periodos reescribe casi todo el
+    dataset. Si se eliminan columnas de atributos, se reescriben todos los archivos.
+
+    Returns:
+        bool: True si se reescribió algún archivo de la partición.
+    """
+    import pyarrow.parquet as pq
+
+    ids_afectados = np.unique(np.concatenate(list(cambios.values()))) if cambios else np.array([])
+    atributos_a_reescribir = {col: atributos[col] for col in cambios}
+    reescrita = False
+    for ruta in archivos_particion(ruta_dataset, periodo):
+        if not eliminadas:
+            ids_archivo = pq.read_table(ruta, columns=['product_id']).column('product_id').to_numpy()
+            if not np.isin(ids_archivo, ids_afectados).any():
+                continue
+        parte = pd.read_parquet(ruta, engine='pyarrow').drop(columns=eliminadas, errors='ignore')
+        parte = enriquecer_lote(parte, indice_productos, atributos_a_reescribir)
+        nombre_parte = os.path.splitext(os.path.basename(ruta))[0]
+        escribir_parte_particion(parte, ruta_dataset, periodo, nombre_parte)
+        reescrita = True
+    return reescrita
+
 
-filepath = os.path.join(pathdata, filename1)
-sell = pd.read_csv(filepath, sep="\t")
+def guardar_estado_dataset(ruta_dataset, manifiesto, checksums, actualizados, eliminados, productos_unicos):
+    """
+    Guarda el manifiesto y la copia de los productos de un dataset particionado.
+
+    Args:
+        ruta_dataset (str): Carpeta del dataset particionado.
+        manifiesto (dict): Manifiesto anterior (ver `leer_manifiesto`).
+        checksums (dict): periodo -> (filas, checksum) de todos los periodos de sell-in.
+        actualizados (set): Periodos escritos o reescritos en esta corrida (reciben la revisión nueva).
+        eliminados (list): Periodos borrados en esta corrida.
+        productos_unicos (pd.DataFrame): Productos con los que quedó escrito el dataset.
+    """
+    revision = manifiesto['revision']
+    if actualizados or eliminados:
+        revision += 1
+    periodos = {}
+    for periodo, (filas, checksum) in sorted(checksums.items()):
+        entrada = dict(manifiesto['periodos'].get(str(periodo), {}))
+        entrada.update({'filas': filas, 'checksum': checksum})
+        if periodo in actualizados:
+            entrada['revision'] = revision
+        periodos[str(periodo)] = entrada
+
+    os.makedirs(ruta_dataset, exist_ok=True)
+    productos_unicos.to_parquet(os.path.join(ruta_dataset, nombre_productos_incremental), engine='pyarrow', index=False)
+    guardar_manifiesto(ruta_dataset, {
+        'revision': revision,
+        'marca_agua': max(checksums) if checksums else None,
+        'periodos': periodos,
+    })
+
+
+def construir_maestro_incremental(ruta_sell, productos_unicos, ruta_dataset, tamano_lote):
+    """
+    Actualiza el dataset particionado del archivo maestro procesando solo lo que cambió.
+
+    El manifiesto del dataset guarda la marca de agua (último periodo materializado)
+    y, por periodo, la cantidad de filas y un checksum de sus filas en sell-in.
+    Se lee sell-in por lotes una vez: los periodos posteriores a la marca de agua se
+    escriben en esa misma pasada y los anteriores solo se verifican. Solo si algún
+    periodo anterior cambió se hace una segunda pasada para reescribirlo.
+
+    Args:
+        ruta_sell (str): Ruta a sell-in.txt.
+        productos_unicos (pd.DataFrame): Productos sin duplicados (ver `cargar_productos_unicos`).
+        ruta_dataset (str): Carpeta del dataset particionado.
+        tamano_lote (int): Cantidad de filas de sell-in por lote.
+
+    Returns:
+        dict: Resumen con los periodos escritos, reescritos por atributos y eliminados.
+    """
+    manifiesto = leer_manifiesto(ruta_dataset)
+    marca_agua = manifiesto['marca_agua']
+    periodos_anteriores = manifiesto['periodos']
+
+    indice_productos = pd.Index(productos_unicos['product_id'])
+    atributos = {col: productos_unicos[col] for col in productos_unicos.columns if col != 'product_id'}
+
+    def escribir_periodos(lote, periodos, numero_lote, escritos):
+        for periodo, grupo in lote[lote['periodo'].isin(periodos)].groupby('periodo', sort=False):
+            periodo = int(periodo)
+            if periodo not in escritos:
+                vaciar_particion(ruta_dataset, periodo)
+                escritos.add(periodo)
+            grupo = enriquecer_lote(grupo.copy(), indice_productos, atributos)
+            escribir_parte_particion(grupo, ruta_dataset, periodo, f'part-{numero_lote:05d}')
+
+    # Primera pasada: checksums de todos los periodos y escritura de los posteriores a la marca de agua.
+    acumulado = {}
+    escritos = set()
+    lector = pd.read_csv(ruta_sell, sep="\t", dtype=tipos_lectura_csv(), chunksize=tamano_lote)
+    for numero_lote, lote in enumerate(lector):
+        for periodo, (filas, suma) in checksums_por_periodo(lote).items():
+            filas_previas, suma_previa = acumulado.get(periodo, (0, np.uint64(0)))
+            with np.errstate(over='ignore'):
+                acumulado[periodo] = (filas_previas + filas, suma_previa + suma)
+        periodos_lote = lote['periodo'].unique()
+        nuevos = periodos_lote if marca_agua is None else periodos_lote[periodos_lote > marca_agua]
+        if len(nuevos):
+            escribir_periodos(lote, nuevos, numero_lote, escritos)
+
+    checksums = {periodo: (filas, f'{int(suma):016x}') for periodo, (filas, suma) in acumulado.items()}
+    modificados = sorted(
+        periodo for periodo, (filas, checksum) in checksums.items()
+        if periodo not in escritos and periodos_anteriores.get(str(periodo), {}).get('checksum') != checksum
+    )
+
+    # Segunda pasada, solo si cambió algún periodo ya materializado.
+    if modificados:
+        print(f"Periodos anteriores a la marca de agua con cambios: {modificados}")
+        escritos_segunda_pasada = set()
+        lector = pd.read_csv(ruta_sell, sep="\t", dtype=tipos_lectura_csv(), chunksize=tamano_lote)
+        for numero_lote, lote in enumerate(lector):
+            escribir_periodos(lote, modificados, numero_lote, escritos_segunda_pasada)
+        escritos |= escritos_segunda_pasada
+
+    eliminados = sorted(int(periodo) for periodo in periodos_anteriores if int(periodo) not in checksums)
+    for periodo in eliminados:
+        eliminar_particion(ruta_dataset, periodo)
+
+    # Cambios en tb_productos: solo se reescriben (enteros) los archivos con productos afectados.
+    ruta_productos_dataset = os.path.join(ruta_dataset, nombre_productos_incremental)
+    reescritos_atributos = []
+    if os.path.exists(ruta_productos_dataset):
+        productos_anteriores = pd.read_parquet(ruta_productos_dataset, engine='pyarrow')
+        cambios, eliminadas = atributos_cambiados(productos_anteriores, productos_unicos)
+        if cambios or eliminadas:
+            print(f"Columnas de atributos con cambios: {sorted(cambios) + eliminadas}")
+            for periodo in sorted(set(checksums) - escritos):
+                if actualizar_atributos_particion(ruta_dataset, periodo, cambios, eliminadas,
+                                                  indice_productos, atributos):
+                    reescritos_atributos.append(periodo)
+
+    guardar_estado_dataset(ruta_dataset, manifiesto, checksums, escritos | set(reescritos_atributos),
+                           eliminados, productos_unicos)
+
+    resumen = {'escritos': sorted(escritos), 'reescritos_atributos': reescritos_atributos, 'eliminados': eliminados}
+    print(f"Dataset incremental actualizado en '{ruta_dataset}': "
+          f"{len(resumen['escritos'])} periodos escritos, "
+          f"{len(reescritos_atributos)} reescritos por atributos, {len(eliminados)} eliminados.")
+    return resumen
+
+
+# --- Construcción particionada en paralelo ---
+# Cada proceso del pool recibe los productos una sola vez (en el inicializador).
+_productos_proceso = {}
+
+
+def _inicializar_proceso(productos_unicos):
+    _productos_proceso['indice'] = pd.Index(productos_unicos['product_id'])
+    _productos_proceso['atributos'] = {col: productos_unicos[col] for col in productos_unicos.columns
+                                       if col != 'product_id'}
+
+
+def rangos_de_bytes(ruta_sell, cantidad):
+    """
+    Divide sell-in.txt en `cantidad` rangos de bytes que empiezan y terminan en un salto de línea.
+
+    Returns:
+        tuple: (encabezado (bytes), lista de (inicio, fin)).
+    """
+    tamano = os.path.getsize(ruta_sell)
+    with open(ruta_sell, 'rb') as archivo:
+        encabezado = archivo.readline()
+        cortes = [len(encabezado)]
+        for i in range(1, cantidad):
+            archivo.seek(max(cortes[-1], tamano * i // cantidad))
+            archivo.readline() # Avanzar hasta el final de la línea actual
+            cortes.append(min(archivo.tell(), tamano))
+        cortes.append(tamano)
+    rangos = [(inicio, fin) for inicio, fin in zip(cortes[:-1], cortes[1:]) if fin > inicio]
+    return encabezado, rangos
+
+
+def _particionar_rango(ruta_sell, encabezado, inicio, fin, ruta_temporal, numero_rango):
+    """
+    Tarea del pool: parsea un rango de bytes de sell-in y lo separa por periodo en archivos temporales.
+
+    Returns:
+        dict: periodo -> (filas, suma_hashes), como `checksums_por_periodo`.
+    """
+    with open(ruta_sell, 'rb') as archivo:
+        archivo.seek(inicio)
+        datos = archivo.read(fin - inicio)
+    lote = pd.read_csv(io.BytesIO(encabezado + datos), sep="\t", dtype=tipos_lectura_csv())
+    for periodo, grupo in lote.groupby('periodo', sort=False):
+        escribir_parte_particion(grupo, ruta_temporal, int(periodo), f'part-{numero_rango:05d}')
+    return checksums_por_periodo(lote)
+
+
+def _escribir_periodo(ruta_temporal, ruta_dataset, periodo):
+    """
+    Tarea del pool: junta las partes temporales de un periodo, agrega los atributos
+    de producto y escribe la partición final (ordenada por product_id, para que el
+    filtro por producto pueda saltear bloques usando las estadísticas de Parquet).
+
+    Returns:
+        int: Cantidad de filas escritas.
+    """
+    partes = [pd.read_parquet(ruta, engine='pyarrow') for ruta in archivos_particion(ruta_temporal, periodo)]
+    datos = pd.concat(partes, ignore_index=True).sort_values('product_id', kind='stable', ignore_index=True)
+    datos = enriquecer_lote(datos, _productos_proceso['indice'], _productos_proceso['atributos'])
+    vaciar_particion(ruta_dataset, periodo)
+    escribir_parte_particion(datos, ruta_dataset, periodo, 'part-00000')
+    eliminar_particion(ruta_temporal, periodo)
+    return len(datos)
+
+
+def construir_maestro_particionado(ruta_sell, productos_unicos, ruta_dataset, procesos=None,
+                                   tamano_rango_bytes=256 * 1024 * 1024):
+    """
+    Construye el dataset particionado por periodo (periodo=YYYYMM/) usando un pool de procesos.
+
+    Primero cada proceso parsea un rango de bytes de sell-in y lo separa por periodo en
+    archivos temporales; después cada proceso junta, enriquece y escribe periodos enteros.
+    Deja el mismo manifiesto que el modo incremental, así las corridas incrementales
+    siguientes parten de este dataset.
+
+    Args:
+        ruta_sell (str): Ruta a sell-in.txt.
+        productos_unicos (pd.DataFrame): Productos sin duplicados (ver `cargar_productos_unicos`).
+        ruta_dataset (str): Carpeta del dataset particionado.
+        procesos (int, optional): Procesos del pool. Por defecto, la cantidad de núcleos.
+        tamano_rango_bytes (int, optional): Tamaño máximo aproximado de cada rango de sell-in.
+
+    Returns:
+        dict: periodo -> filas escritas.
+    """
+    procesos = procesos or os.cpu_count() or 1
+    cantidad_rangos = max(procesos, -(-os.path.getsize(ruta_sell) // tamano_rango_bytes))
+    encabezado, rangos = rangos_de_bytes(ruta_sell, cantidad_rangos)
+    ruta_temporal = os.path.join(ruta_dataset, '_temporal')
+    if os.path.exists(ruta_temporal):
+        shutil.rmtree(ruta_temporal)
 
+    manifiesto = leer_manifiesto(ruta_dataset)
+    acumulado = {}
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_inicializar_proceso,
+                             initargs=(productos_unicos,)) as pool:
+        tareas = [pool.submit(_particionar_rango, ruta_sell, encabezado, inicio, fin, ruta_temporal, numero)
+                  for numero, (inicio, fin) in enumerate(rangos)]
+        for tarea in tareas:
+            for periodo, (filas, suma) in tarea.result().items():
+                filas_previas, suma_previa = acumulado.get(periodo, (0, np.uint64(0)))
+                with np.errstate(over='ignore'):
+                    acumulado[periodo] = (filas_previas + filas, suma_previa + suma)
+        print(f"sell-in separado por periodo: {len(rangos)} rangos, {len(acumulado)} periodos.")
 
-filepath = os.path.join(pathdata, filename2)
-productos = pd.read_csv(filepath,sep="\t")
+        tareas = {periodo: pool.submit(_escribir_periodo, ruta_temporal, ruta_dataset, periodo)
+                  for periodo in sorted(acumulado)}
+        filas_por_periodo = {periodo: tarea.result() for periodo, tarea in tareas.items()}
+    shutil.rmtree(ruta_temporal, ignore_errors=True)
 
-#Eliminamos productos duplicados ???
-duplicados = productos[productos.duplicated('product_id', keep=False)]
-print(duplicados.sort_values('product_id'))
+    eliminados = sorted(int(periodo) for periodo in manifiesto['periodos'] if int(periodo) not in acumulado)
+    for periodo in eliminados:
+        eliminar_particion(ruta_dataset, periodo)
 
-productos_unicos = productos.drop_duplicates('product_id')
+    checksums = {periodo: (filas, f'{int(suma):016x}') for periodo, (filas, suma) in acumulado.items()}
+    guardar_estado_dataset(ruta_dataset, manifiesto, checksums, set(checksums), eliminados, productos_unicos)
+    print(f"Dataset particionado construido en '{ruta_dataset}' con {procesos} procesos: "
+          f"{len(filas_por_periodo)} periodos, {sum(filas_por_periodo.values())} filas.")
+    return filas_por_periodo
 
-df=pd.merge(sell,productos_unicos,on='product_id',how='left')
 
 def guardar_dataframe_a_csv(dataframe, nombre_archivo_csv, incluir_indice=False, codificacion='utf-8'):
     """
@@ -41,22 +473,43 @@ def guardar_dataframe_a_csv(dataframe, nombre_archivo_csv, incluir_indice=False,
         print(f"DataFrame guardado exitosamente como '{nombre_archivo_csv}'")
     except Exception as e:
         print(f"Ocurrió un error al guardar el DataFrame como CSV: {e}")
-        
 
-# Para este ejemplo, crearé un df_sin de muestra (REEMPLAZA ESTO CON TU df_sin REAL):
 
-# Nombre que quieres para tu archivo CSV
-nombre_del_archivo = 'archivo_maestro.csv'
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Construye el archivo maestro a partir de sell-in y tb_productos.')
+    parser.add_argument('--modo', choices=['completo', 'por_lotes', 'incremental', 'particionado'], default=modo_construccion)
+    parser.add_argument('--tamano-lote', type=int, default=tamano_lote)
+    parser.add_argument('--procesos', type=int, default=procesos)
+    parser.add_argument('--formato', choices=['parquet', 'csv'], default=formato_salida)
+    args = parser.parse_args()
 
-# Llamar a la función para guardar tu df_sin (usa tu df_sin real aquí)
-# Si tu DataFrame se llama df_sin:
-# guardar_dataframe_a_csv(df_sin, nombre_del_archivo)
+    ruta_sell = os.path.join(pathdata, filename1)
+    productos_unicos = cargar_productos_unicos(os.path.join(pathdata, filename2))
 
-# Para el ejemplo, usaré df_sin_ejemplo:
-# guardar_dataframe_a_csv(df_sin, 'df_sin.csv')
+    # Si quieres guardarlo en una carpeta específica, cambia ruta_salida_sin_extension.
+    ruta_salida = ruta_con_formato(ruta_salida_sin_extension, args.formato)
 
-# Si quieres guardarlo en una carpeta específica y con otra codificación:
-# nombre_con_ruta = 'mi_carpeta/otro_nombre.csv'
-guardar_dataframe_a_csv(df, 'archivos_maestros/archivo_maestro.csv', incluir_indice=True, codificacion='latin1')
+    # El dataset particionado es una carpeta con el mismo nombre, sin extensión (siempre Parquet).
+    if args.modo == 'incremental':
+        with medir_etapa('construccion_incremental') as etapa:
+            etapa.leido(ruta_sell)
+            construir_maestro_incremental(ruta_sell, productos_unicos, ruta_salida_sin_extension, args.tamano_lote)
+    elif args.modo == 'particionado':
+        with medir_etapa('construccion_particionada', procesos=args.procesos) as etapa:
+            etapa.leido(ruta_sell)
+            etapa.salida(sum(construir_maestro_particionado(ruta_sell, productos_unicos, ruta_salida_sin_extension,
+                                                            args.procesos).values()))
+            etapa.escrito(ruta_salida_sin_extension)
+    elif args.modo == 'por_lotes':
+        construir_maestro_por_lotes(ruta_sell, productos_unicos, ruta_salida, args.formato, args.tamano_lote)
+    else:
+        df = construir_maestro_completo(ruta_sell, productos_unicos)
+        with medir_etapa('guardado', formato=args.formato) as etapa:
+            etapa.entrada(df)
+            if args.formato == 'parquet':
+                guardar_dataframe_a_parquet(df, ruta_salida)
+            else:
+                guardar_dataframe_a_csv(df, ruta_salida, incluir_indice=True, codificacion='latin1')
+            etapa.escrito(ruta_salida)
 
-df.info ()
\ No newline at end of file
+        df.info ()
@@ -0,0 +1,307 @@
+import numpy as np
+import pandas as pd
+import os
+import sys
+import json
+import time
+import runpy
+import platform
+import argparse
+import threading
+import subprocess
+
+from generar_datos_sinteticos import cantidad_periodos, cantidad_productos, clientes_necesarios, generar_datos
+
+# Mide tiempo y memoria máxima de cada etapa del pipeline con datos sintéticos y guarda
+# los resultados en JSON, para compararlos entre versiones y detectar regresiones:
+#   python benchmark_pipeline.py --filas 1000000
+#   python benchmark_pipeline.py --filas 1000000 --comparar benchmark_trabajo/resultados_anteriores.json
+# Cada etapa corre en un proceso nuevo, así la memoria máxima de una no se mezcla con la de otra.
+# Además de la del proceso de la etapa, se mide la del árbol de procesos (la etapa y sus workers):
+# la suma de la memoria residente de todos, muestreada mientras corre (solo en Linux).
+
+# --- Configuración ---
+carpeta_trabajo = 'benchmark_trabajo'
+filas = 1_000_000
+tolerancia = 0.2 # Una etapa es una regresión si tarda o usa un 20% más que en la comparación
+intervalo_muestreo = 0.05 # Segundos entre mediciones de la memoria del árbol de procesos
+
+CARPETA_REPO = os.path.dirname(os.path.abspath(__file__))
+
+# Etapas en orden de ejecución: nombre -> (script, argumentos) o función de este módulo.
+# 'maestro_completo' corre última entre las del maestro, así el filtrado lee su salida
+# (el archivo más reciente, ver `io_maestro.resolver_ruta_existente`).
+ETAPAS = {
+    'maestro_particionado': ('archivo_maestro.py', ['--modo', 'particionado']),
+    'maestro_por_lotes': ('archivo_maestro.py', ['--modo', 'por_lotes']),
+    'maestro_completo': ('archivo_maestro.py', ['--modo', 'completo']),
+    'filtrado': ('a_m_filtrado_prod_a_pred.py', ['--modo', 'completo']),
+    'cubo': ('cubo_agregado.py', []),
+    'features': ('features_pronostico.py', []),
+    'dashboard': 'medir_dashboard',
+}
+
+# Filtros que se aplican en la etapa 'dashboard' (por cada valor de la columna, hasta `maximo_valores`).
+FILTROS_DASHBOARD = ['cat1', 'brand', 'customer_id', 'product_id']
+maximo_valores = 20
+
+
+def memoria_pico_mb():
+    """
+    Memoria residente máxima (MB) de este proceso, sin sus procesos hijos
+    (ver `medir_memoria_arbol`). None si la plataforma no tiene el módulo `resource`.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    # En Linux ru_maxrss está en KB; en macOS, en bytes.
+    escala = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / escala
+
+
+def procesos_del_arbol(pid):
+    """
+    PIDs de `pid` y de todos sus descendientes, leídos de /proc.
+    """
+    hijos = {}
+    for nombre in os.listdir('/proc'):
+        if not nombre.isdigit():
+            continue
+        try:
+            with open(f'/proc/{nombre}/stat') as archivo:
+                # El nombre del programa (entre paréntesis) puede tener espacios; el PID del padre va después.
+                padre = int(archivo.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue # El proceso terminó mientras se leía
+        hijos.setdefault(padre, []).append(int(nombre))
+    arbol, pendientes = [], [pid]
+    while pendientes:
+        actual = pendientes.pop()
+        arbol.append(actual)
+        pendientes.extend(hijos.get(actual, []))
+    return arbol
+
+
+def memoria_residente_mb(pid):
+    """
+    Memoria residente actual (VmRSS) de un proceso en MB; 0 si ya terminó.
+    """
+    try:
+        with open(f'/proc/{pid}/status') as archivo:
+            for linea in archivo:
+                if linea.startswith('VmRSS:'):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def medir_memoria_arbol(proceso, resultado):
+    """
+    Mientras `proceso` corre, suma cada `intervalo_muestreo` segundos la memoria residente
+    de él y sus descendientes, y deja el máximo en resultado['memoria_pico_arbol_mb'].
+    Los picos más cortos que el intervalo pueden no verse. Fuera de Linux queda None.
+    """
+    if not os.path.isdir('/proc'):
+        resultado['memoria_pico_arbol_mb'] = None
+        return
+    pico = 0.0
+    while proceso.poll() is None:
+        pico = max(pico, sum(memoria_residente_mb(pid) for pid in procesos_del_arbol(proceso.pid)))
+        time.sleep(intervalo_muestreo)
+    resultado['memoria_pico_arbol_mb'] = round(pico, 1)
+
+
+def medir_dashboard():
+    """
+    Etapa 'dashboard': lo que hace app_dashboard.py sin cubo, fuera de Streamlit.
+
+    Carga y agrega los datos filtrados (como `preparar_datos_agregados`), construye
+    el índice de filtros y aplica una serie de filtros con su agregación para el gráfico.
+
+    Returns:
+        dict: Tiempos de cada parte y cantidad de filtros aplicados.
+    """
+    from io_maestro import cargar_maestro, resolver_ruta_existente
+    from cubo_agregado import agregar_base
+    from datos_dashboard import IndiceFiltros, agregar_para_grafico, codificar_columnas
+
+    inicio = time.perf_counter()
+    df = cargar_maestro(resolver_ruta_existente('archivos_maestros/a_m_filtrado_prod_a_pred'))
+    df_base = agregar_base(df)
+    codificar_columnas([df_base])
+    del df
+    preparar = time.perf_counter()
+
+    indice = IndiceFiltros(df_base)
+    construir_indice = time.perf_counter()
+
+    fechas = np.unique(df_base['periodo'].to_numpy())
+    rango = (fechas[len(fechas) // 4], fechas[-1]) # Los últimos tres cuartos de la historia
+    filtros_aplicados = 0
+    for col in FILTROS_DASHBOARD:
+        for codigo in range(min(maximo_valores, len(indice.valores[col]))):
+            posiciones = indice.posiciones(*rango, {col: codigo})
+            for col_opciones in FILTROS_DASHBOARD:
+                indice.opciones(col_opciones, posiciones)
+            agregar_para_grafico(indice.filas(posiciones), 'product_id', 20)
+            filtros_aplicados += 1
+    fin = time.perf_counter()
+
+    return {
+        'filas_agregadas': len(df_base),
+        'segundos_preparar_datos': round(preparar - inicio, 4),
+        'segundos_indice': round(construir_indice - preparar, 4),
+        'segundos_filtros': round(fin - construir_indice, 4),
+        'filtros_aplicados': filtros_aplicados,
+    }
+
+
+def ejecutar_etapa(nombre):
+    """
+    Ejecuta una etapa en este proceso (el directorio actual es la carpeta de trabajo)
+    e imprime su resultado como una línea JSON al final de la salida.
+    """
+    etapa = ETAPAS[nombre]
+    inicio = time.perf_counter()
+    detalle = {}
+    if isinstance(etapa, str):
+        detalle = globals()[etapa]()
+    else:
+        script, argumentos = etapa
+        sys.argv = [script] + argumentos
+        try:
+            runpy.run_path(os.path.join(CARPETA_REPO, script), run_name='__main__')
+        except SystemExit as salida: # Los scripts terminan con exit()
+            if salida.code not in (None, 0):
+                raise
+    segundos = time.perf_counter() - inicio
+    print(json.dumps({'etapa': nombre, 'segundos': round(segundos, 4), 'memoria_pico_mb': memoria_pico_mb(), **detalle}))
+
+
+def medir_etapa_en_proceso(nombre, carpeta):
+    """
+    Corre una etapa en un proceso nuevo dentro de `carpeta` y devuelve su resultado,
+    con la memoria máxima de su árbol de procesos.
+    """
+    entorno = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [CARPETA_REPO, os.environ.get('PYTHONPATH')])))
+    proceso = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--etapa', nombre], cwd=carpeta,
+                               env=entorno, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    memoria_arbol = {}
+    muestreo = threading.Thread(target=medir_memoria_arbol, args=(proceso, memoria_arbol), daemon=True)
+    muestreo.start()
+    salida, errores = proceso.communicate()
+    muestreo.join()
+    if proceso.returncode != 0:
+        print(salida[-2000:])
+        print(errores[-2000:])
+        return {'etapa': nombre, 'error': f'El proceso terminó con código {proceso.returncode}'}
+    return {**json.loads(salida.strip().splitlines()[-1]), **memoria_arbol}
+
+
+def datos_del_entorno():
+    """
+    Versiones y máquina con las que se midió (para no comparar resultados de máquinas distintas).
+    """
+    import pyarrow
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=CARPETA_REPO,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'pyarrow': pyarrow.__version__,
+        'plataforma': platform.platform(),
+        'procesadores': os.cpu_count(),
+    }
+
+
+def comparar_resultados(actuales, anteriores, tolerancia):
+    """
+    Compara tiempo y memoria (del proceso de la etapa y de su árbol de procesos)
+    de cada etapa con una corrida anterior.
+
+    Returns:
+        list: Regresiones, como dicts con la etapa, la medida y ambos valores.
+    """
+    etapas_anteriores = {etapa['etapa']: etapa for etapa in anteriores['etapas']}
+    regresiones = []
+    for etapa in actuales['etapas']:
+        anterior = etapas_anteriores.get(etapa['etapa'])
+        if anterior is None:
+            continue
+        for medida in ('segundos', 'memoria_pico_mb', 'memoria_pico_arbol_mb'):
+            valor, valor_anterior = etapa.get(medida), anterior.get(medida)
+            if valor is None or not valor_anterior:
+                continue
+            if valor > valor_anterior * (1 + tolerancia):
+                regresiones.append({'etapa': etapa['etapa'], 'medida': medida,
+                                    'anterior': valor_anterior, 'actual': valor})
+    return regresiones
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mide tiempo y memoria de cada etapa del pipeline con datos sintéticos.')
+    parser.add_argument('--filas', type=int, default=filas)
+    parser.add_argument('--carpeta', default=carpeta_trabajo, help='Carpeta para los datos sintéticos y las salidas.')
+    parser.add_argument('--etapas', nargs='+', choices=list(ETAPAS), default=list(ETAPAS))
+    parser.add_argument('--salida', default=None, help='Archivo JSON de resultados. Por defecto, <carpeta>/resultados_<filas>.json')
+    parser.add_argument('--comparar', default=None, help='Resultados anteriores (JSON) contra los que buscar regresiones.')
+    parser.add_argument('--tolerancia', type=float, default=tolerancia)
+    parser.add_argument('--etapa', default=None, help=argparse.SUPPRESS) # Uso interno: corre una sola etapa
+    args = parser.parse_args()
+
+    if args.etapa is not None:
+        ejecutar_etapa(args.etapa)
+        sys.exit(0)
+
+    # --- Datos sintéticos (se reutilizan si ya se generaron con la misma cantidad de filas) ---
+    carpeta_datos = os.path.join(args.carpeta, 'data')
+    ruta_resumen_datos = os.path.join(carpeta_datos, 'resumen.json')
+    resumen_datos = None
+    if os.path.exists(ruta_resumen_datos):
+        with open(ruta_resumen_datos, encoding='utf-8') as archivo:
+            resumen_datos = json.load(archivo)
+    if resumen_datos is None or resumen_datos['filas'] != args.filas:
+        print(f"Generando {args.filas} filas de datos sintéticos en '{carpeta_datos}'...")
+        clientes = clientes_necesarios(args.filas, cantidad_productos, cantidad_periodos)
+        resumen_datos = generar_datos(carpeta_datos, filas=args.filas, cantidad_clientes=clientes)
+        with open(ruta_resumen_datos, 'w', encoding='utf-8') as archivo:
+            json.dump(resumen_datos, archivo, indent=2)
+    os.makedirs(os.path.join(args.carpeta, 'archivos_maestros'), exist_ok=True)
+
+    # --- Etapas ---
+    resultados = {'fecha': pd.Timestamp.now().isoformat(timespec='seconds'), 'datos': resumen_datos,
+                  'entorno': datos_del_entorno(), 'etapas': []}
+    for nombre in [etapa for etapa in ETAPAS if etapa in args.etapas]:
+        print(f"Midiendo '{nombre}'...")
+        resultado = medir_etapa_en_proceso(nombre, args.carpeta)
+        print(f"  {resultado}")
+        resultados['etapas'].append(resultado)
+
+    ruta_salida = args.salida or os.path.join(args.carpeta, f'resultados_{args.filas}.json')
+    with open(ruta_salida, 'w', encoding='utf-8') as archivo:
+        json.dump(resultados, archivo, indent=2)
+    print(f"Resultados guardados en '{ruta_salida}'.")
+
+    # --- Comparación con una corrida anterior ---
+    errores = [etapa['etapa'] for etapa in resultados['etapas'] if 'error' in etapa]
+    regresiones = []
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            anteriores = json.load(archivo)
+        regresiones = comparar_resultados(resultados, anteriores, args.tolerancia)
+        for regresion in regresiones:
+            print(f"Regresión en '{regresion['etapa']}' ({regresion['medida']}): "
+                  f"{regresion['anterior']} -> {regresion['actual']}")
+        if not regresiones:
+            print(f"Sin regresiones respecto de '{args.comparar}' (tolerancia {args.tolerancia:.0%}).")
+    if errores:
+        print(f"Etapas con error: {errores}")
+    sys.exit(1 if errores or regresiones else 0)
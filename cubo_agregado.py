@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+import os
+import json
+import argparse
+
+from io_maestro import COLUMNAS_ATRIBUTOS_PRODUCTO, cargar_maestro, resolver_ruta_existente
+
+# --- Configuración ---
+# Entrada: la salida de a_m_filtrado_prod_a_pred.py (Parquet, dataset particionado o CSV).
+ruta_entrada_sin_extension = 'archivos_maestros/a_m_filtrado_prod_a_pred'
+carpeta_cubo = 'archivos_maestros/cubo'
+
+NOMBRE_INDICE_CUBO = '_cubo.json'
+
+# Niveles del cubo: nombre -> columnas por las que se agrupa la suma de 'tn'.
+# Los niveles que agrupan por product_id llevan además los atributos del producto
+# (dependen solo de product_id), así que también responden filtros por cat1, brand, etc.
+NIVELES = {
+    'base': ['periodo', 'product_id', 'customer_id'],
+    'producto': ['periodo', 'product_id'],
+    'cliente': ['periodo', 'customer_id'],
+    'atributos': ['periodo', 'cat1', 'cat2', 'cat3', 'brand', 'sku_size'],
+    'cat1_cat2_cat3': ['periodo', 'cat1', 'cat2', 'cat3'],
+    'cat1_cat2': ['periodo', 'cat1', 'cat2'],
+    'cat1': ['periodo', 'cat1'],
+    'brand': ['periodo', 'brand'],
+    'sku_size': ['periodo', 'sku_size'],
+    'total': ['periodo'],
+}
+
+
+def periodo_a_fecha(periodo):
+    """
+    Convierte una serie de periodos YYYYMM (enteros o strings) a fechas (día 1 del mes).
+
+    Solo se parsean los periodos distintos (unas decenas) y el resultado se
+    expande por posición, en lugar de convertir a string y parsear cada fila.
+    """
+    valores, posiciones = np.unique(periodo.to_numpy(), return_inverse=True)
+    fechas = pd.to_datetime(pd.Series(valores).astype(str), format='%Y%m')
+    return pd.Series(fechas.to_numpy()[posiciones], index=periodo.index, name=periodo.name)
+
+
+def atributos_de_producto(df):
+    """
+    Devuelve una fila por product_id con sus atributos (cat1..sku_size) presentes en `df`.
+    """
+    columnas = ['product_id'] + [col for col in COLUMNAS_ATRIBUTOS_PRODUCTO if col in df.columns]
+    # Asegurarse que no haya NaNs en product_id antes de drop_duplicates
+    return df[columnas].dropna(subset=['product_id']).drop_duplicates(subset=['product_id'])
+
+
+def agregar_base(df):
+    """
+    Suma 'tn' por (periodo, product_id, customer_id), agrega los atributos de producto
+    y convierte 'periodo' a fecha. Es el nivel 'base' del cubo.
+
+    Returns:
+        pd.DataFrame: El DataFrame agregado, sin filas con 'periodo' o 'tn' faltantes.
+    """
+    grouping_cols = ['periodo', 'product_id', 'customer_id']
+    df_sum = df.groupby(grouping_cols, as_index=False, observed=True)['tn'].sum()
+
+    df_product_attributes = atributos_de_producto(df)
+    if len(df_product_attributes.columns) > 1:
+        df_processed = pd.merge(df_sum, df_product_attributes, on='product_id', how='left')
+    else: # Si solo tenemos product_id como atributo
+        df_processed = df_sum
+        for col in COLUMNAS_ATRIBUTOS_PRODUCTO:
+            if col not in df_processed.columns:
+                df_processed[col] = "Desconocido" # O algún valor por defecto
+
+    df_processed['periodo'] = periodo_a_fecha(df_processed['periodo'])
+    return df_processed.dropna(subset=['periodo', 'tn'])
+
+
+def construir_cubo(df_base):
+    """
+    Construye todos los niveles del cubo a partir del nivel 'base' (ver `agregar_base`).
+
+    Returns:
+        dict: Nombre del nivel -> DataFrame con las columnas de agrupación, los
+              atributos de producto (si agrupa por product_id) y 'tn'.
+    """
+    atributos = atributos_de_producto(df_base)
+    cubo = {'base': df_base}
+    for nombre, columnas in NIVELES.items():
+        if nombre == 'base':
+            continue
+        columnas = [col for col in columnas if col in df_base.columns]
+        nivel = df_base.groupby(columnas, as_index=False, observed=True, dropna=False)['tn'].sum()
+        if 'product_id' in columnas and len(atributos.columns) > 1:
+            nivel = pd.merge(nivel, atributos, on='product_id', how='left')
+        cubo[nombre] = nivel
+    return cubo
+
+
+def columnas_nivel(df_nivel):
+    """
+    Columnas por las que se puede filtrar o agrupar en un nivel (todas menos 'tn').
+    """
+    return [col for col in df_nivel.columns if col != 'tn']
+
+
+def elegir_nivel(cubo, columnas_requeridas):
+    """
+    Elige el nivel más chico (menos filas) que tiene todas las columnas requeridas.
+
+    Args:
+        cubo (dict): Nombre del nivel -> DataFrame.
+        columnas_requeridas (iterable): Columnas filtradas o usadas para agrupar.
+
+    Returns:
+        str: El nombre del nivel elegido.
+    """
+    requeridas = set(columnas_requeridas)
+    candidatos = [(len(df_nivel), nombre) for nombre, df_nivel in cubo.items()
+                  if requeridas.issubset(df_nivel.columns)]
+    if not candidatos:
+        raise ValueError(f"Ningún nivel del cubo tiene las columnas {sorted(requeridas)}")
+    return min(candidatos)[1]
+
+
+def guardar_cubo(cubo, carpeta):
+    """
+    Guarda cada nivel del cubo como un archivo Parquet y un índice '_cubo.json'.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    indice = {}
+    for nombre, df_nivel in cubo.items():
+        archivo = f'{nombre}.parquet'
+        df_nivel.to_parquet(os.path.join(carpeta, archivo), engine='pyarrow', index=False)
+        indice[nombre] = {'archivo': archivo, 'columnas': columnas_nivel(df_nivel), 'filas': len(df_nivel)}
+    with open(os.path.join(carpeta, NOMBRE_INDICE_CUBO), 'w', encoding='utf-8') as archivo_indice:
+        json.dump(indice, archivo_indice, indent=2)
+    print(f"Cubo guardado en '{carpeta}' ({len(cubo)} niveles).")
+
+
+def existe_cubo(carpeta):
+    return os.path.exists(os.path.join(carpeta, NOMBRE_INDICE_CUBO))
+
+
+def cargar_cubo(carpeta):
+    """
+    Carga todos los niveles de un cubo guardado con `guardar_cubo`.
+
+    Returns:
+        dict: Nombre del nivel -> DataFrame.
+    """
+    with open(os.path.join(carpeta, NOMBRE_INDICE_CUBO), encoding='utf-8') as archivo_indice:
+        indice = json.load(archivo_indice)
+    return {nombre: pd.read_parquet(os.path.join(carpeta, datos['archivo']), engine='pyarrow')
+            for nombre, datos in indice.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precalcula el cubo de sumas de tn que usa el dashboard.')
+    parser.add_argument('--entrada', default=None, help='Archivo o dataset filtrado. Por defecto, la salida más reciente del filtrado.')
+    parser.add_argument('--salida', default=carpeta_cubo)
+    args = parser.parse_args()
+
+    ruta_entrada = args.entrada or resolver_ruta_existente(ruta_entrada_sin_extension)
+    print(f"Cargando datos desde: {ruta_entrada}")
+    columnas = ['periodo', 'product_id', 'customer_id', 'tn'] + COLUMNAS_ATRIBUTOS_PRODUCTO
+    df = cargar_maestro(ruta_entrada)
+    df = df[[col for col in columnas if col in df.columns]]
+
+    cubo = construir_cubo(agregar_base(df))
+    for nombre, df_nivel in cubo.items():
+        print(f"Nivel '{nombre}': {len(df_nivel)} filas")
+    guardar_cubo(cubo, args.salida)
@@ -0,0 +1,415 @@
+import numpy as np
+import pandas as pd
+import sys
+import threading
+from collections import OrderedDict
+
+# Lógica de datos del dashboard que no depende de Streamlit (se puede usar y medir fuera de la app).
+
+ETIQUETA_OTROS = 'Otros'
+ETIQUETA_DESCONOCIDO = 'Desconocido'
+
+# Columnas de ID y atributos que el dashboard maneja como categóricas (código entero + diccionario).
+COLUMNAS_CATEGORICAS = ['customer_id', 'product_id', 'cat1', 'cat2', 'cat3', 'brand', 'sku_size']
+
+
+def codificar_columnas(dataframes, columnas=COLUMNAS_CATEGORICAS):
+    """
+    Convierte las columnas a categóricas con un diccionario compartido por columna.
+
+    Todos los DataFrames (por ejemplo, los niveles del cubo) usan las mismas
+    categorías ordenadas para cada columna, así un código entero significa el
+    mismo valor en cualquier nivel. Los valores solo se decodifican al mostrarlos.
+
+    Args:
+        dataframes (list): DataFrames a convertir (se modifican en el lugar).
+        columnas (list, optional): Columnas a convertir, si están presentes.
+
+    Returns:
+        dict: Columna -> pd.CategoricalDtype usado.
+    """
+    diccionarios = {}
+    for col in columnas:
+        presentes = [df[col] for df in dataframes if col in df.columns]
+        if not presentes:
+            continue
+        valores = pd.unique(np.concatenate([np.asarray(serie.dropna().unique()) for serie in presentes]))
+        diccionarios[col] = pd.CategoricalDtype(np.sort(valores))
+        for df in dataframes:
+            if col in df.columns and df[col].dtype != diccionarios[col]:
+                df[col] = df[col].astype(diccionarios[col])
+    return diccionarios
+
+
+def codigos_y_etiquetas(serie):
+    """
+    Devuelve (códigos enteros, etiquetas) de una columna; -1 indica valor faltante.
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.codes.to_numpy(), serie.cat.categories
+    return pd.factorize(serie, sort=True)
+
+
+def agregar_para_grafico(df_filtrado, col_serie, max_series):
+    """
+    Suma 'tn' por periodo y serie para el gráfico, sin muestrear.
+
+    Las series se ordenan por su 'tn' total en el rango filtrado; las que quedan
+    fuera de las primeras `max_series` se suman juntas en una serie 'Otros'.
+    El resultado tiene a lo sumo periodos x (max_series + 2) filas y sus sumas son exactas.
+    Se agrupa por los códigos de la serie; las etiquetas se decodifican al final,
+    solo para las filas del resultado.
+
+    Args:
+        df_filtrado (pd.DataFrame): Filas filtradas con 'periodo', 'tn' y `col_serie`.
+        col_serie (str): Columna que define las series (color del gráfico).
+        max_series (int): Cantidad de series que se muestran por separado.
+
+    Returns:
+        pd.DataFrame: Columnas 'periodo', `col_serie` (etiqueta) y 'tn'.
+    """
+    codigos, etiquetas = codigos_y_etiquetas(df_filtrado[col_serie])
+    tn = df_filtrado['tn'].to_numpy()
+    codigo_otros, codigo_desconocido = len(etiquetas), len(etiquetas) + 1
+    codigos = np.where(codigos < 0, codigo_desconocido, codigos)
+
+    totales = np.bincount(codigos, weights=tn, minlength=len(etiquetas) + 2)[:len(etiquetas)]
+    if np.count_nonzero(totales) > max_series:
+        principales = np.zeros(len(etiquetas) + 2, dtype=bool)
+        principales[np.argsort(-totales, kind='stable')[:max_series]] = True
+        principales[codigo_desconocido] = True
+        codigos = np.where(principales[codigos], codigos, codigo_otros)
+
+    agregado = (pd.DataFrame({'periodo': df_filtrado['periodo'].to_numpy(), 'codigo': codigos, 'tn': tn})
+                .groupby(['periodo', 'codigo'], as_index=False)['tn']
+                .sum())
+    nombres = np.array([str(etiqueta) for etiqueta in etiquetas] + [ETIQUETA_OTROS, ETIQUETA_DESCONOCIDO], dtype=object)
+    agregado[col_serie] = nombres[agregado['codigo'].to_numpy()]
+    return agregado[['periodo', col_serie, 'tn']]
+
+
+def interseccion_ordenada(a, b):
+    """
+    Intersección de dos arreglos de posiciones ordenados y sin repetidos.
+
+    Cada elemento del arreglo más chico se busca con búsqueda binaria en el más
+    grande, así el costo depende sobre todo del tamaño del más chico.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    if len(a) == 0:
+        return a
+    ubicaciones = np.searchsorted(b, a)
+    ubicaciones[ubicaciones == len(b)] = 0
+    return a[b[ubicaciones] == a]
+
+
+class IndiceFiltros:
+    """
+    Índice invertido de un nivel del cubo para los filtros en cascada.
+
+    Las filas se ordenan una vez por 'periodo', así un rango de fechas es un rango
+    contiguo de posiciones. Para cada columna de filtro se guarda, por código, el
+    arreglo ordenado de posiciones de las filas que lo tienen (como un CSR: las
+    posiciones agrupadas por código y los límites de cada grupo). Filtrar es
+    intersecar esos arreglos y las opciones de un filtro salen de los códigos de
+    las posiciones resultantes, sin recorrer el DataFrame ni copiarlo.
+
+    Las selecciones y las opciones son códigos enteros. En columnas categóricas
+    son los códigos de la categoría (compartidos entre niveles si se usó
+    `codificar_columnas`); `etiqueta` los decodifica para mostrarlos.
+
+    Uso:
+        indice = IndiceFiltros(df_nivel)
+        posiciones = indice.posiciones(fecha_inicio, fecha_fin, {'cat1': codigo_hc})
+        opciones = indice.opciones('brand', posiciones)
+        etiquetas = [indice.etiqueta('brand', codigo) for codigo in opciones]
+        df_filtrado = indice.filas(posiciones)
+    """
+
+    def __init__(self, df_nivel, columnas=None):
+        if df_nivel['periodo'].is_monotonic_increasing:
+            self.df = df_nivel # Los niveles del cubo ya vienen ordenados: no hace falta copiarlos.
+        else:
+            self.df = df_nivel.sort_values('periodo', kind='stable').reset_index(drop=True)
+        self.periodos = self.df['periodo'].to_numpy()
+        if columnas is None:
+            columnas = [col for col in self.df.columns if col not in ('periodo', 'tn')]
+        self.codigos = {}
+        self.valores = {}
+        self.posiciones_por_codigo = {}
+        self.limites = {}
+        for col in columnas:
+            if col not in self.df.columns:
+                continue
+            # Los códigos siguen el orden de los valores; NaN queda como -1.
+            codigos, valores = codigos_y_etiquetas(self.df[col])
+            orden = np.argsort(codigos, kind='stable')
+            self.codigos[col] = codigos
+            self.valores[col] = valores
+            self.posiciones_por_codigo[col] = orden
+            self.limites[col] = np.searchsorted(codigos[orden], np.arange(-1, len(valores) + 1))
+
+    def rango_fechas(self, fecha_inicio=None, fecha_fin=None):
+        """
+        Devuelve (desde, hasta): las posiciones [desde, hasta) de las filas dentro del rango.
+        """
+        desde = 0 if fecha_inicio is None else np.searchsorted(
+            self.periodos, np.datetime64(pd.Timestamp(fecha_inicio)), side='left')
+        hasta = len(self.periodos) if fecha_fin is None else np.searchsorted(
+            self.periodos, np.datetime64(pd.Timestamp(fecha_fin)), side='right')
+        return int(desde), int(hasta)
+
+    def posiciones_valor(self, col, codigo):
+        """
+        Posiciones ordenadas de las filas donde `col` tiene el código `codigo`.
+        """
+        if not 0 <= codigo < len(self.valores[col]):
+            return np.empty(0, dtype=np.intp)
+        limites = self.limites[col]
+        return self.posiciones_por_codigo[col][limites[codigo + 1]:limites[codigo + 2]]
+
+    def posiciones(self, fecha_inicio=None, fecha_fin=None, selecciones=None):
+        """
+        Posiciones ordenadas de las filas que cumplen el rango de fechas y las selecciones.
+
+        Args:
+            fecha_inicio, fecha_fin (optional): Límites (inclusive) para 'periodo'.
+            selecciones (dict, optional): Columna -> código seleccionado.
+
+        Returns:
+            np.ndarray: Posiciones de filas (en el orden interno del índice).
+        """
+        desde, hasta = self.rango_fechas(fecha_inicio, fecha_fin)
+        resultado = None
+        listas = sorted((self.posiciones_valor(col, codigo) for col, codigo in (selecciones or {}).items()), key=len)
+        for posiciones_valor in listas:
+            # Recortar al rango de fechas con búsqueda binaria: las posiciones están ordenadas.
+            posiciones_valor = posiciones_valor[np.searchsorted(posiciones_valor, desde):
+                                                np.searchsorted(posiciones_valor, hasta)]
+            resultado = posiciones_valor if resultado is None else interseccion_ordenada(resultado, posiciones_valor)
+            if len(resultado) == 0:
+                break
+        if resultado is None:
+            resultado = np.arange(desde, hasta)
+        return resultado
+
+    def opciones(self, col, posiciones):
+        """
+        Códigos distintos (en el orden de los valores, sin NaN) de `col` en las filas `posiciones`.
+        """
+        codigos = self.codigos[col][posiciones]
+        return np.flatnonzero(np.bincount(codigos + 1, minlength=len(self.valores[col]) + 1)[1:]).tolist()
+
+    def etiqueta(self, col, codigo):
+        """
+        Valor que corresponde al código `codigo` de `col`.
+        """
+        return self.valores[col][codigo]
+
+    def codigo(self, col, valor):
+        """
+        Código de `valor` en `col`, o -1 si no está (la inversa de `etiqueta`).
+        """
+        return int(self.valores[col].get_indexer([valor])[0])
+
+    def filas(self, posiciones):
+        """
+        Las filas del nivel en esas posiciones.
+        """
+        return self.df.take(posiciones)
+
+    def cantidad_filas(self, posiciones):
+        return len(posiciones)
+
+    def muestra(self, posiciones, cantidad):
+        """
+        Las primeras `cantidad` filas de esas posiciones.
+        """
+        return self.df.take(posiciones[:cantidad])
+
+    def grafico(self, posiciones, col_serie, max_series):
+        """
+        Datos del gráfico de las filas en esas posiciones (ver `agregar_para_grafico`).
+        """
+        return agregar_para_grafico(self.filas(posiciones), col_serie, max_series)
+
+
+def completar_con_ceros(df_grafico, col_serie, fecha_inicio, fecha_fin):
+    """
+    Agrega filas con tn = 0 para los meses sin ventas de cada serie del gráfico.
+
+    Los datos (y el cubo) solo tienen filas en los meses con ventas; para graficar
+    líneas, los meses sin ventas tienen que aparecer como 0 y no como huecos. Se
+    completa la grilla de meses del rango x series del gráfico, que ya es chica
+    (a lo sumo periodos x (max_series + 2) filas, ver `agregar_para_grafico`).
+
+    Args:
+        df_grafico (pd.DataFrame): Salida de `agregar_para_grafico`.
+        col_serie (str): Columna de las series.
+        fecha_inicio, fecha_fin: Primer y último mes del rango.
+
+    Returns:
+        pd.DataFrame: Las mismas columnas, con una fila por mes del rango y serie.
+    """
+    meses = pd.date_range(pd.Timestamp(fecha_inicio).to_period('M').to_timestamp(),
+                          pd.Timestamp(fecha_fin).to_period('M').to_timestamp(), freq='MS')
+    meses = meses.astype(df_grafico['periodo'].dtype) # Misma resolución que las fechas del gráfico
+    grilla = pd.MultiIndex.from_product([meses, pd.unique(df_grafico[col_serie])], names=['periodo', col_serie])
+    completo = df_grafico.set_index(['periodo', col_serie])['tn'].reindex(grilla, fill_value=0.0)
+    return completo.reset_index()
+
+
+def normalizar_rango(fechas, fecha_inicio=None, fecha_fin=None):
+    """
+    Lleva un rango de fechas a los periodos que realmente abarca.
+
+    Dos rangos que incluyen los mismos periodos (por ejemplo, del 1 o del 15 de un mes
+    al mismo fin) dan el mismo resultado, y el rango que incluye todos los periodos da
+    (None, None), igual que no filtrar por fecha. Sirve como parte de la clave de
+    `CacheResultados`; filtrar con el rango normalizado da las mismas filas.
+
+    Args:
+        fechas (np.ndarray): Periodos disponibles (datetime64), ordenados y sin repetidos.
+        fecha_inicio, fecha_fin (optional): Límites (inclusive) del rango.
+
+    Returns:
+        tuple: (primer periodo, último periodo) del rango como pd.Timestamp, o (None, None).
+    """
+    if (fecha_inicio is None and fecha_fin is None) or len(fechas) == 0:
+        return None, None
+    desde = 0 if fecha_inicio is None else int(np.searchsorted(fechas, np.datetime64(pd.Timestamp(fecha_inicio)), side='left'))
+    hasta = len(fechas) if fecha_fin is None else int(np.searchsorted(fechas, np.datetime64(pd.Timestamp(fecha_fin)), side='right'))
+    if desde == 0 and hasta == len(fechas):
+        return None, None
+    if desde >= hasta:
+        return fecha_inicio, fecha_fin # Rango sin periodos: se deja como está (el resultado es vacío)
+    return pd.Timestamp(fechas[desde]), pd.Timestamp(fechas[hasta - 1])
+
+
+def clave_selecciones(selecciones):
+    """
+    Las selecciones (columna -> código) como una tupla ordenada, para usarlas en una clave.
+    """
+    return tuple(sorted((col, int(codigo)) for col, codigo in selecciones.items()))
+
+
+def tamano_en_memoria(valor):
+    """
+    Bytes aproximados de un resultado cacheado (DataFrames, arreglos, listas y dicts de ellos).
+    """
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        return int(valor.memory_usage(deep=True).sum() if isinstance(valor, pd.DataFrame) else valor.memory_usage(deep=True))
+    if isinstance(valor, np.ndarray):
+        return valor.nbytes
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(tamano_en_memoria(v) for v in valor.values())
+    if isinstance(valor, (list, tuple)):
+        return sys.getsizeof(valor) + sum(tamano_en_memoria(v) for v in valor)
+    return sys.getsizeof(valor)
+
+
+def resumen_filtrado(indice_base, fecha_inicio, fecha_fin, selecciones, filas_muestra=20):
+    """
+    La tabla del dashboard para un estado de los filtros: cantidad de filas y las primeras
+    `filas_muestra` filas.
+
+    `indice_base` tiene que ser el del nivel base (una fila por periodo, producto y
+    cliente) o el tensor: con un nivel agregado del cubo la cantidad dependería del nivel
+    elegido y la muestra no tendría todas las columnas. Es chico aunque el filtro abarque
+    muchas filas, así que se puede cachear.
+
+    Returns:
+        dict: 'filas' y 'muestra'.
+    """
+    posiciones = indice_base.posiciones(fecha_inicio, fecha_fin, selecciones)
+    return {'filas': indice_base.cantidad_filas(posiciones), 'muestra': indice_base.muestra(posiciones, filas_muestra)}
+
+
+def grafico_filtrado(indice, fecha_inicio, fecha_fin, selecciones, col_serie, max_series):
+    """
+    Los datos del gráfico para un estado de los filtros (ver `agregar_para_grafico`).
+
+    Las sumas por periodo y serie son las mismas en cualquier nivel que tenga las columnas
+    seleccionadas y `col_serie`, así que `indice` puede ser el del nivel más chico.
+    `indice` es un `IndiceFiltros` o un `tensor_tn.IndiceTensor` (con la misma interfaz).
+    """
+    return indice.grafico(indice.posiciones(fecha_inicio, fecha_fin, selecciones), col_serie, max_series)
+
+
+class CacheResultados:
+    """
+    Caché LRU de resultados (opciones de filtros, resúmenes filtrados) compartido por
+    todas las sesiones y limitado por memoria.
+
+    Las claves son el estado normalizado de los filtros (ver `normalizar_rango` y
+    `clave_selecciones`) más lo que se calcula. Cuando los bytes guardados pasan de
+    `maximo_bytes`, se descartan los resultados usados hace más tiempo. Si varias
+    sesiones piden a la vez una clave que no está, se calcula una sola vez y las
+    demás esperan ese resultado.
+
+    Los resultados se comparten entre sesiones: no se deben modificar.
+
+    Uso:
+        cache = CacheResultados(256 * 1024 ** 2)
+        opciones = cache.obtener(('opciones', rango, 'brand', clave_selecciones(selecciones)),
+                                 lambda: calcular_opciones(...))
+    """
+
+    def __init__(self, maximo_bytes):
+        self.maximo_bytes = maximo_bytes
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self._valores = OrderedDict() # clave -> (valor, bytes), del usado hace más tiempo al más reciente
+        self._en_curso = {}           # clave -> threading.Event de un cálculo que está corriendo
+        self._bloqueo = threading.Lock()
+
+    def __len__(self):
+        return len(self._valores)
+
+    def __contains__(self, clave):
+        with self._bloqueo:
+            return clave in self._valores
+
+    def obtener(self, clave, calcular):
+        """
+        Devuelve el resultado de `clave`; si no está, lo calcula con `calcular()` y lo guarda.
+        """
+        while True:
+            with self._bloqueo:
+                if clave in self._valores:
+                    self._valores.move_to_end(clave)
+                    self.aciertos += 1
+                    return self._valores[clave][0]
+                evento = self._en_curso.get(clave)
+                if evento is None:
+                    self._en_curso[clave] = threading.Event()
+                    self.fallos += 1
+                    break
+            # Otra sesión lo está calculando: se espera y se vuelve a buscar (si falló, se calcula acá).
+            evento.wait()
+
+        try:
+            valor = calcular()
+            self._guardar(clave, valor)
+            return valor
+        finally:
+            with self._bloqueo:
+                self._en_curso.pop(clave).set()
+
+    def _guardar(self, clave, valor):
+        tamano = tamano_en_memoria(valor)
+        if tamano > self.maximo_bytes:
+            return
+        with self._bloqueo:
+            self._valores[clave] = (valor, tamano)
+            self.bytes += tamano
+            while self.bytes > self.maximo_bytes:
+                _, (_, tamano_descartado) = self._valores.popitem(last=False)
+                self.bytes -= tamano_descartado
+
+    def estadisticas(self):
+        with self._bloqueo:
+            return {'entradas': len(self._valores), 'mb': round(self.bytes / 1024 ** 2, 2),
+                    'aciertos': self.aciertos, 'fallos': self.fallos}
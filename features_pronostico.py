@@ -0,0 +1,260 @@
+import numpy as np
+import pandas as pd
+import argparse
+
+from io_maestro import cargar_maestro, guardar_dataframe_a_parquet, mes_a_periodo, periodo_a_mes, resolver_ruta_existente
+from instrumentacion import medir_etapa
+
+# --- Configuración ---
+# Entrada: la salida de a_m_filtrado_prod_a_pred.py (Parquet, dataset particionado o CSV).
+ruta_entrada_sin_extension = 'archivos_maestros/a_m_filtrado_prod_a_pred'
+ruta_salida = 'archivos_maestros/features_pronostico.parquet'
+
+# Nivel del panel: 'producto_cliente' (una serie por product_id y customer_id) o 'producto'.
+NIVELES_PANEL = {
+    'producto_cliente': ['product_id', 'customer_id'],
+    'producto': ['product_id'],
+}
+nivel_panel = 'producto_cliente'
+lags = [1, 2, 3, 6, 12]
+ventanas = [3, 6, 12]
+horizonte = 2 # El objetivo es tn en t+2
+completar_meses = False
+
+
+class PanelOrdenado:
+    """
+    Panel de tn por serie (producto o producto y cliente) y mes, ordenado una sola vez.
+
+    Las filas quedan ordenadas por (serie, mes) en arreglos contiguos. Cada fila tiene
+    una clave entera `serie * ancho + mes_relativo`, así que buscar "la misma serie k
+    meses antes" es una búsqueda binaria de `clave - k` sobre todas las filas a la vez,
+    sin agrupar ni recorrer series en Python.
+
+    Los meses sin fila en una serie son meses sin ventas: cuentan como tn = 0.
+    Los meses anteriores al primer periodo de los datos (o posteriores al último)
+    no se conocen y dan NaN.
+
+    Uso:
+        panel = PanelOrdenado(series, periodos, tn)
+        tn_lag_1 = panel.lag(1)
+        media_3 = panel.media_movil(3)
+        objetivo = panel.adelanto(2)
+    """
+
+    def __init__(self, series, periodos, tn):
+        """
+        Args:
+            series (np.ndarray): Código entero de la serie de cada fila (0..cantidad de series - 1).
+            periodos (np.ndarray): Periodo YYYYMM de cada fila. No debe repetirse (serie, periodo).
+            tn (np.ndarray): tn de cada fila.
+        """
+        meses = periodo_a_mes(periodos)
+        self.primer_mes = int(meses.min())
+        self.ultimo_mes = int(meses.max())
+        self.meses_relativos = meses - self.primer_mes
+        # Con un ancho igual a la cantidad de meses, una clave desplazada que cae en otra
+        # serie corresponde a un mes fuera de los datos (que de todos modos da NaN).
+        self.ancho = self.ultimo_mes - self.primer_mes + 1
+
+        orden = np.lexsort((self.meses_relativos, series))
+        self.orden = orden
+        self.series = np.asarray(series, dtype=np.int64)[orden]
+        self.meses_relativos = self.meses_relativos[orden]
+        self.tn = np.asarray(tn, dtype=np.float64)[orden]
+        self.claves = self.series * self.ancho + self.meses_relativos
+
+        # Primera fila de la serie de cada fila.
+        comienzo = np.r_[True, self.series[1:] != self.series[:-1]]
+        posiciones_comienzo = np.flatnonzero(comienzo)
+        self.inicio_serie = np.repeat(posiciones_comienzo, np.diff(np.r_[posiciones_comienzo, len(self.series)]))
+
+    def __len__(self):
+        return len(self.tn)
+
+    def valor_desplazado(self, desplazamiento):
+        """
+        tn de la misma serie `desplazamiento` meses después (negativo: antes) de cada fila.
+
+        Returns:
+            np.ndarray: tn desplazado; 0 si ese mes no tiene fila y NaN si cae fuera de los datos.
+        """
+        buscadas = self.claves + desplazamiento
+        posiciones = np.searchsorted(self.claves, buscadas)
+        posiciones_validas = np.minimum(posiciones, len(self.claves) - 1)
+        encontradas = self.claves[posiciones_validas] == buscadas
+        resultado = np.where(encontradas, self.tn[posiciones_validas], 0.0)
+        mes_buscado = self.meses_relativos + desplazamiento
+        resultado[(mes_buscado < 0) | (mes_buscado > self.ultimo_mes - self.primer_mes)] = np.nan
+        return resultado
+
+    def lag(self, k):
+        return self.valor_desplazado(-k)
+
+    def adelanto(self, k):
+        return self.valor_desplazado(k)
+
+    def _sumas_ventana(self, ventana, centro=None):
+        """
+        Suma de tn (o, con `centro`, de (tn - centro)²) en las filas de los `ventana` meses
+        que terminan en cada fila, cuántas filas se sumaron y cuántos meses de la ventana
+        están dentro de los datos.
+
+        Cada ventana tiene a lo sumo `ventana` filas, todas de su serie, y se suman
+        directamente: con sumas acumuladas de todo el panel, las series con tn chico
+        perderían precisión frente a las grandes.
+        """
+        # Las filas de la serie con mes <= mes - ventana quedan antes de `desde`.
+        desde = np.maximum(np.searchsorted(self.claves, self.claves - ventana, side='right'), self.inicio_serie)
+        filas = np.arange(1, len(self.claves) + 1) - desde
+        suma = np.zeros(len(self.claves))
+        for atras in range(min(ventana, len(self.claves))):
+            # Fila `atras` lugares antes de cada fila (desde la fila `atras`), si está en su ventana.
+            valores = self.tn[:len(self.tn) - atras]
+            if centro is not None:
+                valores = (valores - centro[atras:]) ** 2
+            suma[atras:] += np.where(filas[atras:] > atras, valores, 0.0)
+        meses = np.minimum(ventana, self.meses_relativos + 1)
+        return suma, filas, meses
+
+    def media_movil(self, ventana):
+        """
+        Media de tn en los últimos `ventana` meses (incluido el de la fila); los meses sin
+        fila cuentan como 0. Al principio de los datos se usan los meses disponibles.
+        """
+        suma, _, meses = self._sumas_ventana(ventana)
+        return suma / meses
+
+    def desvio_movil(self, ventana):
+        """
+        Desvío estándar (muestral) de tn en los últimos `ventana` meses, con el mismo
+        criterio que `media_movil`. NaN si la ventana tiene un solo mes.
+
+        Se calcula en dos pasadas (primero la media, después los desvíos respecto
+        de ella), sin la fórmula Σx² - (Σx)²/n, que cancela cifras.
+        """
+        suma, _, meses = self._sumas_ventana(ventana)
+        media = suma / meses
+        suma_cuadrados, filas, _ = self._sumas_ventana(ventana, centro=media)
+        # Los meses sin fila son tn = 0: cada uno aporta (0 - media)².
+        suma_cuadrados += (meses - filas) * media ** 2
+        with np.errstate(invalid='ignore', divide='ignore'):
+            desvio = np.sqrt(suma_cuadrados / (meses - 1))
+        desvio[meses < 2] = np.nan
+        return desvio
+
+
+def completar_meses_faltantes(series, periodos, tn):
+    """
+    Agrega filas con tn = 0 para los meses sin ventas de cada serie, desde su primer
+    mes con datos hasta el último mes de todo el panel.
+
+    Returns:
+        tuple: (series, periodos, tn) con una fila por serie y mes.
+    """
+    meses = periodo_a_mes(periodos)
+    ultimo_mes = meses.max()
+    cantidad_series = int(series.max()) + 1
+    primer_mes_serie = np.full(cantidad_series, ultimo_mes)
+    np.minimum.at(primer_mes_serie, series, meses)
+
+    largos = ultimo_mes - primer_mes_serie + 1
+    series_completas = np.repeat(np.arange(cantidad_series), largos)
+    # Mes de cada fila nueva: primer mes de su serie + posición dentro de la serie.
+    posicion_en_serie = np.arange(len(series_completas)) - np.repeat(np.cumsum(largos) - largos, largos)
+    meses_completos = primer_mes_serie[series_completas] + posicion_en_serie
+
+    ancho = ultimo_mes - meses.min() + 1
+    claves_existentes = series.astype(np.int64) * ancho + (meses - meses.min())
+    orden = np.argsort(claves_existentes)
+    claves_completas = series_completas.astype(np.int64) * ancho + (meses_completos - meses.min())
+    posiciones = np.searchsorted(claves_existentes[orden], claves_completas)
+    tn_completo = np.zeros(len(series_completas))
+    encontradas = posiciones < len(orden)
+    encontradas[encontradas] = claves_existentes[orden][posiciones[encontradas]] == claves_completas[encontradas]
+    tn_completo[encontradas] = np.asarray(tn, dtype=np.float64)[orden][posiciones[encontradas]]
+    return series_completas, mes_a_periodo(meses_completos), tn_completo
+
+
+def construir_features(df, nivel=nivel_panel, lags=lags, ventanas=ventanas, horizonte=horizonte,
+                       completar=completar_meses):
+    """
+    Calcula lags, medias y desvíos móviles, diferencias y el objetivo (tn en t + horizonte).
+
+    Args:
+        df (pd.DataFrame): Panel filtrado con 'periodo', 'tn' y las columnas del nivel.
+        nivel (str): Clave de `NIVELES_PANEL`.
+        lags (list): Meses hacia atrás para 'tn_lag_<k>' y 'tn_delta_<k>' (tn - tn_lag_<k>).
+        ventanas (list): Meses de las ventanas para 'tn_media_<w>' y 'tn_desvio_<w>'.
+        horizonte (int): Meses hacia adelante del objetivo.
+        completar (bool): Agregar filas con tn = 0 en los meses sin ventas de cada serie
+                          (ver `completar_meses_faltantes`), así todas las series tienen fila
+                          en el último periodo para predecir.
+
+    Returns:
+        pd.DataFrame: Una fila por serie y periodo, ordenado por serie y periodo. El objetivo
+                      es NaN cuando t + horizonte cae después del último periodo de los datos.
+    """
+    columnas_grupo = NIVELES_PANEL[nivel]
+    # Una fila por serie y periodo (sumando tn si hay filas repetidas).
+    agregado = df.groupby(columnas_grupo + ['periodo'], as_index=False, observed=True, sort=False)['tn'].sum()
+    series = agregado.groupby(columnas_grupo, sort=False, observed=True).ngroup().to_numpy()
+    # Valor de cada columna del nivel por serie, para volver a armarlas al final.
+    claves_series = {}
+    for col in columnas_grupo:
+        claves_series[col] = np.empty(series.max() + 1, dtype=agregado[col].dtype)
+        claves_series[col][series] = agregado[col].to_numpy()
+    periodos = agregado['periodo'].to_numpy()
+    tn = agregado['tn'].to_numpy()
+    if completar:
+        series, periodos, tn = completar_meses_faltantes(series, periodos, tn)
+
+    panel = PanelOrdenado(series, periodos, tn)
+    resultado = pd.DataFrame(
+        {col: claves_series[col][panel.series] for col in columnas_grupo})
+    resultado['periodo'] = np.asarray(periodos)[panel.orden].astype(np.int32)
+    resultado['tn'] = panel.tn.astype(np.float32)
+
+    features = {}
+    for k in lags:
+        lag = panel.lag(k)
+        features[f'tn_lag_{k}'] = lag
+        features[f'tn_delta_{k}'] = panel.tn - lag
+    for ventana in ventanas:
+        features[f'tn_media_{ventana}'] = panel.media_movil(ventana)
+        features[f'tn_desvio_{ventana}'] = panel.desvio_movil(ventana)
+    features[f'objetivo_t{horizonte}'] = panel.adelanto(horizonte)
+    for nombre, valores in features.items():
+        resultado[nombre] = valores.astype(np.float32)
+    return resultado
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calcula las features de pronóstico sobre el panel filtrado.')
+    parser.add_argument('--entrada', default=None, help='Archivo o dataset filtrado. Por defecto, la salida más reciente del filtrado.')
+    parser.add_argument('--salida', default=ruta_salida)
+    parser.add_argument('--nivel', choices=list(NIVELES_PANEL), default=nivel_panel)
+    parser.add_argument('--lags', type=int, nargs='+', default=lags)
+    parser.add_argument('--ventanas', type=int, nargs='+', default=ventanas)
+    parser.add_argument('--horizonte', type=int, default=horizonte)
+    parser.add_argument('--completar-meses', action='store_true', default=completar_meses)
+    args = parser.parse_args()
+
+    ruta_entrada = args.entrada or resolver_ruta_existente(ruta_entrada_sin_extension)
+    print(f"Cargando panel desde: {ruta_entrada}")
+    with medir_etapa('carga_panel') as etapa:
+        etapa.leido(ruta_entrada)
+        df = cargar_maestro(ruta_entrada, columnas=['periodo', 'product_id', 'customer_id', 'tn'])
+        etapa.salida(df)
+
+    with medir_etapa('features', nivel=args.nivel) as etapa:
+        etapa.entrada(df)
+        features = construir_features(df, args.nivel, args.lags, args.ventanas, args.horizonte, args.completar_meses)
+        etapa.salida(features)
+
+    with medir_etapa('guardado') as etapa:
+        guardar_dataframe_a_parquet(features, args.salida)
+        etapa.escrito(args.salida)
+
+    print(f"Features: {len(features)} filas, {len(features.columns)} columnas.")
+    print(features.head())
@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+import os
+import argparse
+
+# Genera archivos sintéticos con el mismo esquema que los de la asignatura, para medir
+# el rendimiento de los scripts con distintos tamaños (por ejemplo, de 1M a 50M filas):
+#   sell-in.txt              -> periodo, customer_id, product_id, plan_precios_cuidados,
+#                               cust_request_qty, cust_request_tn, tn (separado por tabs, ordenado por periodo)
+#   tb_productos.txt         -> cat1, cat2, cat3, brand, sku_size, product_id (con productos duplicados)
+#   productos_a_predecir.txt -> product_id
+# sell-in se escribe de a lotes, así que la memoria no depende de la cantidad de filas.
+
+# --- Configuración ---
+carpeta_salida = 'data/'
+filas = 1_000_000
+cantidad_productos = 1_000
+cantidad_clientes = 600
+primer_periodo = 201701
+cantidad_periodos = 36
+fraccion_duplicados = 0.01 # Productos que aparecen dos veces en tb_productos.txt
+fraccion_a_predecir = 0.6
+tamano_lote = 1_000_000
+semilla = 0
+
+PRIMER_PRODUCT_ID = 20001
+PRIMER_CUSTOMER_ID = 10001
+
+# Jerarquía de categorías: cat1 -> cat2 -> cat3.
+CATEGORIAS = {
+    'HC': {'ROPA LAVADO': ['Liquido', 'Polvo'], 'PISOS': ['Liquido', 'Aerosol'], 'VAJILLA': ['Liquido']},
+    'FOODS': {'SOPAS Y CALDOS': ['Caldos', 'Sopas'], 'ADEREZOS': ['Mayonesa', 'Ketchup'], 'TE': ['Saquitos']},
+    'PC': {'DEOS': ['Aerosol', 'Roll On'], 'PIEL1': ['Cremas'], 'CABELLO': ['Shampoo', 'Acondicionador']},
+    'REF': {'TE': ['Hebras'], 'JUGOS': ['Polvo']},
+}
+MARCAS = ['LIMPIEX', 'MAGGI', 'NIVEA', 'DOVE', 'ARIEL', 'ALA', 'KNORR', 'HELLMANNS', 'TANG', 'LIPTON']
+TAMANOS_SKU = [120, 150, 200, 250, 400, 500, 900, 1000, 1500, 3000]
+
+
+def periodos_consecutivos(primer_periodo, cantidad):
+    """
+    Lista de `cantidad` periodos YYYYMM consecutivos desde `primer_periodo`.
+    """
+    anio, mes = divmod(primer_periodo, 100)
+    indices = (anio * 12 + mes - 1) + np.arange(cantidad)
+    return (indices // 12) * 100 + indices % 12 + 1
+
+
+def clientes_necesarios(filas, cantidad_productos, cantidad_periodos, minimo=cantidad_clientes):
+    """
+    Clientes suficientes para generar `filas` sin repetir (cliente, producto) en un periodo
+    (se deja el doble de combinaciones posibles que de filas por periodo).
+    """
+    filas_por_periodo = -(-filas // cantidad_periodos)
+    return max(minimo, -(-2 * filas_por_periodo // cantidad_productos))
+
+
+def generar_productos(cantidad_productos, fraccion_duplicados, rng):
+    """
+    Genera tb_productos: una fila por producto más algunas filas repetidas.
+
+    Returns:
+        pd.DataFrame: Columnas cat1, cat2, cat3, brand, sku_size y product_id.
+    """
+    filas_productos = []
+    cat1_disponibles = list(CATEGORIAS)
+    for product_id in range(PRIMER_PRODUCT_ID, PRIMER_PRODUCT_ID + cantidad_productos):
+        cat1 = cat1_disponibles[rng.integers(len(cat1_disponibles))]
+        cat2_disponibles = list(CATEGORIAS[cat1])
+        cat2 = cat2_disponibles[rng.integers(len(cat2_disponibles))]
+        cat3_disponibles = CATEGORIAS[cat1][cat2]
+        cat3 = cat3_disponibles[rng.integers(len(cat3_disponibles))]
+        filas_productos.append((cat1, cat2, cat3, MARCAS[rng.integers(len(MARCAS))],
+                                TAMANOS_SKU[rng.integers(len(TAMANOS_SKU))], product_id))
+    productos = pd.DataFrame(filas_productos, columns=['cat1', 'cat2', 'cat3', 'brand', 'sku_size', 'product_id'])
+    # El archivo real tiene productos repetidos (filas idénticas).
+    duplicados = productos.sample(frac=fraccion_duplicados, random_state=int(rng.integers(2**31)))
+    return pd.concat([productos, duplicados]).sort_values('product_id', kind='stable').reset_index(drop=True)
+
+
+def generar_lote_sell_in(periodo, cantidad, cantidad_productos, cantidad_clientes, peso_producto, rng):
+    """
+    Genera `cantidad` filas de sell-in de un periodo, sin repetir (cliente, producto).
+    """
+    pares = rng.choice(cantidad_productos * cantidad_clientes, size=cantidad, replace=False)
+    producto, cliente = np.divmod(pares, cantidad_clientes)
+    # tn con cola larga y productos más vendidos que otros, como en los datos reales.
+    tn = rng.lognormal(mean=-2.0, sigma=1.5, size=cantidad) * peso_producto[producto]
+    return pd.DataFrame({
+        'periodo': np.full(cantidad, periodo, dtype=np.int32),
+        'customer_id': (PRIMER_CUSTOMER_ID + cliente).astype(np.int32),
+        'product_id': (PRIMER_PRODUCT_ID + producto).astype(np.int32),
+        'plan_precios_cuidados': (rng.random(cantidad) < 0.05).astype(np.int8),
+        'cust_request_qty': rng.integers(1, 20, size=cantidad, dtype=np.int32),
+        'cust_request_tn': tn * rng.uniform(1.0, 1.1, size=cantidad),
+        'tn': tn,
+    })
+
+
+def generar_sell_in(ruta_sell, filas, cantidad_productos, cantidad_clientes, periodos, rng, tamano_lote=1_000_000):
+    """
+    Escribe sell-in.txt periodo por periodo y de a `tamano_lote` filas.
+
+    Returns:
+        int: Cantidad de filas escritas.
+    """
+    filas_por_periodo = np.full(len(periodos), filas // len(periodos))
+    filas_por_periodo[:filas % len(periodos)] += 1
+    if filas_por_periodo.max() > cantidad_productos * cantidad_clientes:
+        raise ValueError(f"No alcanzan {cantidad_productos} productos x {cantidad_clientes} clientes para "
+                         f"{filas_por_periodo.max()} filas por periodo sin repetir (cliente, producto).")
+    peso_producto = rng.pareto(1.5, size=cantidad_productos) + 0.1
+
+    filas_escritas = 0
+    with open(ruta_sell, 'w', newline='') as archivo:
+        for periodo, filas_periodo in zip(periodos, filas_por_periodo):
+            lote = generar_lote_sell_in(int(periodo), int(filas_periodo), cantidad_productos, cantidad_clientes,
+                                        peso_producto, rng)
+            for inicio in range(0, len(lote), tamano_lote):
+                lote.iloc[inicio:inicio + tamano_lote].to_csv(archivo, sep='\t', index=False,
+                                                               header=filas_escritas == 0, float_format='%.5f')
+                filas_escritas += min(tamano_lote, len(lote) - inicio)
+    return filas_escritas
+
+
+def generar_datos(carpeta, filas=filas, cantidad_productos=cantidad_productos, cantidad_clientes=cantidad_clientes,
+                  primer_periodo=primer_periodo, cantidad_periodos=cantidad_periodos,
+                  fraccion_duplicados=fraccion_duplicados, fraccion_a_predecir=fraccion_a_predecir,
+                  tamano_lote=tamano_lote, semilla=semilla):
+    """
+    Genera sell-in.txt, tb_productos.txt y productos_a_predecir.txt en `carpeta`.
+
+    Con la misma semilla y los mismos parámetros, los archivos son siempre iguales.
+
+    Returns:
+        dict: Parámetros usados y filas de cada archivo.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    rng = np.random.default_rng(semilla)
+
+    productos = generar_productos(cantidad_productos, fraccion_duplicados, rng)
+    productos.to_csv(os.path.join(carpeta, 'tb_productos.txt'), sep='\t', index=False)
+
+    ids = np.arange(PRIMER_PRODUCT_ID, PRIMER_PRODUCT_ID + cantidad_productos)
+    a_predecir = np.sort(rng.choice(ids, size=max(1, int(cantidad_productos * fraccion_a_predecir)), replace=False))
+    pd.DataFrame({'product_id': a_predecir}).to_csv(os.path.join(carpeta, 'productos_a_predecir.txt'), index=False)
+
+    periodos = periodos_consecutivos(primer_periodo, cantidad_periodos)
+    filas_sell = generar_sell_in(os.path.join(carpeta, 'sell-in.txt'), filas, cantidad_productos, cantidad_clientes,
+                                 periodos, rng, tamano_lote)
+    return {
+        'filas': filas_sell,
+        'productos': cantidad_productos,
+        'filas_tb_productos': len(productos),
+        'productos_a_predecir': len(a_predecir),
+        'clientes': cantidad_clientes,
+        'periodos': [int(periodos[0]), int(periodos[-1])],
+        'semilla': semilla,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Genera datos sintéticos con el esquema de sell-in y tb_productos.')
+    parser.add_argument('--salida', default=carpeta_salida)
+    parser.add_argument('--filas', type=int, default=filas)
+    parser.add_argument('--productos', type=int, default=cantidad_productos)
+    parser.add_argument('--clientes', type=int, default=cantidad_clientes)
+    parser.add_argument('--primer-periodo', type=int, default=primer_periodo)
+    parser.add_argument('--periodos', type=int, default=cantidad_periodos)
+    parser.add_argument('--duplicados', type=float, default=fraccion_duplicados)
+    parser.add_argument('--a-predecir', type=float, default=fraccion_a_predecir)
+    parser.add_argument('--semilla', type=int, default=semilla)
+    args = parser.parse_args()
+
+    # Con muchas filas, se agregan clientes para no repetir (cliente, producto) en un periodo.
+    clientes = clientes_necesarios(args.filas, args.productos, args.periodos, minimo=args.clientes)
+    if clientes != args.clientes:
+        print(f"Se usan {clientes} clientes para generar {args.filas} filas.")
+
+    resumen = generar_datos(args.salida, args.filas, args.productos, clientes, args.primer_periodo, args.periodos,
+                            args.duplicados, args.a_predecir, semilla=args.semilla)
+    print(f"Datos sintéticos generados en '{args.salida}': {resumen}")
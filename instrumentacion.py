@@ -0,0 +1,256 @@
+import os
+import sys
+import json
+import time
+import numbers
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Registro por etapa (carga, deduplicado, merge, filtro, guardado, preparación del dashboard...):
+# tiempo, memoria máxima, filas de entrada y salida y bytes leídos y escritos.
+# Cada etapa terminada se guarda como una línea JSON en `ruta_registro` (si está definida)
+# y en memoria, para el panel de depuración del dashboard.
+#
+# Uso:
+#     with medir_etapa('carga_sell_in') as etapa:
+#         etapa.leido(ruta_sell)
+#         sell = pd.read_csv(ruta_sell, sep="\t")
+#         etapa.salida(sell)
+
+# --- Configuración ---
+# Archivo JSON lines donde se agregan los registros. Con None solo quedan en memoria.
+ruta_registro = os.environ.get('LAB3_REGISTRO_ETAPAS')
+maximo_registros_en_memoria = 1000
+# En Linux la memoria máxima (VmHWM) se reinicia al empezar cada etapa, pero el reinicio vale para
+# todo el proceso: en un servidor con varias sesiones a la vez (el dashboard) se pone en False,
+# y la memoria máxima queda como la del proceso. Cada etapa registra además cuánto cambió el RSS.
+reiniciar_memoria_pico = True
+
+registros = deque(maxlen=maximo_registros_en_memoria)
+
+_bloqueo_archivo = threading.Lock()
+_local = threading.local() # Etapas abiertas y colector de cada hilo (cada sesión de Streamlit corre en un hilo)
+
+
+def tamano_en_disco(ruta):
+    """
+    Bytes de un archivo o, si es una carpeta (dataset particionado), de todos sus archivos.
+    """
+    if os.path.isdir(ruta):
+        return sum(os.path.getsize(os.path.join(carpeta, nombre))
+                   for carpeta, _, nombres in os.walk(ruta) for nombre in nombres)
+    return os.path.getsize(ruta) if os.path.exists(ruta) else 0
+
+
+def cantidad_filas(datos):
+    """
+    Filas de un DataFrame o Series; los enteros se toman como una cantidad de filas.
+    """
+    return int(datos) if isinstance(datos, numbers.Integral) else len(datos)
+
+
+def _leer_memoria_pico():
+    """
+    Devuelve (memoria máxima en MB, alcance). En Linux se lee VmHWM, que se puede
+    reiniciar al empezar cada etapa ('etapa'); si no, es el máximo del proceso ('proceso').
+    """
+    try:
+        with open('/proc/self/status') as archivo:
+            for linea in archivo:
+                if linea.startswith('VmHWM:'):
+                    return int(linea.split()[1]) / 1024, 'etapa'
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    escala = 1024 * 1024 if sys.platform == 'darwin' else 1024 # ru_maxrss: KB en Linux, bytes en macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / escala, 'proceso'
+
+
+def _leer_memoria_actual():
+    """
+    Memoria residente (VmRSS) actual en MB, o None fuera de Linux.
+    """
+    try:
+        with open('/proc/self/status') as archivo:
+            for linea in archivo:
+                if linea.startswith('VmRSS:'):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reiniciar_memoria_pico():
+    """
+    Reinicia VmHWM (Linux). Devuelve False si no se pudo.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as archivo:
+            archivo.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class Etapa:
+    """
+    Mediciones de una etapa en curso; `medir_etapa` la crea y la registra al terminar.
+    """
+
+    def __init__(self, nombre, contexto):
+        self.nombre = nombre
+        self.contexto = contexto
+        self.filas_entrada = None
+        self.filas_salida = None
+        self.bytes_leidos = 0
+        self.bytes_escritos = 0
+        self.memoria_pico_mb = None
+        self.alcance_memoria = None
+        self.memoria_inicio_mb = None
+        self.delta_rss_mb = None
+        self.inicio = None
+
+    def entrada(self, datos):
+        self.filas_entrada = (self.filas_entrada or 0) + cantidad_filas(datos)
+
+    def salida(self, datos):
+        self.filas_salida = (self.filas_salida or 0) + cantidad_filas(datos)
+
+    def leido(self, ruta):
+        self.bytes_leidos += tamano_en_disco(ruta)
+
+    def escrito(self, ruta):
+        self.bytes_escritos += tamano_en_disco(ruta)
+
+    def _actualizar_memoria(self, memoria, alcance):
+        if memoria is not None and (self.memoria_pico_mb is None or memoria > self.memoria_pico_mb):
+            self.memoria_pico_mb = memoria
+        self.alcance_memoria = self.alcance_memoria or alcance
+
+
+def _etapas_abiertas():
+    if not hasattr(_local, 'etapas'):
+        _local.etapas = []
+    return _local.etapas
+
+
+def iniciar_etapa(nombre, **contexto):
+    """
+    Empieza a medir una etapa. Para código que no se puede envolver en un `with`
+    (por ejemplo, el script del dashboard); si no, conviene `medir_etapa`.
+
+    Returns:
+        Etapa: La etapa en curso, que se termina con `terminar_etapa`.
+    """
+    etapa = Etapa(nombre, contexto)
+    abiertas = _etapas_abiertas()
+    # La memoria máxima hasta ahora le corresponde a las etapas que ya estaban abiertas.
+    memoria, alcance = _leer_memoria_pico()
+    for abierta in abiertas:
+        abierta._actualizar_memoria(memoria, alcance)
+    etapa.alcance_memoria = alcance if reiniciar_memoria_pico and _reiniciar_memoria_pico() else 'proceso'
+    etapa.memoria_inicio_mb = _leer_memoria_actual()
+    abiertas.append(etapa)
+    etapa.inicio = time.perf_counter()
+    return etapa
+
+
+def terminar_etapa(etapa, error=None):
+    """
+    Termina de medir una etapa empezada con `iniciar_etapa` y la registra.
+
+    Returns:
+        dict: El registro de la etapa.
+    """
+    segundos = time.perf_counter() - etapa.inicio
+    memoria_fin = _leer_memoria_actual()
+    etapa.delta_rss_mb = None if memoria_fin is None or etapa.memoria_inicio_mb is None else memoria_fin - etapa.memoria_inicio_mb
+    abiertas = _etapas_abiertas()
+    if etapa in abiertas:
+        abiertas.remove(etapa)
+    memoria, _ = _leer_memoria_pico()
+    etapa._actualizar_memoria(memoria, None)
+    for abierta in abiertas:
+        abierta._actualizar_memoria(etapa.memoria_pico_mb, None)
+    return _registrar(etapa, segundos, error)
+
+
+@contextmanager
+def medir_etapa(nombre, **contexto):
+    """
+    Mide una etapa: tiempo, memoria máxima y lo que se anote en la `Etapa` que devuelve.
+
+    Las etapas se pueden anidar (la memoria máxima de una etapa incluye la de sus
+    etapas internas). Si la etapa termina con un error, se registra igual y el error sigue.
+    Con `reiniciar_memoria_pico` en False (el dashboard) la memoria máxima es la del proceso;
+    la variación del RSS de la etapa (`delta_rss_mb`) no depende de reinicios, pero con varias
+    etapas en paralelo (varias sesiones) también incluye la memoria de las otras.
+
+    Args:
+        nombre (str): Nombre de la etapa, por ejemplo 'carga_sell_in'.
+        **contexto: Datos adicionales para el registro (modo, ruta, etc.).
+    """
+    etapa = iniciar_etapa(nombre, **contexto)
+    error = None
+    try:
+        yield etapa
+    except BaseException as excepcion:
+        error = repr(excepcion)
+        raise
+    finally:
+        terminar_etapa(etapa, error)
+
+
+def _registrar(etapa, segundos, error):
+    registro = {
+        'momento': pd.Timestamp.now().isoformat(timespec='milliseconds'),
+        'etapa': etapa.nombre,
+        'segundos': round(segundos, 4),
+        'memoria_pico_mb': None if etapa.memoria_pico_mb is None else round(etapa.memoria_pico_mb, 1),
+        'alcance_memoria': etapa.alcance_memoria,
+        'delta_rss_mb': None if etapa.delta_rss_mb is None else round(etapa.delta_rss_mb, 1),
+        'filas_entrada': etapa.filas_entrada,
+        'filas_salida': etapa.filas_salida,
+        'bytes_leidos': etapa.bytes_leidos,
+        'bytes_escritos': etapa.bytes_escritos,
+        'pid': os.getpid(),
+        **etapa.contexto,
+    }
+    if error is not None:
+        registro['error'] = error
+    registros.append(registro)
+    colector = getattr(_local, 'colector', None)
+    if colector is not None:
+        colector.append(registro)
+    if ruta_registro:
+        linea = json.dumps(registro, ensure_ascii=False, default=str)
+        with _bloqueo_archivo, open(ruta_registro, 'a', encoding='utf-8') as archivo:
+            archivo.write(linea + '\n')
+    return registro
+
+
+def iniciar_coleccion():
+    """
+    Empieza a juntar, en una lista nueva, los registros de las etapas de este hilo.
+
+    El dashboard la llama al principio de cada ejecución del script para mostrar solo
+    las etapas de esa ejecución, aunque haya otras sesiones abiertas.
+
+    Returns:
+        list: La lista donde se van agregando los registros.
+    """
+    _local.colector = []
+    return _local.colector
+
+
+def leer_registro(ruta=None):
+    """
+    Carga un archivo de registros (JSON lines) como DataFrame, para analizarlo.
+    """
+    return pd.read_json(ruta or ruta_registro, lines=True)
@@ -0,0 +1,499 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# --- Esquema compacto del archivo maestro ---
+# Tipos usados al guardar en formato columnar (Parquet/Arrow). Las columnas
+# categóricas se guardan como columnas "dictionary" de Arrow: cada valor
+# distinto se guarda una sola vez y las filas solo llevan su código entero.
+TIPOS_ENTEROS = {
+    'periodo': 'int32',
+    'customer_id': 'int32',
+    'product_id': 'int32',
+    'plan_precios_cuidados': 'int8',
+    'cust_request_qty': 'int32',
+    'sku_size': 'int32',
+}
+TIPOS_FLOTANTES = {
+    'tn': 'float32',
+    'cust_request_tn': 'float32',
+}
+COLUMNAS_CATEGORICAS = ['cat1', 'cat2', 'cat3', 'brand']
+# Atributos de cada producto (los mismos para todas sus filas), que el cubo y el tensor guardan por product_id.
+COLUMNAS_ATRIBUTOS_PRODUCTO = ['cat1', 'cat2', 'cat3', 'brand', 'sku_size']
+
+EXTENSION_PARQUET = '.parquet'
+EXTENSION_CSV = '.csv'
+CODIFICACION_CSV = 'latin1'
+
+# Los datasets particionados (estilo Hive: periodo=YYYYMM/) guardan sus metadatos
+# en archivos que empiezan con '_', que los lectores de Arrow ignoran.
+NOMBRE_MANIFIESTO = '_manifiesto.json'
+
+
+def compactar_tipos(dataframe):
+    """
+    Convierte las columnas conocidas del archivo maestro a tipos compactos.
+
+    Los enteros pasan a int32/int8 (o float32 si tienen valores faltantes, por
+    ejemplo tras un merge 'left' sin coincidencia), los flotantes a float32 y
+    cat1/cat2/cat3/brand a 'category'. Las columnas desconocidas no se tocan.
+
+    Args:
+        dataframe (pd.DataFrame): El DataFrame a convertir (se modifica en el lugar).
+
+    Returns:
+        pd.DataFrame: El mismo DataFrame con los tipos compactos.
+    """
+    for col, tipo in TIPOS_ENTEROS.items():
+        if col in dataframe.columns and dataframe[col].dtype != tipo:
+            if dataframe[col].isna().any():
+                tipo = 'float32'
+            if dataframe[col].dtype != tipo:
+                dataframe[col] = dataframe[col].astype(tipo)
+    for col, tipo in TIPOS_FLOTANTES.items():
+        if col in dataframe.columns and dataframe[col].dtype != tipo:
+            dataframe[col] = dataframe[col].astype(tipo)
+    for col in COLUMNAS_CATEGORICAS:
+        if col in dataframe.columns and not isinstance(dataframe[col].dtype, pd.CategoricalDtype):
+            dataframe[col] = dataframe[col].astype('category')
+    return dataframe
+
+
+def tipos_lectura_csv(columnas=None):
+    """
+    Devuelve el mapeo de tipos para pasar como `dtype` a `pd.read_csv`, de modo
+    que las columnas numéricas se parseen directamente con el tipo compacto.
+
+    Args:
+        columnas (list, optional): Si se indica, solo se incluyen estas columnas.
+
+    Returns:
+        dict: Mapeo columna -> tipo.
+    """
+    tipos = {**TIPOS_ENTEROS, **TIPOS_FLOTANTES}
+    # sku_size puede venir vacío en tb_productos; se convierte luego en compactar_tipos.
+    tipos.pop('sku_size')
+    if columnas is not None:
+        tipos = {col: tipo for col, tipo in tipos.items() if col in columnas}
+    return tipos
+
+
+def guardar_dataframe_a_parquet(dataframe, nombre_archivo_parquet, compresion='snappy'):
+    """
+    Guarda un DataFrame de Pandas en un archivo Parquet con tipos compactos.
+
+    Args:
+        dataframe (pd.DataFrame): El DataFrame que quieres guardar.
+        nombre_archivo_parquet (str): El nombre (y ruta, si es necesario) del archivo Parquet a crear.
+        compresion (str, optional): Códec de compresión de Parquet. Por defecto es 'snappy'.
+    """
+    try:
+        directorio_salida = os.path.dirname(nombre_archivo_parquet)
+        if directorio_salida and not os.path.exists(directorio_salida):
+            os.makedirs(directorio_salida)
+            print(f"Directorio creado: {directorio_salida}")
+
+        compactar_tipos(dataframe)
+        dataframe.to_parquet(nombre_archivo_parquet, engine='pyarrow', index=False, compression=compresion)
+        print(f"DataFrame guardado exitosamente como '{nombre_archivo_parquet}'")
+    except Exception as e:
+        print(f"Ocurrió un error al guardar el DataFrame como Parquet: {e}")
+
+
+def ruta_con_formato(ruta_sin_extension, formato):
+    """
+    Arma la ruta de salida según el formato elegido ('parquet' o 'csv').
+    """
+    if formato == 'parquet':
+        return ruta_sin_extension + EXTENSION_PARQUET
+    if formato == 'csv':
+        return ruta_sin_extension + EXTENSION_CSV
+    raise ValueError(f"Formato desconocido: '{formato}'. Usa 'parquet' o 'csv'.")
+
+
+def resolver_ruta_existente(ruta_sin_extension):
+    """
+    Busca la salida más reciente de un paso: el archivo Parquet, el dataset
+    particionado (una carpeta con el mismo nombre, sin extensión) o el CSV.
+
+    Returns:
+        str: La ruta encontrada. Si no existe ninguna, devuelve la ruta CSV
+             (para que el error posterior muestre el nombre histórico).
+    """
+    candidatos = []
+    for ruta in (ruta_sin_extension + EXTENSION_PARQUET, ruta_sin_extension, ruta_sin_extension + EXTENSION_CSV):
+        if es_dataset_particionado(ruta):
+            candidatos.append((os.path.getmtime(os.path.join(ruta, NOMBRE_MANIFIESTO)), ruta))
+        elif os.path.isfile(ruta):
+            candidatos.append((os.path.getmtime(ruta), ruta))
+    if not candidatos:
+        return ruta_sin_extension + EXTENSION_CSV
+    return max(candidatos)[1]
+
+
+def filtro_productos(product_ids):
+    """
+    Arma la expresión de Arrow 'product_id in product_ids' para filtrar al leer.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    return ds.field('product_id').isin(pa.array(sorted(int(p) for p in product_ids), type=pa.int32()))
+
+
+def marca_modificacion(ruta):
+    """
+    Fecha de modificación de una salida (del manifiesto si es un dataset particionado).
+
+    Sirve como parte de la clave de los cachés, para que se invaliden cuando se
+    vuelve a generar el archivo.
+    """
+    if es_dataset_particionado(ruta):
+        return os.path.getmtime(os.path.join(ruta, NOMBRE_MANIFIESTO))
+    return os.path.getmtime(ruta) if os.path.exists(ruta) else None
+
+
+def esta_al_dia(ruta_derivada, ruta_entrada):
+    """
+    True si una salida derivada (cubo, tensor...) es posterior a la entrada con la que se
+    construye, comparando sus fechas de modificación como `resolver_ruta_existente`.
+    Si la entrada no existe, la derivada es lo único que hay y se considera al día.
+    """
+    marca_entrada = marca_modificacion(ruta_entrada)
+    marca_derivada = marca_modificacion(ruta_derivada)
+    return marca_entrada is None or (marca_derivada is not None and marca_derivada >= marca_entrada)
+
+
+def periodo_a_mes(periodo):
+    """
+    Convierte periodos YYYYMM en un número de mes consecutivo (año * 12 + mes - 1),
+    así 201812 y 201901 quedan a distancia 1.
+    """
+    periodo = np.asarray(periodo, dtype=np.int64)
+    return (periodo // 100) * 12 + periodo % 100 - 1
+
+
+def mes_a_periodo(mes):
+    """
+    Inversa de `periodo_a_mes`.
+    """
+    mes = np.asarray(mes, dtype=np.int64)
+    return ((mes // 12) * 100 + mes % 12 + 1).astype(np.int32)
+
+
+def filtro_periodos(periodos):
+    """
+    Arma la expresión de Arrow 'desde <= periodo <= hasta' para filtrar al leer.
+
+    En un dataset particionado, Arrow la resuelve con los nombres de las carpetas
+    (periodo=YYYYMM/) y directamente no abre las particiones fuera del rango.
+
+    Args:
+        periodos (tuple): (desde, hasta) en formato YYYYMM; cualquiera de los dos puede ser None.
+    """
+    import pyarrow.dataset as ds
+
+    desde, hasta = periodos
+    filtro = None
+    if desde is not None:
+        filtro = ds.field('periodo') >= int(desde)
+    if hasta is not None:
+        condicion = ds.field('periodo') <= int(hasta)
+        filtro = condicion if filtro is None else filtro & condicion
+    return filtro
+
+
+def filtro_lectura(product_ids=None, periodos=None):
+    """
+    Combina los filtros por productos y por rango de periodos (None si no hay ninguno).
+    """
+    filtros = []
+    if product_ids is not None:
+        filtros.append(filtro_productos(product_ids))
+    if periodos is not None and filtro_periodos(periodos) is not None:
+        filtros.append(filtro_periodos(periodos))
+    filtro = None
+    for condicion in filtros:
+        filtro = condicion if filtro is None else filtro & condicion
+    return filtro
+
+
+def filtrar_lote(lote, product_ids=None, periodos=None):
+    """
+    Aplica a un lote de un CSV los mismos filtros que `filtro_lectura` aplica al leer Parquet.
+    """
+    mascara = np.ones(len(lote), dtype=bool)
+    if product_ids is not None:
+        mascara &= lote['product_id'].isin(product_ids).to_numpy()
+    if periodos is not None:
+        desde, hasta = periodos
+        if desde is not None:
+            mascara &= (lote['periodo'] >= int(desde)).to_numpy()
+        if hasta is not None:
+            mascara &= (lote['periodo'] <= int(hasta)).to_numpy()
+    return lote[mascara]
+
+
+def cargar_maestro(ruta_archivo, columnas=None, product_ids=None, tamano_lote=1_000_000, periodos=None):
+    """
+    Carga el archivo maestro (o uno filtrado) desde Parquet o CSV con tipos compactos.
+
+    Los CSV son los que generan los scripts con `incluir_indice=True` y
+    codificación latin1, así que la primera columna se toma como índice.
+
+    Args:
+        ruta_archivo (str): Ruta al archivo '.parquet', '.csv' o a un dataset particionado.
+        columnas (list, optional): Columnas a leer. En Parquet solo se leen esas columnas del disco.
+        product_ids (iterable, optional): Si se indica, solo se cargan las filas de esos productos
+                                          (enteros). En Parquet el filtro se aplica al leer; en CSV
+                                          se lee de a `tamano_lote` filas y se filtra cada lote, así
+                                          las filas de otros productos nunca se acumulan en memoria.
+        tamano_lote (int, optional): Filas por lote al filtrar un CSV.
+        periodos (tuple, optional): (desde, hasta) en formato YYYYMM, inclusive. En un dataset
+                                    particionado solo se leen las particiones de ese rango.
+
+    Returns:
+        pd.DataFrame: El DataFrame con tipos compactos.
+    """
+    filtro = filtro_lectura(product_ids, periodos)
+    if es_dataset_particionado(ruta_archivo):
+        df = cargar_dataset_particionado(ruta_archivo, columnas=columnas, filtro=filtro)
+    elif ruta_archivo.endswith(EXTENSION_PARQUET):
+        if filtro is None:
+            df = pd.read_parquet(ruta_archivo, engine='pyarrow', columns=columnas)
+        else:
+            import pyarrow.dataset as ds
+
+            dataset = ds.dataset(ruta_archivo, format='parquet')
+            df = dataset.to_table(columns=columnas, filter=filtro).to_pandas()
+    else:
+        usecols = None
+        if columnas is not None:
+            # La columna del índice no tiene nombre en el encabezado del CSV.
+            usecols = lambda col: col in columnas or col.startswith('Unnamed') or col == ''
+        if filtro is None:
+            df = pd.read_csv(ruta_archivo, index_col=0, encoding=CODIFICACION_CSV,
+                             dtype=tipos_lectura_csv(), usecols=usecols)
+        else:
+            ids = None if product_ids is None else np.array(sorted(int(p) for p in product_ids), dtype='int32')
+            lector = pd.read_csv(ruta_archivo, index_col=0, encoding=CODIFICACION_CSV,
+                                 dtype=tipos_lectura_csv(), usecols=usecols, chunksize=tamano_lote)
+            df = pd.concat([filtrar_lote(lote, ids, periodos) for lote in lector])
+    return compactar_tipos(df)
+
+
+def esquema_arrow(dataframe):
+    """
+    Arma el esquema de Arrow para un DataFrame del maestro.
+
+    Las columnas enteras conocidas se declaran con su tipo entero aunque en este
+    DataFrame hayan quedado como float32 por valores faltantes: en Arrow/Parquet
+    un entero admite nulos, y así todos los lotes comparten el mismo esquema.
+    """
+    import pyarrow as pa
+
+    esquema = pa.Schema.from_pandas(dataframe, preserve_index=False)
+    for i, campo in enumerate(esquema):
+        if campo.name in TIPOS_ENTEROS:
+            esquema = esquema.set(i, pa.field(campo.name, pa.from_numpy_dtype(TIPOS_ENTEROS[campo.name])))
+    return esquema.remove_metadata()
+
+
+class EscritorPorLotes:
+    """
+    Escribe un archivo maestro lote a lote, sin tener todo el DataFrame en memoria.
+
+    En Parquet cada lote se escribe como un row group del mismo archivo; en CSV
+    se agrega al final (latin1, con índice), igual que `guardar_dataframe_a_csv`.
+
+    Uso:
+        with EscritorPorLotes('archivos_maestros/archivo_maestro.parquet', 'parquet') as escritor:
+            for lote in lotes:
+                escritor.escribir(lote)
+    """
+
+    def __init__(self, ruta_archivo, formato, compresion='snappy'):
+        self.ruta_archivo = ruta_archivo
+        self.formato = formato
+        self.compresion = compresion
+        self.filas_escritas = 0
+        self._escritor_parquet = None
+        self._esquema = None
+
+        directorio_salida = os.path.dirname(ruta_archivo)
+        if directorio_salida and not os.path.exists(directorio_salida):
+            os.makedirs(directorio_salida)
+            print(f"Directorio creado: {directorio_salida}")
+
+    def escribir(self, lote):
+        compactar_tipos(lote)
+        if self.formato == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            if self._escritor_parquet is None:
+                self._esquema = esquema_arrow(lote)
+                self._escritor_parquet = pq.ParquetWriter(self.ruta_archivo, self._esquema, compression=self.compresion)
+            tabla = pa.Table.from_pandas(lote, schema=self._esquema, preserve_index=False)
+            self._escritor_parquet.write_table(tabla)
+        else:
+            lote.to_csv(self.ruta_archivo, index=True, encoding=CODIFICACION_CSV,
+                        mode='w' if self.filas_escritas == 0 else 'a', header=self.filas_escritas == 0)
+        self.filas_escritas += len(lote)
+
+    def cerrar(self):
+        if self._escritor_parquet is not None:
+            self._escritor_parquet.close()
+            self._escritor_parquet = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo_error, error, traza):
+        self.cerrar()
+        return False
+
+
+# --- Datasets particionados por periodo (periodo=YYYYMM/) ---
+
+def es_dataset_particionado(ruta):
+    """
+    Indica si `ruta` es una carpeta de dataset particionado (tiene manifiesto).
+    """
+    return os.path.isdir(ruta) and os.path.exists(os.path.join(ruta, NOMBRE_MANIFIESTO))
+
+
+def ruta_particion(ruta_dataset, periodo):
+    """
+    Devuelve la carpeta de la partición de un periodo: '<ruta_dataset>/periodo=YYYYMM'.
+    """
+    return os.path.join(ruta_dataset, f'periodo={int(periodo)}')
+
+
+def leer_manifiesto(ruta_dataset):
+    """
+    Lee el manifiesto de un dataset particionado.
+
+    Returns:
+        dict: El manifiesto, o uno vacío si el dataset todavía no existe.
+    """
+    ruta = os.path.join(ruta_dataset, NOMBRE_MANIFIESTO)
+    if not os.path.exists(ruta):
+        return {'revision': 0, 'marca_agua': None, 'periodos': {}}
+    with open(ruta, encoding='utf-8') as archivo:
+        return json.load(archivo)
+
+
+def guardar_manifiesto(ruta_dataset, manifiesto):
+    """
+    Guarda el manifiesto de forma atómica (archivo temporal + reemplazo), para que
+    una corrida interrumpida nunca deje un manifiesto a medio escribir.
+    """
+    os.makedirs(ruta_dataset, exist_ok=True)
+    ruta = os.path.join(ruta_dataset, NOMBRE_MANIFIESTO)
+    with open(ruta + '.tmp', 'w', encoding='utf-8') as archivo:
+        json.dump(manifiesto, archivo, indent=2, sort_keys=True)
+    os.replace(ruta + '.tmp', ruta)
+
+
+def vaciar_particion(ruta_dataset, periodo):
+    """
+    Borra los archivos de la partición de un periodo y deja la carpeta vacía.
+    """
+    carpeta = ruta_particion(ruta_dataset, periodo)
+    if os.path.exists(carpeta):
+        shutil.rmtree(carpeta)
+    os.makedirs(carpeta)
+
+
+def eliminar_particion(ruta_dataset, periodo):
+    """
+    Borra la partición de un periodo (por ejemplo, si el periodo ya no está en sell-in).
+    """
+    carpeta = ruta_particion(ruta_dataset, periodo)
+    if os.path.exists(carpeta):
+        shutil.rmtree(carpeta)
+
+
+def archivos_particion(ruta_dataset, periodo):
+    """
+    Lista los archivos Parquet de la partición de un periodo, ordenados por nombre.
+    """
+    carpeta = ruta_particion(ruta_dataset, periodo)
+    if not os.path.isdir(carpeta):
+        return []
+    return [os.path.join(carpeta, nombre) for nombre in sorted(os.listdir(carpeta))
+            if nombre.endswith(EXTENSION_PARQUET)]
+
+
+def periodos_dataset(ruta_dataset):
+    """
+    Periodos (enteros, ordenados) de un dataset particionado, según su manifiesto
+    o, si no tiene, según sus carpetas 'periodo=YYYYMM'.
+    """
+    periodos = leer_manifiesto(ruta_dataset)['periodos']
+    if periodos:
+        return sorted(int(periodo) for periodo in periodos)
+    return sorted(int(nombre.split('=', 1)[1]) for nombre in os.listdir(ruta_dataset)
+                  if nombre.startswith('periodo='))
+
+
+def escribir_parte_particion(dataframe, ruta_dataset, periodo, nombre_parte):
+    """
+    Escribe un archivo Parquet dentro de la partición de un periodo.
+
+    La columna 'periodo' no se guarda en el archivo: la define la carpeta.
+    El archivo se escribe con nombre temporal y luego se renombra, así un lector
+    nunca ve un archivo a medio escribir.
+    """
+    carpeta = ruta_particion(ruta_dataset, periodo)
+    os.makedirs(carpeta, exist_ok=True)
+    ruta = os.path.join(carpeta, nombre_parte + EXTENSION_PARQUET)
+    datos = compactar_tipos(dataframe.drop(columns=['periodo'], errors='ignore'))
+    datos.to_parquet(ruta + '.tmp', engine='pyarrow', index=False)
+    os.replace(ruta + '.tmp', ruta)
+    return ruta
+
+
+def cargar_dataset_particionado(ruta_dataset, columnas=None, filtro=None):
+    """
+    Carga un dataset particionado por periodo como un único DataFrame.
+
+    Args:
+        ruta_dataset (str): Carpeta del dataset.
+        columnas (list, optional): Columnas a leer ('periodo' incluida si se pide).
+        filtro (pyarrow.compute.Expression, optional): Filtro que se aplica al leer.
+
+    Returns:
+        pd.DataFrame: El DataFrame con tipos compactos y 'periodo' como primera columna.
+    """
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(ruta_dataset, format='parquet', partitioning='hive')
+    df = dataset.to_table(columns=columnas, filter=filtro).to_pandas()
+    if 'periodo' in df.columns:
+        df = df[['periodo'] + [col for col in df.columns if col != 'periodo']]
+    return compactar_tipos(df)
+
+
+def checksums_por_periodo(lote):
+    """
+    Calcula, para cada periodo de un lote, la cantidad de filas y una suma de
+    hashes de las filas.
+
+    La suma (módulo 2**64) no depende del orden de las filas ni de cómo se
+    partió el archivo en lotes, así que se puede acumular lote a lote.
+
+    Returns:
+        dict: periodo (int) -> (filas (int), suma_hashes (np.uint64)).
+    """
+    hashes = pd.util.hash_pandas_object(lote, index=False).to_numpy()
+    codigos, periodos = pd.factorize(lote['periodo'])
+    sumas = np.zeros(len(periodos), dtype=np.uint64)
+    np.add.at(sumas, codigos, hashes)
+    filas = np.bincount(codigos, minlength=len(periodos))
+    return {int(p): (int(n), s) for p, n, s in zip(periodos, filas, sumas)}
@@ -0,0 +1,210 @@
+import numpy as np
+import pandas as pd
+import os
+import json
+import argparse
+
+from io_maestro import cargar_maestro, mes_a_periodo, periodo_a_mes, resolver_ruta_existente
+from instrumentacion import medir_etapa
+
+# --- Configuración ---
+# Entrada: la salida de a_m_filtrado_prod_a_pred.py (Parquet, dataset particionado o CSV).
+ruta_entrada_sin_extension = 'archivos_maestros/a_m_filtrado_prod_a_pred'
+carpeta_panel = 'archivos_maestros/panel'
+
+NOMBRE_INDICE_PANEL = '_panel.json'
+NOMBRE_CELDAS_PANEL = 'celdas.parquet'
+
+
+def posiciones_de_rangos(inicios, fines):
+    """
+    Concatena los rangos [inicio, fin) en un solo arreglo de posiciones, sin recorrerlos en Python.
+    """
+    largos = fines - inicios
+    desplazamientos = np.repeat(inicios - (np.cumsum(largos) - largos), largos)
+    return desplazamientos + np.arange(largos.sum())
+
+
+class PanelDisperso:
+    """
+    Panel producto x cliente x periodo de tn, guardado solo en las celdas con ventas.
+
+    Productos, clientes y periodos se representan con códigos enteros: los productos
+    y clientes por su posición en los diccionarios ordenados `product_ids` y
+    `customer_ids`, y los periodos por su posición en el calendario completo de meses
+    (sin huecos) entre el primer y el último periodo. Las celdas están ordenadas por
+    (producto, cliente, periodo) con un puntero por producto (como un CSR), y hay una
+    permutación ordenada por cliente con su propio puntero, así que las celdas de un
+    producto o de un cliente son un rango contiguo.
+
+    Las vistas densas (`vista`, `serie`) se arman solo para el recorte pedido y los
+    meses sin ventas quedan en 0; nunca se construye la grilla completa.
+
+    Uso:
+        panel = PanelDisperso.desde_dataframe(df)
+        matriz = panel.vista(product_id=20001)      # clientes x periodos, con ceros
+        total = panel.serie(customer_ids=[10001])   # tn por periodo, con ceros
+    """
+
+    def __init__(self, product_ids, customer_ids, periodos, codigo_producto, codigo_cliente, indice_periodo, tn):
+        self.product_ids = np.asarray(product_ids)
+        self.customer_ids = np.asarray(customer_ids)
+        self.periodos = np.asarray(periodos, dtype=np.int32)
+
+        orden = np.lexsort((indice_periodo, codigo_cliente, codigo_producto))
+        self.codigo_producto = np.asarray(codigo_producto, dtype=np.int32)[orden]
+        self.codigo_cliente = np.asarray(codigo_cliente, dtype=np.int32)[orden]
+        self.indice_periodo = np.asarray(indice_periodo, dtype=np.int16)[orden]
+        self.tn = np.asarray(tn, dtype=np.float32)[orden]
+
+        self.puntero_producto = np.searchsorted(self.codigo_producto, np.arange(len(self.product_ids) + 1))
+        self.orden_cliente = np.argsort(self.codigo_cliente, kind='stable')
+        self.puntero_cliente = np.searchsorted(self.codigo_cliente[self.orden_cliente],
+                                               np.arange(len(self.customer_ids) + 1))
+
+    @classmethod
+    def desde_dataframe(cls, df):
+        """
+        Construye el panel a partir de filas con 'product_id', 'customer_id', 'periodo' y 'tn'
+        (sumando tn si hay filas repetidas).
+        """
+        agregado = df.groupby(['product_id', 'customer_id', 'periodo'], as_index=False, observed=True)['tn'].sum()
+        codigo_producto, product_ids = pd.factorize(agregado['product_id'], sort=True)
+        codigo_cliente, customer_ids = pd.factorize(agregado['customer_id'], sort=True)
+        meses = periodo_a_mes(agregado['periodo'].to_numpy())
+        periodos = mes_a_periodo(np.arange(meses.min(), meses.max() + 1))
+        return cls(np.asarray(product_ids), np.asarray(customer_ids), periodos,
+                   codigo_producto, codigo_cliente, meses - meses.min(), agregado['tn'].to_numpy())
+
+    def __len__(self):
+        return len(self.tn)
+
+    def _codigos(self, diccionario, valores):
+        """
+        Códigos de los `valores` que están en el diccionario (los demás se ignoran).
+        """
+        valores = np.atleast_1d(np.asarray(valores))
+        posiciones = np.searchsorted(diccionario, valores)
+        posiciones = np.minimum(posiciones, len(diccionario) - 1)
+        return np.unique(posiciones[diccionario[posiciones] == valores])
+
+    def _rango_periodos(self, desde=None, hasta=None):
+        inicio = 0 if desde is None else int(np.searchsorted(self.periodos, int(desde), side='left'))
+        fin = len(self.periodos) if hasta is None else int(np.searchsorted(self.periodos, int(hasta), side='right'))
+        return inicio, fin
+
+    def celdas(self, product_ids=None, customer_ids=None):
+        """
+        Posiciones de las celdas con ventas de esos productos y clientes (None: todos).
+
+        Solo se recorren los rangos de los productos (o, si no se indican productos,
+        de los clientes) pedidos.
+        """
+        if product_ids is not None:
+            codigos = self._codigos(self.product_ids, product_ids)
+            posiciones = posiciones_de_rangos(self.puntero_producto[codigos], self.puntero_producto[codigos + 1])
+            if customer_ids is not None:
+                clientes = self._codigos(self.customer_ids, customer_ids)
+                posiciones = posiciones[np.isin(self.codigo_cliente[posiciones], clientes)]
+            return posiciones
+        if customer_ids is not None:
+            codigos = self._codigos(self.customer_ids, customer_ids)
+            rangos = posiciones_de_rangos(self.puntero_cliente[codigos], self.puntero_cliente[codigos + 1])
+            return np.sort(self.orden_cliente[rangos])
+        return np.arange(len(self.tn))
+
+    def vista(self, product_id=None, customer_id=None, desde=None, hasta=None):
+        """
+        Vista densa, con ceros en los meses sin ventas, de un producto o de un cliente.
+
+        Args:
+            product_id, customer_id (optional): El recorte. Con un producto, las filas son sus
+                                                clientes; con un cliente, sus productos. Con ambos,
+                                                una sola fila.
+            desde, hasta (int, optional): Periodos YYYYMM (inclusive) de las columnas.
+
+        Returns:
+            pd.DataFrame: Filas = clientes o productos con alguna venta en el recorte,
+                          columnas = todos los periodos del rango, valores = tn.
+        """
+        if product_id is None and customer_id is None:
+            raise ValueError("La vista densa necesita un product_id o un customer_id.")
+        posiciones = self.celdas(None if product_id is None else [product_id],
+                                 None if customer_id is None else [customer_id])
+        inicio, fin = self._rango_periodos(desde, hasta)
+        periodos = self.indice_periodo[posiciones].astype(np.intp)
+        en_rango = (periodos >= inicio) & (periodos < fin)
+        posiciones, periodos = posiciones[en_rango], periodos[en_rango] - inicio
+
+        if product_id is not None and customer_id is None:
+            codigos, diccionario, nombre = self.codigo_cliente[posiciones], self.customer_ids, 'customer_id'
+        else:
+            codigos, diccionario, nombre = self.codigo_producto[posiciones], self.product_ids, 'product_id'
+        filas, fila_de_celda = np.unique(codigos, return_inverse=True)
+        matriz = np.zeros((len(filas), fin - inicio), dtype=np.float32)
+        np.add.at(matriz, (fila_de_celda, periodos), self.tn[posiciones])
+        return pd.DataFrame(matriz, index=pd.Index(diccionario[filas], name=nombre),
+                            columns=pd.Index(self.periodos[inicio:fin], name='periodo'))
+
+    def serie(self, product_ids=None, customer_ids=None, desde=None, hasta=None):
+        """
+        tn total por periodo de esos productos y clientes (None: todos), con ceros en los
+        meses sin ventas.
+
+        Returns:
+            pd.Series: Índice = todos los periodos del rango.
+        """
+        posiciones = self.celdas(product_ids, customer_ids)
+        inicio, fin = self._rango_periodos(desde, hasta)
+        periodos = self.indice_periodo[posiciones].astype(np.intp)
+        en_rango = (periodos >= inicio) & (periodos < fin)
+        totales = np.bincount(periodos[en_rango] - inicio, weights=self.tn[posiciones][en_rango], minlength=fin - inicio)
+        return pd.Series(totales, index=pd.Index(self.periodos[inicio:fin], name='periodo'), name='tn')
+
+    def guardar(self, carpeta):
+        """
+        Guarda las celdas en Parquet y los diccionarios en '_panel.json'.
+        """
+        os.makedirs(carpeta, exist_ok=True)
+        pd.DataFrame({'codigo_producto': self.codigo_producto, 'codigo_cliente': self.codigo_cliente,
+                      'indice_periodo': self.indice_periodo, 'tn': self.tn}).to_parquet(
+            os.path.join(carpeta, NOMBRE_CELDAS_PANEL), engine='pyarrow', index=False)
+        indice = {'product_ids': self.product_ids.tolist(), 'customer_ids': self.customer_ids.tolist(),
+                  'periodos': self.periodos.tolist(), 'celdas': len(self.tn)}
+        with open(os.path.join(carpeta, NOMBRE_INDICE_PANEL), 'w', encoding='utf-8') as archivo_indice:
+            json.dump(indice, archivo_indice)
+        print(f"Panel guardado en '{carpeta}': {len(self.product_ids)} productos, {len(self.customer_ids)} clientes, "
+              f"{len(self.periodos)} periodos, {len(self.tn)} celdas con ventas.")
+
+    @classmethod
+    def cargar(cls, carpeta):
+        with open(os.path.join(carpeta, NOMBRE_INDICE_PANEL), encoding='utf-8') as archivo_indice:
+            indice = json.load(archivo_indice)
+        celdas = pd.read_parquet(os.path.join(carpeta, NOMBRE_CELDAS_PANEL), engine='pyarrow')
+        return cls(indice['product_ids'], indice['customer_ids'], indice['periodos'], celdas['codigo_producto'].to_numpy(),
+                   celdas['codigo_cliente'].to_numpy(), celdas['indice_periodo'].to_numpy(), celdas['tn'].to_numpy())
+
+
+def existe_panel(carpeta):
+    return os.path.exists(os.path.join(carpeta, NOMBRE_INDICE_PANEL))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Construye el panel disperso producto x cliente x periodo.')
+    parser.add_argument('--entrada', default=None, help='Archivo o dataset filtrado. Por defecto, la salida más reciente del filtrado.')
+    parser.add_argument('--salida', default=carpeta_panel)
+    args = parser.parse_args()
+
+    ruta_entrada = args.entrada or resolver_ruta_existente(ruta_entrada_sin_extension)
+    print(f"Cargando datos desde: {ruta_entrada}")
+    with medir_etapa('carga_panel') as etapa:
+        etapa.leido(ruta_entrada)
+        df = cargar_maestro(ruta_entrada, columnas=['periodo', 'product_id', 'customer_id', 'tn'])
+        etapa.salida(df)
+    with medir_etapa('panel_disperso') as etapa:
+        etapa.entrada(df)
+        panel = PanelDisperso.desde_dataframe(df)
+        etapa.salida(len(panel))
+    with medir_etapa('guardado') as etapa:
+        panel.guardar(args.salida)
+        etapa.escrito(args.salida)
@@ -0,0 +1,419 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import subprocess
+
+from io_maestro import ruta_con_formato
+from instrumentacion import medir_etapa, tamano_en_disco
+
+# Corre las etapas del pipeline (maestro -> filtrado -> cubo, y opcionalmente panel, tensor y
+# features) como un grafo y guarda las salidas de cada una en un caché por huella:
+#   python pipeline.py
+#   python pipeline.py --etapas cubo tensor features
+# La huella de una etapa combina el contenido de sus archivos de entrada, sus parámetros, el código
+# de su script (y de los módulos del repositorio que importa) y las huellas de las etapas de las que
+# depende. Si la salida que está en 'archivos_maestros/' ya corresponde a esa huella, la etapa no se
+# corre; si la huella está en el caché, se copia desde ahí; si no, se corre el script y se guarda.
+# Por ejemplo, si solo cambia productos_a_predecir.txt, se vuelven a correr el filtrado y las
+# etapas que dependen de él, y el maestro queda como está.
+
+# --- Configuración ---
+carpeta_cache = '.cache_pipeline'
+tamano_maximo_cache_gb = 10 # Al pasarlo, se borran las entradas usadas hace más tiempo
+modo_maestro = 'completo'   # 'completo', 'por_lotes' o 'particionado' (ver archivo_maestro.py)
+formato = 'parquet'
+ruta_lista_productos = 'data/productos_a_predecir.txt'
+etapas_por_defecto = ['cubo'] # Más las etapas cuyas salidas ya existen (ver `objetivos_por_defecto`)
+
+# Estado de las salidas que hay en 'archivos_maestros/': huella con la que se generó cada una.
+ruta_estado = 'archivos_maestros/_pipeline.json'
+
+NOMBRE_ENTRADA_CACHE = '_entrada.json'
+NOMBRE_HASHES = '_hashes.json'
+
+CARPETA_REPO = os.path.dirname(os.path.abspath(__file__))
+
+# Etapas: nombre -> etapas de las que depende (en orden de ejecución).
+DEPENDENCIAS = {
+    'maestro': [],
+    'filtrado': ['maestro'],
+    'cubo': ['filtrado'],
+    'panel': ['filtrado'],
+    'tensor': ['filtrado'],
+    'features': ['filtrado'],
+}
+
+
+def armar_etapas(modo_maestro=modo_maestro, formato=formato, ruta_lista=ruta_lista_productos, desde=None, hasta=None):
+    """
+    Script, argumentos, archivos de entrada y salidas de cada etapa con estos parámetros.
+
+    Returns:
+        dict: nombre -> {'script', 'argumentos', 'entradas', 'salidas', 'dependencias'}.
+    """
+    from archivo_maestro import filename1, filename2, pathdata, ruta_salida_sin_extension
+    from a_m_filtrado_prod_a_pred import nombre_salida_para_lista, pathdata_salida
+    from cubo_agregado import carpeta_cubo
+    from panel_disperso import carpeta_panel
+    from tensor_tn import carpeta_tensor
+    from features_pronostico import ruta_salida as ruta_features
+
+    # El modo particionado escribe una carpeta sin extensión y siempre en Parquet.
+    if modo_maestro == 'particionado':
+        ruta_maestro = ruta_salida_sin_extension
+        argumentos_maestro = ['--modo', modo_maestro]
+    else:
+        ruta_maestro = ruta_con_formato(ruta_salida_sin_extension, formato)
+        argumentos_maestro = ['--modo', modo_maestro, '--formato', formato]
+
+    ruta_filtrado = ruta_con_formato(os.path.join(pathdata_salida, nombre_salida_para_lista(ruta_lista)), formato)
+    argumentos_filtrado = ['--modo', 'completo', '--formato', formato, '--listas', ruta_lista, '--maestro', ruta_maestro]
+    if desde is not None:
+        argumentos_filtrado += ['--desde', str(desde)]
+    if hasta is not None:
+        argumentos_filtrado += ['--hasta', str(hasta)]
+
+    etapas = {
+        'maestro': ('archivo_maestro.py', argumentos_maestro,
+                    [os.path.join(pathdata, filename1), os.path.join(pathdata, filename2)], [ruta_maestro]),
+        'filtrado': ('a_m_filtrado_prod_a_pred.py', argumentos_filtrado, [ruta_lista], [ruta_filtrado]),
+        'cubo': ('cubo_agregado.py', ['--entrada', ruta_filtrado, '--salida', carpeta_cubo], [], [carpeta_cubo]),
+        'panel': ('panel_disperso.py', ['--entrada', ruta_filtrado, '--salida', carpeta_panel], [], [carpeta_panel]),
+        'tensor': ('tensor_tn.py', ['--entrada', ruta_filtrado, '--salida', carpeta_tensor], [], [carpeta_tensor]),
+        'features': ('features_pronostico.py', ['--entrada', ruta_filtrado, '--salida', ruta_features], [],
+                     [ruta_features]),
+    }
+    return {nombre: {'script': script, 'argumentos': argumentos, 'entradas': entradas, 'salidas': salidas,
+                     'dependencias': DEPENDENCIAS[nombre]}
+            for nombre, (script, argumentos, entradas, salidas) in etapas.items()}
+
+
+def etapas_necesarias(objetivos):
+    """
+    Las etapas `objetivos` y todas las que necesitan, en orden de ejecución.
+    """
+    necesarias = set()
+    pendientes = list(objetivos)
+    while pendientes:
+        nombre = pendientes.pop()
+        if nombre not in necesarias:
+            necesarias.add(nombre)
+            pendientes.extend(DEPENDENCIAS[nombre])
+    return [nombre for nombre in DEPENDENCIAS if nombre in necesarias]
+
+
+def objetivos_por_defecto(etapas):
+    """
+    `etapas_por_defecto` y las etapas cuyas salidas ya están en disco (panel, tensor,
+    features...): si no se actualizaran junto con el filtrado, quedarían armadas sobre
+    datos filtrados anteriores.
+    """
+    existentes = {nombre for nombre, etapa in etapas.items() if all(os.path.exists(ruta) for ruta in etapa['salidas'])}
+    return [nombre for nombre in DEPENDENCIAS if nombre in etapas_por_defecto or nombre in existentes]
+
+
+class HashesArchivos:
+    """
+    sha256 del contenido de los archivos de entrada, guardados en el caché por
+    (ruta, tamaño, fecha de modificación) para no volver a leer sell-in.txt entero
+    en cada corrida si no cambió.
+    """
+
+    def __init__(self, carpeta):
+        self.ruta = os.path.join(carpeta, NOMBRE_HASHES)
+        self.hashes = {}
+        if os.path.exists(self.ruta):
+            with open(self.ruta, encoding='utf-8') as archivo:
+                self.hashes = json.load(archivo)
+
+    def hash_archivo(self, ruta):
+        if not os.path.isfile(ruta):
+            raise FileNotFoundError(f"No se encontró el archivo de entrada '{ruta}'.")
+        estado = os.stat(ruta)
+        clave = os.path.abspath(ruta)
+        guardado = self.hashes.get(clave)
+        if guardado and guardado['tamano'] == estado.st_size and guardado['mtime_ns'] == estado.st_mtime_ns:
+            return guardado['sha256']
+        sha = hashlib.sha256()
+        with open(ruta, 'rb') as archivo:
+            for bloque in iter(lambda: archivo.read(16 * 1024 * 1024), b''):
+                sha.update(bloque)
+        self.hashes[clave] = {'tamano': estado.st_size, 'mtime_ns': estado.st_mtime_ns, 'sha256': sha.hexdigest()}
+        return self.hashes[clave]['sha256']
+
+    def guardar(self):
+        os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+        with open(self.ruta, 'w', encoding='utf-8') as archivo:
+            json.dump(self.hashes, archivo)
+
+
+def modulos_locales(script):
+    """
+    El script y los módulos del repositorio que importa (directa o indirectamente).
+    """
+    vistos = set()
+    pendientes = [script]
+    while pendientes:
+        nombre = pendientes.pop()
+        if nombre in vistos:
+            continue
+        vistos.add(nombre)
+        with open(os.path.join(CARPETA_REPO, nombre), encoding='utf-8') as archivo:
+            codigo = archivo.read()
+        for modulo in re.findall(r'^\s*(?:from|import)\s+(\w+)', codigo, flags=re.MULTILINE):
+            if os.path.exists(os.path.join(CARPETA_REPO, modulo + '.py')):
+                pendientes.append(modulo + '.py')
+    return sorted(vistos)
+
+
+def version_codigo(script):
+    """
+    Hash del código de una etapa (su script y los módulos locales que usa) y de las
+    versiones de las librerías que pueden cambiar sus salidas.
+    """
+    import numpy as np
+    import pandas as pd
+    import pyarrow
+
+    sha = hashlib.sha256()
+    for nombre in modulos_locales(script):
+        with open(os.path.join(CARPETA_REPO, nombre), 'rb') as archivo:
+            sha.update(nombre.encode('utf-8') + b'\0' + archivo.read() + b'\0')
+    sha.update(f"{platform.python_version()} {np.__version__} {pd.__version__} {pyarrow.__version__}".encode('utf-8'))
+    return sha.hexdigest()
+
+
+def huella_etapa(nombre, etapa, huellas, hashes):
+    """
+    Huella de una etapa: hash de su código, sus argumentos, el contenido de sus
+    archivos de entrada y las huellas de las etapas de las que depende.
+    """
+    contenido = {
+        'etapa': nombre,
+        'codigo': version_codigo(etapa['script']),
+        'argumentos': etapa['argumentos'],
+        'entradas': {ruta: hashes.hash_archivo(ruta) for ruta in etapa['entradas']},
+        'dependencias': {dependencia: huellas[dependencia] for dependencia in etapa['dependencias']},
+    }
+    return hashlib.sha256(json.dumps(contenido, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def marca_salida(ruta):
+    """
+    Tamaño y última modificación de una salida (de todos sus archivos si es una carpeta),
+    para detectar si alguien la cambió fuera del pipeline.
+    """
+    if os.path.isdir(ruta):
+        fechas = [os.stat(os.path.join(carpeta, nombre)).st_mtime_ns
+                  for carpeta, _, nombres in os.walk(ruta) for nombre in nombres]
+        return [tamano_en_disco(ruta), max(fechas, default=0)]
+    if os.path.isfile(ruta):
+        return [os.path.getsize(ruta), os.stat(ruta).st_mtime_ns]
+    return None
+
+
+def leer_estado():
+    if not os.path.exists(ruta_estado):
+        return {}
+    with open(ruta_estado, encoding='utf-8') as archivo:
+        return json.load(archivo)
+
+
+def guardar_estado(estado):
+    os.makedirs(os.path.dirname(ruta_estado), exist_ok=True)
+    with open(ruta_estado, 'w', encoding='utf-8') as archivo:
+        json.dump(estado, archivo, indent=2)
+
+
+def borrar_salida(ruta):
+    if os.path.isdir(ruta):
+        shutil.rmtree(ruta)
+    elif os.path.exists(ruta):
+        os.remove(ruta)
+
+
+def copiar_salida(origen, destino):
+    """
+    Copia un archivo o una carpeta. Las copias tienen fecha de modificación nueva, así
+    `resolver_ruta_existente` y los cachés del dashboard las ven como la salida más reciente.
+    """
+    borrar_salida(destino)
+    if os.path.dirname(destino):
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+    if os.path.isdir(origen):
+        shutil.copytree(origen, destino, copy_function=shutil.copy)
+    else:
+        shutil.copy(origen, destino)
+
+
+def carpeta_entrada(carpeta, nombre, huella):
+    return os.path.join(carpeta, nombre, huella)
+
+
+def guardar_en_cache(carpeta, nombre, huella, salidas):
+    """
+    Copia las salidas de una etapa al caché. Se copian a una carpeta temporal que se
+    renombra al final, así una entrada a medio copiar nunca se usa.
+    """
+    destino = carpeta_entrada(carpeta, nombre, huella)
+    temporal = destino + '.tmp'
+    borrar_salida(temporal)
+    os.makedirs(temporal)
+    for ruta in salidas:
+        copiar_salida(ruta, os.path.join(temporal, os.path.basename(ruta)))
+    entrada = {'etapa': nombre, 'huella': huella, 'salidas': salidas, 'bytes': tamano_en_disco(temporal),
+               'creada': time.time(), 'ultimo_uso': time.time()}
+    with open(os.path.join(temporal, NOMBRE_ENTRADA_CACHE), 'w', encoding='utf-8') as archivo:
+        json.dump(entrada, archivo, indent=2)
+    borrar_salida(destino)
+    os.replace(temporal, destino)
+
+
+def restaurar_de_cache(carpeta, nombre, huella):
+    """
+    Copia las salidas guardadas para esa huella a sus rutas. Devuelve False si no están en el caché.
+    """
+    origen = carpeta_entrada(carpeta, nombre, huella)
+    ruta_entrada = os.path.join(origen, NOMBRE_ENTRADA_CACHE)
+    if not os.path.exists(ruta_entrada):
+        return False
+    with open(ruta_entrada, encoding='utf-8') as archivo:
+        entrada = json.load(archivo)
+    for ruta in entrada['salidas']:
+        copiar_salida(os.path.join(origen, os.path.basename(ruta)), ruta)
+    entrada['ultimo_uso'] = time.time()
+    with open(ruta_entrada, 'w', encoding='utf-8') as archivo:
+        json.dump(entrada, archivo, indent=2)
+    return True
+
+
+def entradas_cache(carpeta):
+    """
+    Las entradas del caché, de la usada hace más tiempo a la más reciente.
+    """
+    entradas = []
+    if not os.path.isdir(carpeta):
+        return entradas
+    for nombre in os.listdir(carpeta):
+        carpeta_etapa = os.path.join(carpeta, nombre)
+        if not os.path.isdir(carpeta_etapa):
+            continue
+        for huella in os.listdir(carpeta_etapa):
+            ruta_entrada = os.path.join(carpeta_etapa, huella, NOMBRE_ENTRADA_CACHE)
+            if os.path.exists(ruta_entrada):
+                with open(ruta_entrada, encoding='utf-8') as archivo:
+                    entradas.append(json.load(archivo))
+    return sorted(entradas, key=lambda entrada: entrada['ultimo_uso'])
+
+
+def liberar_cache(carpeta, tamano_maximo_bytes, conservar=()):
+    """
+    Borra las entradas usadas hace más tiempo (LRU) hasta que el caché entre en
+    `tamano_maximo_bytes`. Las huellas de `conservar` (las de esta corrida) no se borran.
+
+    Returns:
+        list: (etapa, huella) de las entradas borradas.
+    """
+    entradas = entradas_cache(carpeta)
+    total = sum(entrada['bytes'] for entrada in entradas)
+    borradas = []
+    for entrada in entradas:
+        if total <= tamano_maximo_bytes:
+            break
+        if entrada['huella'] in conservar:
+            continue
+        borrar_salida(carpeta_entrada(carpeta, entrada['etapa'], entrada['huella']))
+        total -= entrada['bytes']
+        borradas.append((entrada['etapa'], entrada['huella']))
+    return borradas
+
+
+def ejecutar_script(etapa):
+    """
+    Corre el script de una etapa en un proceso nuevo, en el directorio actual.
+    """
+    comando = [sys.executable, os.path.join(CARPETA_REPO, etapa['script'])] + etapa['argumentos']
+    print(f"  $ {' '.join(comando[1:])}")
+    proceso = subprocess.run(comando)
+    if proceso.returncode != 0:
+        raise RuntimeError(f"'{etapa['script']}' terminó con código {proceso.returncode}.")
+    # Los scripts terminan con exit() (código 0) cuando falta una entrada: se revisa que estén las salidas.
+    faltantes = [ruta for ruta in etapa['salidas'] if not os.path.exists(ruta)]
+    if faltantes:
+        raise RuntimeError(f"'{etapa['script']}' no generó {faltantes}.")
+
+
+def correr_pipeline(etapas, objetivos, carpeta=carpeta_cache, tamano_maximo_bytes=None):
+    """
+    Corre las etapas necesarias para `objetivos`, salteando las que ya están al día
+    o están en el caché.
+
+    Returns:
+        dict: nombre -> 'al_dia', 'cache' o 'ejecutada'.
+    """
+    if tamano_maximo_bytes is None:
+        tamano_maximo_bytes = tamano_maximo_cache_gb * 1024 ** 3
+    hashes = HashesArchivos(carpeta)
+    estado = leer_estado()
+    huellas = {}
+    resultados = {}
+    for nombre in etapas_necesarias(objetivos):
+        etapa = etapas[nombre]
+        huellas[nombre] = huella = huella_etapa(nombre, etapa, huellas, hashes)
+        hashes.guardar()
+        with medir_etapa('pipeline_' + nombre, huella=huella[:12]) as medicion:
+            actual = estado.get(nombre, {})
+            al_dia = actual.get('huella') == huella and all(
+                actual.get('marcas', {}).get(ruta) == marca_salida(ruta) for ruta in etapa['salidas'])
+            if al_dia:
+                resultados[nombre] = 'al_dia'
+            elif restaurar_de_cache(carpeta, nombre, huella):
+                resultados[nombre] = 'cache'
+            else:
+                for ruta in etapa['salidas']:
+                    borrar_salida(ruta)
+                ejecutar_script(etapa)
+                guardar_en_cache(carpeta, nombre, huella, etapa['salidas'])
+                resultados[nombre] = 'ejecutada'
+            medicion.contexto['resultado'] = resultados[nombre]
+            for ruta in etapa['salidas']:
+                medicion.escrito(ruta)
+
+        estado[nombre] = {'huella': huella, 'marcas': {ruta: marca_salida(ruta) for ruta in etapa['salidas']}}
+        guardar_estado(estado)
+        print(f"Etapa '{nombre}' ({huella[:12]}): {resultados[nombre]}")
+
+    for etapa_borrada, huella_borrada in liberar_cache(carpeta, tamano_maximo_bytes, set(huellas.values())):
+        print(f"Caché: se borró '{etapa_borrada}' ({huella_borrada[:12]}).")
+    return resultados
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Corre el pipeline con caché de salidas por huella de cada etapa.')
+    parser.add_argument('--etapas', nargs='+', choices=list(DEPENDENCIAS), default=None,
+                        help='Etapas objetivo; también se corren las etapas de las que dependen. Por defecto, '
+                             'el cubo y las etapas cuyas salidas ya existen.')
+    parser.add_argument('--modo-maestro', choices=['completo', 'por_lotes', 'particionado'], default=modo_maestro)
+    parser.add_argument('--formato', choices=['parquet', 'csv'], default=formato)
+    parser.add_argument('--lista', default=ruta_lista_productos, help='Lista de product_id a predecir.')
+    parser.add_argument('--desde', type=int, default=None, help='Primer periodo (YYYYMM) del filtrado.')
+    parser.add_argument('--hasta', type=int, default=None, help='Último periodo (YYYYMM) del filtrado.')
+    parser.add_argument('--cache', default=carpeta_cache)
+    parser.add_argument('--tamano-maximo-cache-gb', type=float, default=tamano_maximo_cache_gb)
+    args = parser.parse_args()
+
+    etapas = armar_etapas(args.modo_maestro, args.formato, args.lista, args.desde, args.hasta)
+    objetivos = args.etapas or objetivos_por_defecto(etapas)
+    resultados = correr_pipeline(etapas, objetivos, args.cache, args.tamano_maximo_cache_gb * 1024 ** 3)
+    print(f"Pipeline terminado: {resultados}")
+    # Con --etapas, las salidas de otras etapas que están en disco pueden haber quedado viejas.
+    sin_revisar = [nombre for nombre in objetivos_por_defecto(etapas) if nombre not in resultados]
+    if sin_revisar:
+        print(f"Aviso: no se revisaron {sin_revisar}, que tienen salidas en disco; si cambió el filtrado "
+              f"pueden estar desactualizadas (el dashboard no usa un tensor ni un panel anteriores a los datos filtrados).")
@@ -0,0 +1,317 @@
+import numpy as np
+import pandas as pd
+import os
+import json
+import time
+import argparse
+
+from io_maestro import COLUMNAS_ATRIBUTOS_PRODUCTO, cargar_maestro, mes_a_periodo, periodo_a_mes, resolver_ruta_existente
+from instrumentacion import medir_etapa
+from datos_dashboard import agregar_para_grafico
+
+# --- Configuración ---
+# Entrada: el archivo maestro o la salida del filtrado (Parquet, dataset particionado o CSV).
+ruta_entrada_sin_extension = 'archivos_maestros/a_m_filtrado_prod_a_pred'
+carpeta_tensor = 'archivos_maestros/tensor_tn'
+
+NOMBRE_INDICE_TENSOR = '_tensor.json'
+EXTENSION_DATOS_TENSOR = '.f32'
+EXTENSION_PRODUCTOS_TENSOR = '.parquet'
+
+# Celdas por bloque al recorrer un recorte (64 MB en float32): acota la memoria de cada consulta.
+maximo_celdas_bloque = 16 * 1024 ** 2
+
+
+def construir_tensor(df, carpeta):
+    """
+    Guarda la suma de tn por (producto, cliente, periodo) como un arreglo denso en disco.
+
+    El arreglo es float32 de forma (productos, clientes, periodos), en orden C, así
+    que las ventas de un producto son un bloque contiguo. Las celdas sin ventas
+    quedan en NaN, así se distinguen de las que suman 0. Los diccionarios (IDs reales
+    -> código = posición), el calendario completo de periodos y los nombres de los
+    archivos de datos van en '_tensor.json'; los atributos de cada producto, en un
+    Parquet (en el orden de los códigos).
+
+    Cada construcción escribe archivos de datos nuevos (con una versión en el nombre)
+    y recién al final reemplaza '_tensor.json' con `os.replace`, que es atómico: quien
+    abre el tensor ve la versión anterior completa o la nueva completa, nunca una mezcla.
+    Después se borran los archivos de las versiones anteriores.
+
+    Args:
+        df (pd.DataFrame): Filas con 'periodo', 'product_id', 'customer_id', 'tn' y,
+                           si están, los atributos de producto.
+        carpeta (str): Carpeta del tensor.
+
+    Returns:
+        tuple: Forma del tensor.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    agregado = df.groupby(['product_id', 'customer_id', 'periodo'], as_index=False, observed=True)['tn'].sum()
+    codigo_producto, product_ids = pd.factorize(agregado['product_id'], sort=True)
+    codigo_cliente, customer_ids = pd.factorize(agregado['customer_id'], sort=True)
+    meses = periodo_a_mes(agregado['periodo'].to_numpy())
+    periodos = mes_a_periodo(np.arange(meses.min(), meses.max() + 1))
+    forma = (len(product_ids), len(customer_ids), len(periodos))
+
+    version = f'{time.time_ns():x}'
+    archivo_datos = f'tn_{version}{EXTENSION_DATOS_TENSOR}'
+    archivo_productos = f'productos_{version}{EXTENSION_PRODUCTOS_TENSOR}'
+
+    tensor = np.memmap(os.path.join(carpeta, archivo_datos), dtype=np.float32, mode='w+', shape=forma)
+    tensor.fill(np.nan)
+    # Cada (producto, cliente, periodo) aparece una sola vez después del groupby: se asigna directo.
+    posiciones = np.ravel_multi_index((codigo_producto, codigo_cliente, meses - meses.min()), forma)
+    tensor.reshape(-1)[posiciones] = agregado['tn'].to_numpy(dtype=np.float32)
+    tensor.flush()
+    del tensor
+
+    atributos = [col for col in COLUMNAS_ATRIBUTOS_PRODUCTO if col in df.columns]
+    productos = (df[['product_id'] + atributos].drop_duplicates('product_id').set_index('product_id')
+                 .reindex(np.asarray(product_ids)).reset_index())
+    productos.to_parquet(os.path.join(carpeta, archivo_productos), engine='pyarrow', index=False)
+
+    indice = {'forma': list(forma), 'dtype': 'float32', 'archivo_datos': archivo_datos,
+              'archivo_productos': archivo_productos, 'celdas': len(agregado),
+              'product_ids': np.asarray(product_ids).tolist(), 'customer_ids': np.asarray(customer_ids).tolist(),
+              'periodos': periodos.tolist()}
+    ruta_indice = os.path.join(carpeta, NOMBRE_INDICE_TENSOR)
+    with open(ruta_indice + '.tmp', 'w', encoding='utf-8') as archivo_indice:
+        json.dump(indice, archivo_indice)
+    os.replace(ruta_indice + '.tmp', ruta_indice)
+
+    # Los procesos que ya abrieron una versión anterior la siguen leyendo aunque se borre.
+    for nombre in os.listdir(carpeta):
+        if nombre.endswith((EXTENSION_DATOS_TENSOR, EXTENSION_PRODUCTOS_TENSOR)) and nombre not in (archivo_datos, archivo_productos):
+            os.remove(os.path.join(carpeta, nombre))
+    print(f"Tensor guardado en '{carpeta}': forma {forma}, {tamano_mb(forma):.1f} MB, "
+          f"{len(agregado)} celdas con ventas.")
+    return forma
+
+
+def tamano_mb(forma):
+    return int(np.prod(forma)) * 4 / 1024 ** 2
+
+
+def existe_tensor(carpeta):
+    return os.path.exists(os.path.join(carpeta, NOMBRE_INDICE_TENSOR))
+
+
+class Recorte:
+    """
+    Un recorte del tensor: códigos de productos y de clientes (None: todos) y el rango
+    [desde, hasta) de posiciones de periodo. Es lo que devuelve `IndiceTensor.posiciones`.
+    """
+
+    def __init__(self, productos, clientes, desde, hasta, forma):
+        self.productos = productos
+        self.clientes = clientes
+        self.desde = desde
+        self.hasta = hasta
+        self.forma = forma
+
+    def __len__(self):
+        # Cantidad de celdas del recorte, con o sin ventas (0 si quedó vacío).
+        cantidad_productos = self.forma[0] if self.productos is None else len(self.productos)
+        cantidad_clientes = self.forma[1] if self.clientes is None else len(self.clientes)
+        return cantidad_productos * cantidad_clientes * max(self.hasta - self.desde, 0)
+
+
+class IndiceTensor:
+    """
+    Consultas del dashboard sobre el tensor de tn abierto con np.memmap (solo lectura).
+
+    El tensor no se copia en memoria: el sistema operativo lo comparte entre todos los
+    procesos que lo abren (por ejemplo, varios procesos de Streamlit) a través de su
+    caché de páginas. Un rango de fechas es un rango del último eje y los filtros son
+    conjuntos de códigos de producto (por sus atributos) y de cliente, así que cada
+    consulta es un recorte del arreglo y una reducción, de a bloques de productos
+    (ver `bloques`): nunca se arma una tabla con todas las celdas del recorte.
+
+    Tiene la misma interfaz que `datos_dashboard.IndiceFiltros` (posiciones, opciones,
+    etiqueta, cantidad_filas, muestra, grafico, rango de fechas), con un `Recorte` en
+    lugar de posiciones de filas. Las selecciones y opciones son códigos: la posición en
+    los diccionarios de IDs o de valores de cada atributo.
+    """
+
+    def __init__(self, carpeta):
+        with open(os.path.join(carpeta, NOMBRE_INDICE_TENSOR), encoding='utf-8') as archivo_indice:
+            indice = json.load(archivo_indice)
+        if 'archivo_datos' not in indice:
+            raise ValueError(f"El tensor de '{carpeta}' tiene un formato anterior: hay que volver a generarlo con tensor_tn.py.")
+        self.forma = tuple(indice['forma'])
+        ruta_datos = os.path.join(carpeta, indice['archivo_datos'])
+        tamano_esperado = int(np.prod(self.forma)) * np.dtype(indice['dtype']).itemsize
+        if os.path.getsize(ruta_datos) != tamano_esperado:
+            raise ValueError(f"'{ruta_datos}' tiene {os.path.getsize(ruta_datos)} bytes y la forma {self.forma} "
+                             f"necesita {tamano_esperado}.")
+        self.tensor = np.memmap(ruta_datos, dtype=indice['dtype'], mode='r', shape=self.forma)
+        self.periodos = pd.to_datetime(pd.Series(indice['periodos']).astype(str), format='%Y%m').to_numpy()
+
+        # Por columna: código de cada producto (o None para los clientes) y valores.
+        self.valores = {'product_id': pd.Index(indice['product_ids']), 'customer_id': pd.Index(indice['customer_ids'])}
+        self.codigos_producto = {'product_id': np.arange(self.forma[0])}
+        productos = pd.read_parquet(os.path.join(carpeta, indice['archivo_productos']), engine='pyarrow')
+        for col in COLUMNAS_ATRIBUTOS_PRODUCTO:
+            if col in productos.columns:
+                codigos, valores = pd.factorize(productos[col], sort=True)
+                self.codigos_producto[col] = codigos
+                self.valores[col] = valores
+        self.columnas = ['periodo', 'customer_id', 'product_id', *[col for col in COLUMNAS_ATRIBUTOS_PRODUCTO
+                                                                 if col in self.codigos_producto]]
+
+    def rango_fechas(self, fecha_inicio=None, fecha_fin=None):
+        desde = 0 if fecha_inicio is None else np.searchsorted(
+            self.periodos, np.datetime64(pd.Timestamp(fecha_inicio)), side='left')
+        hasta = len(self.periodos) if fecha_fin is None else np.searchsorted(
+            self.periodos, np.datetime64(pd.Timestamp(fecha_fin)), side='right')
+        return int(desde), int(hasta)
+
+    def posiciones(self, fecha_inicio=None, fecha_fin=None, selecciones=None):
+        """
+        El recorte que corresponde al rango de fechas y a las selecciones (columna -> código).
+        """
+        productos = None
+        clientes = None
+        for col, codigo in (selecciones or {}).items():
+            if col == 'customer_id':
+                clientes = np.array([codigo]) if 0 <= codigo < self.forma[1] else np.empty(0, dtype=np.intp)
+                continue
+            mascara = self.codigos_producto[col] == codigo
+            productos = np.flatnonzero(mascara) if productos is None else productos[mascara[productos]]
+        return Recorte(productos, clientes, *self.rango_fechas(fecha_inicio, fecha_fin), self.forma)
+
+    def bloques(self, recorte):
+        """
+        Recorre el recorte de a bloques de productos de hasta `maximo_celdas_bloque` celdas.
+
+        Sin selección de productos, cada bloque es una vista del memmap (sin copiar).
+
+        Yields:
+            tuple: (códigos de los productos del bloque, arreglo productos x clientes x periodos).
+        """
+        if len(recorte) == 0:
+            return
+        productos = np.arange(self.forma[0]) if recorte.productos is None else recorte.productos
+        cantidad_clientes = self.forma[1] if recorte.clientes is None else len(recorte.clientes)
+        paso = max(1, maximo_celdas_bloque // (cantidad_clientes * (recorte.hasta - recorte.desde)))
+        for inicio in range(0, len(productos), paso):
+            codigos = productos[inicio:inicio + paso]
+            if recorte.productos is None:
+                bloque = self.tensor[codigos[0]:codigos[-1] + 1, :, recorte.desde:recorte.hasta]
+            else:
+                bloque = self.tensor[codigos, :, recorte.desde:recorte.hasta]
+            if recorte.clientes is not None:
+                bloque = bloque[:, recorte.clientes]
+            yield codigos, bloque
+
+    def opciones(self, col, recorte):
+        """
+        Códigos de `col` con alguna venta en el recorte, ordenados.
+        """
+        if col == 'customer_id':
+            activos = np.zeros(self.forma[1] if recorte.clientes is None else len(recorte.clientes), dtype=bool)
+            for _, bloque in self.bloques(recorte):
+                activos |= ~np.isnan(bloque).all(axis=(0, 2))
+            activos = np.flatnonzero(activos)
+            return (activos if recorte.clientes is None else recorte.clientes[activos]).tolist()
+        productos = [codigos[~np.isnan(bloque).all(axis=(1, 2))] for codigos, bloque in self.bloques(recorte)]
+        if not productos:
+            return []
+        codigos = self.codigos_producto[col][np.concatenate(productos)]
+        return np.unique(codigos[codigos >= 0]).tolist()
+
+    def etiqueta(self, col, codigo):
+        return self.valores[col][codigo]
+
+    def codigo(self, col, valor):
+        """
+        Código de `valor` en `col`, o -1 si no está (la inversa de `etiqueta`).
+        """
+        return int(self.valores[col].get_indexer([valor])[0])
+
+    def cantidad_filas(self, recorte):
+        """
+        Cantidad de celdas con ventas del recorte (las filas del nivel base del cubo).
+        """
+        return int(sum(np.count_nonzero(~np.isnan(bloque)) for _, bloque in self.bloques(recorte)))
+
+    def muestra(self, recorte, cantidad):
+        """
+        Las primeras `cantidad` celdas con ventas del recorte (por producto, cliente y periodo),
+        como filas con periodo, IDs, tn y atributos categóricos.
+        """
+        partes = []
+        faltan = cantidad
+        for codigos, bloque in self.bloques(recorte):
+            producto, cliente, periodo = np.nonzero(~np.isnan(bloque))
+            producto, cliente, periodo = producto[:faltan], cliente[:faltan], periodo[:faltan]
+            partes.append((codigos[producto], cliente if recorte.clientes is None else recorte.clientes[cliente],
+                           periodo, bloque[producto, cliente, periodo]))
+            faltan -= len(producto)
+            if faltan <= 0:
+                break
+        producto, cliente, periodo, tn = (np.concatenate(valores) for valores in zip(*partes)) if partes else \
+            (np.empty(0, dtype=np.intp),) * 3 + (np.empty(0, dtype=np.float32),)
+
+        filas = pd.DataFrame({'periodo': self.periodos[recorte.desde + periodo]})
+        filas['product_id'] = pd.Categorical.from_codes(producto, categories=self.valores['product_id'])
+        filas['customer_id'] = pd.Categorical.from_codes(cliente, categories=self.valores['customer_id'])
+        filas['tn'] = tn # Mismo orden de columnas que el nivel base del cubo
+        for col in self.columnas:
+            if col not in filas.columns:
+                filas[col] = pd.Categorical.from_codes(self.codigos_producto[col][producto], categories=self.valores[col])
+        return filas
+
+    def grafico(self, recorte, col_serie, max_series):
+        """
+        Datos del gráfico (ver `datos_dashboard.agregar_para_grafico`) calculados con
+        reducciones sobre el recorte.
+
+        Cada bloque se suma sobre el eje de clientes (o de productos, si las series son
+        clientes) y las sumas por producto se acumulan por el código de la serie, así que
+        solo se arma una tabla de series x periodos, no una fila por celda.
+        """
+        cantidad_periodos = max(recorte.hasta - recorte.desde, 0)
+        if col_serie == 'customer_id':
+            codigos_serie = np.arange(self.forma[1]) if recorte.clientes is None else recorte.clientes
+        else:
+            codigos_serie = np.arange(len(self.valores[col_serie]) + 1) - 1 # -1: atributo faltante
+        tn = np.zeros((len(codigos_serie), cantidad_periodos))
+        presentes = np.zeros((len(codigos_serie), cantidad_periodos), dtype=bool)
+        for codigos, bloque in self.bloques(recorte):
+            con_ventas = ~np.isnan(bloque)
+            if col_serie == 'customer_id':
+                tn += np.nansum(bloque, axis=0, dtype=np.float64)
+                presentes |= con_ventas.any(axis=0)
+            else:
+                # Códigos de la serie de cada producto del bloque, desplazados en 1 por el -1.
+                fila = self.codigos_producto[col_serie][codigos] + 1
+                np.add.at(tn, fila, np.nansum(bloque, axis=1, dtype=np.float64))
+                np.logical_or.at(presentes, fila, con_ventas.any(axis=1))
+
+        serie, periodo = np.nonzero(presentes)
+        celdas = pd.DataFrame({'periodo': self.periodos[recorte.desde + periodo],
+                               col_serie: pd.Categorical.from_codes(codigos_serie[serie],
+                                                                    categories=self.valores[col_serie]),
+                               'tn': tn[serie, periodo]})
+        return agregar_para_grafico(celdas, col_serie, max_series)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Construye el tensor de tn (producto x cliente x periodo) en disco.')
+    parser.add_argument('--entrada', default=None, help='Archivo o dataset. Por defecto, la salida más reciente del filtrado.')
+    parser.add_argument('--salida', default=carpeta_tensor)
+    args = parser.parse_args()
+
+    ruta_entrada = args.entrada or resolver_ruta_existente(ruta_entrada_sin_extension)
+    print(f"Cargando datos desde: {ruta_entrada}")
+    with medir_etapa('carga_tensor') as etapa:
+        etapa.leido(ruta_entrada)
+        df = cargar_maestro(ruta_entrada, columnas=['periodo', 'product_id', 'customer_id', 'tn',
+                                                    *COLUMNAS_ATRIBUTOS_PRODUCTO])
+        etapa.salida(df)
+    with medir_etapa('tensor_tn') as etapa:
+        etapa.entrada(df)
+        construir_tensor(df, args.salida)
+        etapa.escrito(args.salida)
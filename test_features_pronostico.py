@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from features_pronostico import construir_features
+from io_maestro import mes_a_periodo, periodo_a_mes
+
+PRIMER_MES = int(periodo_a_mes(201701))
+
+
+def panel_denso(tn_por_serie):
+    """
+    Panel con una fila por producto y mes desde 201701; `tn_por_serie` es (series, meses).
+    """
+    cantidad_series, cantidad_meses = tn_por_serie.shape
+    return pd.DataFrame({
+        'product_id': np.repeat(np.arange(cantidad_series), cantidad_meses) + 20001,
+        'periodo': np.tile(mes_a_periodo(PRIMER_MES + np.arange(cantidad_meses)), cantidad_series),
+        'tn': tn_por_serie.ravel(),
+    })
+
+
+def test_desvio_de_serie_chica_entre_series_grandes():
+    # 20.000 series de ~1000 tn y una de ~0,002 tn: el desvío de la chica no debe perderse.
+    rng = np.random.default_rng(0)
+    meses = 12
+    grandes = 1000 + rng.normal(0, 50, size=(20_000, meses))
+    chica = np.array([[0.002, 0.0025, 0.0015] * (meses // 3)])
+    df = panel_denso(np.vstack([grandes, chica]))
+
+    features = construir_features(df, nivel='producto', ventanas=[3])
+
+    serie_chica = features[features['product_id'] == df['product_id'].max()]
+    esperado = np.std([0.002, 0.0025, 0.0015], ddof=1) # 5e-4
+    np.testing.assert_allclose(serie_chica['tn_desvio_3'].to_numpy()[2:], esperado, rtol=1e-4)
+    np.testing.assert_allclose(serie_chica['tn_media_3'].to_numpy()[2:], 0.002, rtol=1e-4)
+
+
+def test_ventanas_como_rolling_de_pandas():
+    # Series con meses sin ventas (que cuentan como 0), comparadas contra pandas.
+    rng = np.random.default_rng(1)
+    tn = rng.random((30, 24)) * 10.0 ** rng.integers(-3, 4, size=(30, 1))
+    tn[rng.random(tn.shape) < 0.3] = 0
+    df = panel_denso(tn)
+    df = df[df['tn'] > 0]
+
+    features = construir_features(df, nivel='producto', ventanas=[3, 6])
+
+    for product_id, filas in features.groupby('product_id'):
+        serie = pd.Series(tn[product_id - 20001])
+        meses = periodo_a_mes(filas['periodo']) - PRIMER_MES
+        for ventana in (3, 6):
+            esperado = serie.rolling(ventana, min_periods=1)
+            np.testing.assert_allclose(filas[f'tn_media_{ventana}'], esperado.mean()[meses], rtol=1e-5, atol=1e-9)
+            np.testing.assert_allclose(filas[f'tn_desvio_{ventana}'], esperado.std()[meses], rtol=1e-5, atol=1e-9)